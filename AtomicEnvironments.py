@@ -2,6 +2,9 @@ import argparse
 import re
 import csv
 from src.Helper import Helper
+from src.EnvironmentFactory import EnvironmentFactory
+from src.CommandRunner import CommandRunner
+from src.SimulatedBackend import SimulatedBackend, RecordingBackend
 
 
 class AtomicEnvironments(object):
@@ -9,6 +12,7 @@ class AtomicEnvironments(object):
     def __init__(self) -> None:
         # System and execution properties
         self.log_file = "logs/AtomicEnvironments.log"
+        self.sweep_store_file = "logs/AtomicEnvironments.sweep"
         self.atomic_envs_path = "atomic_envs/"
         self.envs_container = None
         self.executor = None
@@ -57,15 +61,175 @@ class AtomicEnvironments(object):
                 type=str,
                 nargs=1)
 
+        # The episodes argument determines how long the agent is trained
+        self.parser.add_argument(
+                "--episodes",
+                help="Specify the number of training episodes",
+                type=int,
+                default=100)
+
+        # The max_timesteps argument limits the length of an episode
+        self.parser.add_argument(
+                "--max_timesteps",
+                help="Specify the maximum number of timesteps per episode",
+                type=int,
+                default=20)
+
+        # The simulated_episodes argument pre-trains the agent against a
+        # simulated backend before it is trained on the real system
+        self.parser.add_argument(
+                "--simulated_episodes",
+                help="Specify the number of episodes the agent is" +
+                " pre-trained against the simulated backend",
+                type=int,
+                default=0)
+
+        # The seed argument makes simulated episodes reproducible
+        self.parser.add_argument(
+                "--seed",
+                help="Specify the seed of the simulated backend",
+                type=int,
+                default=0)
+
+        # The outcomes argument supplies recorded outcomes which are
+        # replayed by the simulated backend
+        self.parser.add_argument(
+                "--outcomes",
+                help="Specify a file with outcomes recorded via --record" +
+                " to be replayed by the simulated backend",
+                type=str,
+                nargs=1)
+
+        # The record argument records the outcomes of real episodes
+        self.parser.add_argument(
+                "--record",
+                help="Specify a file the outcomes of all real commands and" +
+                " detection checks are appended to",
+                type=str,
+                nargs=1)
+
+        # The experience argument records all real transitions into an
+        # experience dataset for offline training
+        self.parser.add_argument(
+                "--experience",
+                help="Specify a directory the transitions of real episodes" +
+                " are recorded to",
+                type=str,
+                nargs=1)
+
+        # The offline argument trains the agent on a recorded experience
+        # dataset before any episode is run
+        self.parser.add_argument(
+                "--offline",
+                help="Specify an experience dataset directory the agent is" +
+                " trained on without executing any command",
+                type=str,
+                nargs=1)
+
+        # The async_rewards argument evaluates the reward conditions of
+        # real episodes in the background, so the agent keeps acting
+        # while detection is still pending. The agent learns from every
+        # episode once all its rewards are known
+        self.parser.add_argument(
+                "--async_rewards",
+                help="Specify the number of transitions whose rewards may" +
+                " be evaluated in the background at once, further actions" +
+                " wait for a free slot, 0 evaluates them synchronously. Agents are updated after every" +
+                " episode, with the evaluated rewards",
+                type=int,
+                default=0)
+
+        # The detection_log and detection_pattern arguments define a log
+        # file whose matching lines count as detection
+        self.parser.add_argument(
+                "--detection_log",
+                help="Specify a log file, an action counts as detected" +
+                " once a line matching --detection_pattern is appended",
+                type=str,
+                nargs=1)
+
+        self.parser.add_argument(
+                "--detection_pattern",
+                help="Specify the regular expression of detection lines",
+                type=str,
+                default="")
+
+        # The check_timeout argument limits how long the reward conditions
+        # of a single transition are evaluated
+        self.parser.add_argument(
+                "--check_timeout",
+                help="Specify the maximum number of seconds the reward" +
+                " conditions of a transition are evaluated",
+                type=float,
+                default=60.0)
+
+        # The sweep argument trains every configuration of a search space
+        # over agents and hyperparameters against the simulated backend
+        self.parser.add_argument(
+                "--sweep",
+                help="Specify a JSON search space with \"techniques\"," +
+                " \"agents\" and \"hyperparameters\" to train all of its" +
+                " configurations in parallel against the simulated backend",
+                type=str,
+                nargs=1)
+
+        self.parser.add_argument(
+                "--sweep_mode",
+                help="Specify whether every combination of the search space" +
+                " is trained or --sweep_samples random ones per technique",
+                choices=["grid", "random"],
+                default="grid")
+
+        self.parser.add_argument(
+                "--sweep_samples",
+                help="Specify the number of configurations per technique" +
+                " drawn by random search",
+                type=int,
+                default=10)
+
+        self.parser.add_argument(
+                "--sweep_workers",
+                help="Specify the number of worker processes, each pinned to" +
+                " one CPU, defaults to the number of available CPUs",
+                type=int,
+                default=0)
+
+        # The sweep_store argument sets the file all runs are recorded in,
+        # finished runs are skipped when a sweep is started again
+        self.parser.add_argument(
+                "--sweep_store",
+                help="Specify the JSONL file runs and episode rewards are" +
+                " recorded in, defaults to " + self.sweep_store_file,
+                type=str,
+                nargs=1)
+
+        # The sweep_window and sweep_grace arguments control early stopping
+        # of runs whose rolling reward falls behind the other runs
+        self.parser.add_argument(
+                "--sweep_window",
+                help="Specify the number of episodes the rolling reward is" +
+                " averaged over",
+                type=int,
+                default=10)
+
+        self.parser.add_argument(
+                "--sweep_grace",
+                help="Specify the number of episodes every run is trained" +
+                " before it may be stopped early",
+                type=int,
+                default=20)
+
     def parse_arguments(self) -> None:
         args = self.parser.parse_args()
         # Setup argument
         if (args.setup):
             self.setup_framework()
+        # Sweep argument
+        elif (args.sweep is not None):
+            self.run_sweep(args)
         # Install argument
         elif (args.agent is not None and args.technique is not None):
-            # TODO
-            pass
+            self.train_agent(args)
         else:
             self.parser.print_help()
 
@@ -73,6 +237,194 @@ class AtomicEnvironments(object):
         # TODO
         return
 
+    def create_environment(self, args, runner=None, **kwargs):
+        # Compiles the JSON specification of the technique once and
+        # instantiates its environment
+        try:
+            environment = EnvironmentFactory.create(self.atomic_envs_path,
+                                                    args.technique[0],
+                                                    runner=runner, **kwargs)
+        except ValueError as e:
+            self.parser.error(str(e))
+        return environment
+
+    @staticmethod
+    def create_agent_spec(agent, max_timesteps, hyperparameters=None) -> dict:
+        # Maps the agent argument to a Tensorforce agent specification.
+        # Hyperparameters override its defaults, size and depth belong to
+        # the network
+        memory = 10000 + max_timesteps
+        if agent == "classic":
+            spec = dict(agent="dqn", memory=memory, batch_size=16,
+                        network=dict(type="auto", size=16, depth=1, rnn=False))
+        elif agent == "dql":
+            spec = dict(agent="dqn", memory=memory, batch_size=32,
+                        network=dict(type="auto", size=64, depth=2, rnn=False))
+        elif agent == "ddql":
+            spec = dict(agent="double_dqn", memory=memory, batch_size=32,
+                        network=dict(type="auto", size=64, depth=2, rnn=False))
+        else:
+            # The random agent has no hyperparameters
+            return dict(agent="random")
+        for name, value in (hyperparameters or {}).items():
+            if name in ["size", "depth"]:
+                spec["network"][name] = value
+            else:
+                spec[name] = value
+        return spec
+
+    def create_backend(self, args, simulated):
+        if simulated:
+            outcomes = None
+            if args.outcomes is not None:
+                outcomes = SimulatedBackend.load_outcomes(args.outcomes[0])
+            return SimulatedBackend(args.seed, outcomes)
+        backend = CommandRunner()
+        if args.record is not None:
+            backend = RecordingBackend(backend, args.record[0])
+        return backend
+
+    def create_reward_options(self, args) -> dict:
+        # Detection source and reward pipeline of real episodes
+        from src.RewardPipeline import LogDetectionChecker, RewardPipeline
+        options = {}
+        if args.detection_log is not None:
+            options["detector"] = LogDetectionChecker(args.detection_log[0],
+                                                      args.detection_pattern)
+        if args.async_rewards > 0:
+            options["reward_pipeline"] = RewardPipeline(
+                max_pending=args.async_rewards, timeout=args.check_timeout)
+        return options
+
+    def run_sweep(self, args) -> None:
+        from src.HyperparameterSweep import HyperparameterSweep
+        store_file = self.sweep_store_file
+        if args.sweep_store is not None:
+            store_file = args.sweep_store[0]
+        outcomes = None
+        if args.outcomes is not None:
+            outcomes = SimulatedBackend.load_outcomes(args.outcomes[0])
+        try:
+            space = HyperparameterSweep.load_space(args.sweep[0])
+            if not space.get("techniques") and args.technique is not None:
+                space["techniques"] = args.technique
+            if args.agent is not None and not space.get("agents"):
+                space["agents"] = args.agent
+            sweep = HyperparameterSweep(self.atomic_envs_path, space, store_file,
+                                        self.create_agent_spec, args.sweep_mode,
+                                        args.sweep_samples, args.sweep_workers,
+                                        args.episodes, args.max_timesteps,
+                                        args.sweep_window, args.sweep_grace,
+                                        args.seed, outcomes)
+        except (OSError, ValueError) as e:
+            self.parser.error("could not load search space: " + str(e))
+        print("Training " + str(len(sweep.configs)) + " configurations on " +
+              str(sweep.workers) + " workers, runs are recorded in " + store_file)
+        rows = sweep.run()
+        for line in HyperparameterSweep.format_table(rows):
+            print(line)
+
+    def train_offline(self, args):
+        from tensorforce import Agent, Environment
+        from src.ExperienceDataset import ExperienceReader
+        try:
+            reader = ExperienceReader(args.offline[0])
+        except ValueError as e:
+            self.parser.error(str(e))
+        # The environment only supplies the state and action spaces
+        environment = Environment.create(
+            environment=self.create_environment(args, SimulatedBackend(args.seed)),
+            max_episode_timesteps=args.max_timesteps)
+        agent = Agent.create(agent=self.create_agent_spec(args.agent[0],
+                                                          args.max_timesteps),
+                             environment=environment)
+        for episode in reader.episodes():
+            agent.experience(states=episode["states"], actions=episode["actions"],
+                             terminal=episode["terminal"], reward=episode["reward"])
+            agent.update()
+        environment.close()
+        return agent
+
+    @staticmethod
+    def run_delayed_episodes(agent, environment, source, delayed, episodes,
+                             check_timeout) -> None:
+        # With asynchronous rewards execute only returns provisional ones.
+        # The agent acts without observing, every episode is handed to it
+        # once the rewards of all its transitions have been evaluated
+        import numpy as np
+        # Rewards arrive after the wait of their action and their checks
+        timeout = check_timeout
+        if source.wait_action in source.spec.action_names:
+            index = source.spec.action_names.index(source.wait_action)
+            timeout += max(float(value) for value in source.spec.action_values[index])
+        for _ in range(episodes):
+            states = environment.reset()
+            terminal = False
+            while not terminal:
+                actions = agent.act(states=states, independent=True, deterministic=False)
+                next_states, terminal, _ = environment.execute(actions=actions)
+                delayed.add(source.last_transition_id, states, actions)
+                states = next_states
+            episode = delayed.complete(timeout)
+            if not episode["terminal"]:
+                continue
+            actions = episode["actions"]
+            if isinstance(actions[0], dict):
+                actions = {name: np.asarray([action[name] for action in actions])
+                           for name in actions[0]}
+            agent.experience(states=np.asarray(episode["states"]), actions=actions,
+                             terminal=np.asarray(episode["terminal"]),
+                             reward=np.asarray(episode["reward"], dtype=np.float32))
+            agent.update()
+
+    def train_agent(self, args) -> None:
+        from tensorforce import Agent, Environment, Runner
+        from src.ExperienceDataset import ExperienceWriter
+        from src.RecordingEnvironment import RecordingEnvironment
+        # Recorded experience comes first, followed by simulated episodes,
+        # the agent is fine-tuned on the real system afterwards
+        agent = None
+        if args.offline is not None:
+            agent = self.train_offline(args)
+        phases = [(True, args.simulated_episodes), (False, args.episodes)]
+        for simulated, episodes in phases:
+            if episodes <= 0:
+                continue
+            backend = self.create_backend(args, simulated)
+            options = {} if simulated else self.create_reward_options(args)
+            atomic_environment = self.create_environment(args, backend, **options)
+            # Has to listen for rewards before the recording environment
+            delayed = None
+            if "reward_pipeline" in options:
+                from src.RewardPipeline import DelayedExperience
+                delayed = DelayedExperience(atomic_environment)
+            source = atomic_environment
+            if args.experience is not None and not simulated:
+                writer = ExperienceWriter(args.experience[0], args.technique[0])
+                atomic_environment = RecordingEnvironment(atomic_environment, writer)
+            environment = Environment.create(
+                environment=atomic_environment,
+                max_episode_timesteps=args.max_timesteps)
+            if agent is None:
+                agent = Agent.create(agent=self.create_agent_spec(args.agent[0],
+                                                                  args.max_timesteps),
+                                     environment=environment)
+            if delayed is not None:
+                self.run_delayed_episodes(agent, environment, source, delayed,
+                                          episodes, args.check_timeout)
+            else:
+                runner = Runner(agent=agent, environment=environment)
+                runner.run(num_episodes=episodes)
+                runner.close()
+            if "reward_pipeline" in options:
+                # Pending rewards are still credited to the recorded dataset
+                options["reward_pipeline"].drain(args.check_timeout)
+                options["reward_pipeline"].close()
+            environment.close()
+            backend.close()
+        if agent is not None:
+            agent.close()
+
 
 if __name__=='__main__':
     atomic_environments = AtomicEnvironments()
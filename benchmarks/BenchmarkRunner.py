@@ -0,0 +1,264 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+# Allows running the suite as a script from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class Benchmark(object):
+
+    def __init__(self, name, run, setup=None, teardown=None, number=1,
+                 repeat=5, unit="call") -> None:
+        """ Defines a single timed operation
+
+        Parameters
+        ----------
+        name :
+            unique name, used as key of the stored baseline
+        run :
+            callable receiving the value returned by setup, the timed part
+        setup :
+            optional callable preparing the input of run, not timed
+        teardown :
+            optional callable receiving the value returned by setup
+        number :
+            calls of run per repetition, the time per call is reported
+        repeat :
+            repetitions, each with a fresh setup
+        unit :
+            name of what a single call of run processes
+        """
+        self.name = name
+        self.run = run
+        self.setup = setup
+        self.teardown = teardown
+        self.number = number
+        self.repeat = repeat
+        self.unit = unit
+
+
+class SkipBenchmark(Exception):
+    # Raised by a setup if a benchmark cannot run on this host, e.g. if
+    # an executor or optional dependency is missing
+    pass
+
+
+class BenchmarkFailure(Exception):
+    # Raised by a setup if a benchmark measures the wrong thing, e.g. an
+    # entry point importing a dependency it should only import on demand
+    pass
+
+
+class BenchmarkRunner(object):
+
+    # Bump whenever the layout of the baselines or budgets file changes
+    baselines_version = 1
+    # Allowed slowdown of the median compared to the baseline
+    default_threshold = 1.5
+
+    def __init__(self, baselines_file, budgets_file=None) -> None:
+        """ Compares benchmarks against the medians measured on this host
+        and against the limits that hold on every host
+
+        Parameters
+        ----------
+        baselines_file :
+            file of the medians stored by --save_baseline, depends on the
+            host and is therefore not part of the repository
+        budgets_file :
+            optional file of the committed thresholds and budgets
+        """
+        self.baselines_file = baselines_file
+        self.baselines = BenchmarkRunner.load_benchmarks_file(baselines_file)
+        self.budgets = {}
+        if budgets_file is not None:
+            self.budgets = BenchmarkRunner.load_benchmarks_file(budgets_file)
+
+    @staticmethod
+    def load_benchmarks_file(path) -> dict:
+        try:
+            with open(path) as benchmarks_file:
+                content = json.load(benchmarks_file)
+        except (OSError, ValueError):
+            return {}
+        if content.get("version") != BenchmarkRunner.baselines_version:
+            return {}
+        return content.get("benchmarks", {})
+
+    def get_limits(self, name) -> dict:
+        # The local baseline overrides the committed threshold and budget
+        limits = dict(self.budgets.get(name, {}))
+        limits.update(self.baselines.get(name, {}))
+        return limits
+
+    def save_baselines(self, results) -> None:
+        # Keeps manually tuned thresholds of existing baselines
+        for name, result in results.items():
+            if result["skipped"] is not None or result["failed"] is not None:
+                continue
+            baseline = self.baselines.setdefault(name, {})
+            baseline["median"] = result["median"]
+        baselines = {"version": BenchmarkRunner.baselines_version,
+                     "benchmarks": dict(sorted(self.baselines.items()))}
+        temp_file = self.baselines_file + ".tmp"
+        with open(temp_file, "w") as baselines_file:
+            json.dump(baselines, baselines_file, indent=1)
+            baselines_file.write("\n")
+        os.replace(temp_file, self.baselines_file)
+
+    @staticmethod
+    def measure(benchmark) -> dict:
+        # Returns the seconds per call of every repetition
+        times = []
+        for _ in range(benchmark.repeat):
+            context = benchmark.setup() if benchmark.setup is not None else None
+            try:
+                start = time.perf_counter()
+                for _ in range(benchmark.number):
+                    benchmark.run(context)
+                times.append((time.perf_counter() - start) / benchmark.number)
+            finally:
+                if benchmark.teardown is not None:
+                    benchmark.teardown(context)
+        return {
+            "min": min(times),
+            "median": statistics.median(times),
+            "skipped": None,
+            "failed": None
+        }
+
+    def run(self, benchmarks) -> dict:
+        results = {}
+        for benchmark in benchmarks:
+            try:
+                results[benchmark.name] = BenchmarkRunner.measure(benchmark)
+            except SkipBenchmark as e:
+                results[benchmark.name] = {"min": None, "median": None,
+                                           "skipped": str(e), "failed": None}
+            except BenchmarkFailure as e:
+                results[benchmark.name] = {"min": None, "median": None,
+                                           "skipped": None, "failed": str(e)}
+            results[benchmark.name]["unit"] = benchmark.unit
+            self.print_result(benchmark.name, results[benchmark.name])
+        return results
+
+    def compare(self, results) -> list:
+        # Returns the names of all failed benchmarks and of all benchmarks
+        # slower than their threshold. A budget is an absolute limit of the
+        # median in seconds, it holds on every host and without a baseline
+        regressions = []
+        for name, result in results.items():
+            if result["failed"] is not None:
+                regressions.append(name)
+                continue
+            baseline = self.get_limits(name)
+            if result["skipped"] is not None:
+                continue
+            threshold = baseline.get("threshold", BenchmarkRunner.default_threshold)
+            if "median" in baseline and result["median"] > baseline["median"] * threshold:
+                regressions.append(name)
+            elif "budget" in baseline and result["median"] > baseline["budget"]:
+                regressions.append(name)
+        return regressions
+
+    def print_result(self, name, result) -> None:
+        if result["skipped"] is not None:
+            print("{:<44} skipped: {}".format(name, result["skipped"]))
+            return
+        if result["failed"] is not None:
+            print("{:<44} failed: {}".format(name, result["failed"]))
+            return
+        line = "{:<44} {:>12} / {:<8} {:>12.1f} {}/s".format(
+            name, BenchmarkRunner.format_seconds(result["median"]), result["unit"],
+            1.0 / result["median"] if result["median"] > 0 else float("inf"),
+            result["unit"])
+        baseline = self.get_limits(name)
+        if "budget" in baseline:
+            line += "  (budget {})".format(
+                BenchmarkRunner.format_seconds(baseline["budget"]))
+        if "median" in baseline:
+            line += "  ({:+.0%} vs. baseline)".format(
+                result["median"] / baseline["median"] - 1.0)
+        print(line)
+
+    @staticmethod
+    def format_seconds(seconds) -> str:
+        if seconds >= 1.0:
+            return "{:.3f} s".format(seconds)
+        if seconds >= 1e-3:
+            return "{:.3f} ms".format(seconds * 1e3)
+        return "{:.3f} us".format(seconds * 1e6)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="BenchmarkRunner.py")
+    parser.add_argument(
+            "--baselines",
+            help="Specify the file the baselines of this host are stored in",
+            type=str,
+            default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 "baselines.json"))
+    parser.add_argument(
+            "--budgets",
+            help="Specify the file the thresholds and budgets are stored in",
+            type=str,
+            default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 "budgets.json"))
+    parser.add_argument(
+            "--filter",
+            help="Only run benchmarks whose name contains this string",
+            type=str,
+            default="")
+    parser.add_argument(
+            "--save_baseline",
+            help="Store the measured medians as new baselines",
+            action='store_true')
+    parser.add_argument(
+            "--scale",
+            help="Scale the size of the synthetic inputs, e.g. 0.1 for a" +
+            " quick run",
+            type=float,
+            default=1.0)
+    args = parser.parse_args()
+
+    # The benchmarks use the framework's modules, which need src.Event
+    try:
+        from benchmarks.FrameworkBenchmarks import FrameworkBenchmarks
+    except ModuleNotFoundError as e:
+        if e.name is None or not e.name.startswith("src."):
+            raise
+        print("All benchmarks skipped: " + str(e))
+        return
+
+    runner = BenchmarkRunner(args.baselines, args.budgets)
+    suite = FrameworkBenchmarks(args.scale)
+    try:
+        benchmarks = [benchmark for benchmark in suite.create_benchmarks()
+                      if args.filter in benchmark.name]
+        results = runner.run(benchmarks)
+    finally:
+        suite.close()
+    if args.save_baseline:
+        runner.save_baselines(results)
+        return
+    if not runner.baselines:
+        print("No baselines for this host, run with --save_baseline first" +
+              " to compare more than the budgets")
+    # Baselines are only comparable for inputs of the same size
+    if args.scale != 1.0:
+        return
+    regressions = runner.compare(results)
+    if regressions:
+        print("Regressions: " + ", ".join(regressions))
+        sys.exit(1)
+
+
+if __name__=='__main__':
+    # The benchmarks import this module as benchmarks.BenchmarkRunner, its
+    # classes have to be the same as the ones used by main
+    from benchmarks.BenchmarkRunner import main
+    main()
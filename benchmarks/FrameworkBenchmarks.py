@@ -0,0 +1,390 @@
+from benchmarks.BenchmarkRunner import Benchmark, BenchmarkFailure, SkipBenchmark
+from src.Helper import Helper
+from src.Executor import Executor
+from src.TestContainer import TestContainer
+from src.CommandRunner import CommandRunner
+from src.ShellPool import ShellPool
+from src.HostFacts import HostFacts
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+import uuid
+import os
+
+
+class FrameworkBenchmarks(object):
+
+    # Modules the command line entry points must only import in the
+    # commands needing them
+    deferred_modules = ["yaml", "ctypes", "zipfile", "urllib.request", "http.server",
+                        "concurrent.futures", "sqlite3", "numpy", "tensorforce", "tensorflow"]
+
+    # Command line entry points by benchmark name
+    entry_points = {
+        "atomic_test": "src.AtomicTest",
+        "atomic_environments": "AtomicEnvironments"
+    }
+
+    # Entry points are imported from the repository root, as by their users
+    repository_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def __init__(self, scale=1.0) -> None:
+        # Synthetic inputs are created once in a temporary directory and
+        # shared by all benchmarks
+        self.scale = scale
+        self.directory = tempfile.mkdtemp(prefix="atomic_benchmarks_")
+        self.tests_path = None
+        self.shell_pool = None
+
+    def scaled(self, size) -> int:
+        return max(1, int(size * self.scale))
+
+    def close(self) -> None:
+        if self.shell_pool is not None:
+            self.shell_pool.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    @staticmethod
+    def create_technique_yaml(technique_id, num_atomics) -> str:
+        # Mimics the layout of the official Atomic Red Team definitions
+        lines = ["attack_technique: " + technique_id,
+                 "display_name: Synthetic technique " + technique_id,
+                 "atomic_tests:"]
+        for index in range(num_atomics):
+            lines += [
+                "- name: Synthetic atomic " + str(index),
+                "  auto_generated_guid: " + str(uuid.uuid4()),
+                "  description: |",
+                "    Writes a file and removes it again, used for benchmarks only.",
+                "  supported_platforms:",
+                "  - linux",
+                "  - macos",
+                "  input_arguments:",
+                "    output_file:",
+                "      description: File written by the atomic",
+                "      type: path",
+                "      default: /tmp/atomic_" + str(index),
+                "    content:",
+                "      description: Content of the file",
+                "      type: string",
+                "      default: benchmark",
+                "  dependency_executor_name: sh",
+                "  dependencies:",
+                "  - description: Directory must exist",
+                "    prereq_command: |",
+                "      test -d /tmp",
+                "    get_prereq_command: |",
+                "      mkdir -p /tmp",
+                "  executor:",
+                "    name: sh",
+                "    elevation_required: false",
+                "    command: |",
+                "      echo #{content} > #{output_file}",
+                "    cleanup_command: |",
+                "      rm -f #{output_file}"
+            ]
+        return "\n".join(lines) + "\n"
+
+    def create_tests_tree(self) -> str:
+        # Creates one directory per technique, as the official repository
+        if self.tests_path is not None:
+            return self.tests_path
+        self.tests_path = os.path.join(self.directory, "tests")
+        official = os.path.join(self.tests_path, "official")
+        for number in range(self.scaled(2000)):
+            technique_id = "T{:04d}".format(1000 + number % 9000)
+            if number >= 9000:
+                technique_id += ".{:03d}".format(number // 9000)
+            technique_path = os.path.join(official, technique_id)
+            os.makedirs(technique_path, exist_ok=True)
+            with open(os.path.join(technique_path, technique_id + ".yaml"), "w") as f:
+                f.write(FrameworkBenchmarks.create_technique_yaml(technique_id, 4))
+        os.makedirs(os.path.join(self.tests_path, "custom"), exist_ok=True)
+        return self.tests_path
+
+    def create_test_container(self, index_file) -> TestContainer:
+        tests_path = self.create_tests_tree()
+        return TestContainer(os.path.join(tests_path, "official"),
+                             os.path.join(tests_path, "custom"),
+                             os.path.join(self.directory, "excluded_tests.csv"),
+                             index_file=index_file)
+
+    def create_benchmarks(self) -> list:
+        benchmarks = [
+            self.create_yaml_benchmark(),
+            self.create_container_benchmark(cold=True),
+            self.create_container_benchmark(cold=False),
+            self.create_store_benchmark(),
+            self.create_result_record_benchmark(),
+            self.create_result_diff_benchmark(),
+            self.create_placeholder_benchmark(),
+            self.create_preconditions_benchmark()
+        ]
+        for executor in HostFacts.executor_binaries:
+            benchmarks.append(self.create_spawn_benchmark(executor))
+        benchmarks.append(self.create_pooled_spawn_benchmark("sh"))
+        for name, module in FrameworkBenchmarks.entry_points.items():
+            benchmarks.append(self.create_import_benchmark(name, module))
+        benchmarks.append(self.create_environment_benchmark())
+        benchmarks.append(self.create_vectorized_environment_benchmark("local"))
+        benchmarks.append(self.create_vectorized_environment_benchmark("multiprocessing"))
+        benchmarks.append(self.create_rollout_benchmark())
+        benchmarks.append(self.create_runner_benchmark())
+        return benchmarks
+
+    def create_yaml_benchmark(self) -> Benchmark:
+        filename = os.path.join(self.directory, "T9999.yaml")
+        with open(filename, "w") as f:
+            f.write(FrameworkBenchmarks.create_technique_yaml("T9999", self.scaled(50)))
+        return Benchmark("helper.load_yaml_technique",
+                         lambda _: Helper.load_yaml_technique(filename),
+                         number=5, unit="file")
+
+    def create_container_benchmark(self, cold) -> Benchmark:
+        # A cold container parses every file, a warm one reuses the index
+        index_file = os.path.join(self.directory, "index.json")
+
+        def setup():
+            self.create_tests_tree()
+            if cold and os.path.exists(index_file):
+                os.remove(index_file)
+            elif not cold and not os.path.exists(index_file):
+                self.create_test_container(index_file)
+
+        name = "test_container.init_" + ("cold" if cold else "warm")
+        return Benchmark(name, lambda _: self.create_test_container(index_file),
+                         setup=setup, repeat=3, unit="tree")
+
+    def create_store_benchmark(self) -> Benchmark:
+        # Queries the whole synthetic corpus on three secondary indexes
+        index_file = os.path.join(self.directory, "index.json")
+
+        def setup():
+            return self.create_test_container(index_file).create_atomic_store()
+
+        return Benchmark("atomic_store.query",
+                         lambda store: store.query(platform="linux", executor="sh",
+                                                   has_dependencies=True),
+                         setup=setup, number=20, repeat=3, unit="query")
+
+    def create_result_record_benchmark(self) -> Benchmark:
+        # Results are written in batches, every batch updates the coverage
+        def setup():
+            from src.ResultStore import ResultStore
+            result_store = ResultStore(os.path.join(self.directory, "record.results"))
+            result_store.start_run()
+            return result_store, iter(range(1 << 62))
+
+        def record(context):
+            result_store, counter = context
+            index = next(counter)
+            result_store.record({"technique": "T" + str(1000 + index % 500)},
+                                {"guid": str(index), "executed": True,
+                                 "success": index % 3 > 0, "exit_code": 0,
+                                 "duration": 0.1, "status": ""})
+
+        return Benchmark("result_store.record", record, setup=setup,
+                         teardown=lambda context: context[0].close(),
+                         number=self.scaled(10000), repeat=3, unit="result")
+
+    def create_result_diff_benchmark(self) -> Benchmark:
+        # Two runs of the same atomics on different hosts, a tenth of the
+        # atomics changed their outcome
+        def setup():
+            from src.ResultStore import ResultStore
+            result_store = ResultStore(os.path.join(self.directory, "diff.results"))
+            result_store.set_tactics({"T" + str(1000 + index): {"execution"}
+                                      for index in range(500)})
+            runs = []
+            for run in range(2):
+                runs.append(result_store.start_run(host="host" + str(run)))
+                for index in range(self.scaled(100000)):
+                    result_store.record({"technique": "T" + str(1000 + index % 500)},
+                                        {"guid": str(index), "executed": True,
+                                         "success": index % 10 != run, "exit_code": 0,
+                                         "duration": 0.1, "status": ""})
+                result_store.finish_run()
+            return result_store, runs
+
+        def diff(context):
+            result_store, runs = context
+            result_store.get_tactic_coverage(runs[1])
+            result_store.diff_techniques(*runs)
+            result_store.diff_atomics(*runs)
+
+        return Benchmark("result_store.diff", diff, setup=setup,
+                         teardown=lambda context: context[0].close(),
+                         repeat=3, unit="diff")
+
+    def create_placeholder_benchmark(self) -> Benchmark:
+        executor = Executor([])
+        input_args = {"argument_" + str(index): {"default": "value_" + str(index)}
+                      for index in range(self.scaled(200))}
+        command = "\n".join("echo #{" + name + "} > /dev/null"
+                            for name in input_args for _ in range(5))
+        return Benchmark("executor.replace_input_placeholders",
+                         lambda _: executor.replace_input_placeholders(command, input_args),
+                         number=20, unit="command")
+
+    def create_preconditions_benchmark(self) -> Benchmark:
+        excluded = [str(uuid.uuid4()) for _ in range(self.scaled(100000))]
+        executor = Executor(excluded)
+        platforms = [executor.preconditions["os"]]
+        atomic_executor = {"name": "sh", "elevation_required": False}
+        guid = str(uuid.uuid4())
+        return Benchmark("executor.check_preconditions",
+                         lambda _: executor.check_preconditions(guid, platforms,
+                                                                atomic_executor, "sh"),
+                         number=10000, unit="check")
+
+    def create_spawn_benchmark(self, executor) -> Benchmark:
+        runner = CommandRunner(timeout=30)
+
+        def setup():
+            if shutil.which(HostFacts.executor_binaries[executor]) is None:
+                raise SkipBenchmark(executor + " is not installed")
+
+        return Benchmark("command_runner.spawn_" + executor,
+                         lambda _: runner.run("echo benchmark", executor),
+                         setup=setup, number=20, unit="command")
+
+    def create_pooled_spawn_benchmark(self, executor) -> Benchmark:
+        # Compared to the spawn benchmark of the same executor it shows the
+        # saving of persistent interpreters
+        def setup():
+            if shutil.which(HostFacts.executor_binaries[executor]) is None:
+                raise SkipBenchmark(executor + " is not installed")
+            if self.shell_pool is None:
+                self.shell_pool = ShellPool(size=1, timeout=30)
+            # The first command of a worker includes its start
+            self.shell_pool.run("true", executor)
+
+        return Benchmark("shell_pool.run_" + executor,
+                         lambda _: self.shell_pool.run("echo benchmark", executor),
+                         setup=setup, number=200, unit="command")
+
+    def create_import_benchmark(self, name, module) -> Benchmark:
+        # A fresh interpreter importing an entry point is the start up
+        # time of short commands like --help or --list_techniques
+        code = "import json, sys\nimport " + module + "\nprint(json.dumps(" + \
+            "[name for name in " + repr(FrameworkBenchmarks.deferred_modules) + \
+            " if name in sys.modules]))"
+        command = [sys.executable, "-c", code]
+
+        def setup():
+            process = subprocess.run(command, cwd=FrameworkBenchmarks.repository_path,
+                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                     universal_newlines=True)
+            if process.returncode != 0:
+                lines = process.stderr.strip().splitlines()
+                raise SkipBenchmark(module + " cannot be imported: " +
+                                    (lines[-1] if lines else str(process.returncode)))
+            loaded = json.loads(process.stdout.strip().splitlines()[-1])
+            if loaded:
+                raise BenchmarkFailure(module + " imports " + ", ".join(loaded) +
+                                       " on start up")
+
+        return Benchmark("startup.import_" + name,
+                         lambda _: subprocess.run(command,
+                                                  cwd=FrameworkBenchmarks.repository_path,
+                                                  stdout=subprocess.DEVNULL,
+                                                  stderr=subprocess.DEVNULL),
+                         setup=setup, repeat=5, unit="start")
+
+    @staticmethod
+    def create_simulated_environment():
+        # Environments need tensorforce, which is an optional dependency of
+        # the benchmarks
+        try:
+            from src.EnvironmentFactory import EnvironmentFactory
+            from src.SimulatedBackend import SimulatedBackend
+            environment = EnvironmentFactory.create("atomic_envs/", "T1486",
+                                                    runner=SimulatedBackend(0))
+        except ImportError as e:
+            raise SkipBenchmark(str(e))
+        return environment
+
+    @staticmethod
+    def step(environment, actions) -> None:
+        _, terminal, _ = environment.execute(actions)
+        if terminal:
+            environment.reset()
+
+    def create_environment_benchmark(self) -> Benchmark:
+        def setup():
+            environment = FrameworkBenchmarks.create_simulated_environment()
+            environment.reset()
+            actions = {name: 0 for name in environment.actions()}
+            return environment, actions
+
+        return Benchmark("atomic_environment.step",
+                         lambda context: FrameworkBenchmarks.step(*context),
+                         setup=setup, teardown=lambda context: context[0].close(),
+                         number=self.scaled(1000), repeat=3, unit="step")
+
+    def create_vectorized_environment_benchmark(self, backend) -> Benchmark:
+        # A call steps all 8 instances, terminated ones are reset within it
+        def setup():
+            environment = FrameworkBenchmarks.create_simulated_environment()
+            from src.VectorizedEnvironment import VectorizedEnvironment
+            # All instances share the simulated backend
+            vectorized = VectorizedEnvironment(type(environment), 8, backend,
+                                               spec=environment.spec,
+                                               runner=environment.runner)
+            vectorized.reset()
+            actions = {name: [0] * 8 for name in environment.actions()}
+            environment.close()
+            return vectorized, actions
+
+        # The local backend keeps the name it was introduced with
+        suffix = "" if backend == "local" else "_" + backend
+        return Benchmark("vectorized_environment.step_8" + suffix,
+                         lambda context: context[0].execute(context[1]),
+                         setup=setup, teardown=lambda context: context[0].close(),
+                         number=self.scaled(100), repeat=3, unit="batch")
+
+    def create_rollout_benchmark(self) -> Benchmark:
+        # Same batch as vectorized_environment.step_8_multiprocessing, but
+        # states, actions and rewards pass through shared memory
+        def setup():
+            environment = FrameworkBenchmarks.create_simulated_environment()
+            from src.RolloutCollector import RolloutCollector
+            collector = RolloutCollector(type(environment), 8,
+                                         num_steps=self.scaled(100),
+                                         spec=environment.spec,
+                                         runner=environment.runner)
+            collector.reset()
+            import numpy as np
+            actions = {name: np.zeros(8, dtype=np.int64) for name in environment.actions()}
+            environment.close()
+            return collector, actions
+
+        return Benchmark("rollout_collector.step_8",
+                         lambda context: context[0].step(context[1]),
+                         setup=setup, teardown=lambda context: context[0].close(),
+                         number=self.scaled(100), repeat=3, unit="batch")
+
+    def create_runner_benchmark(self) -> Benchmark:
+        # The plain Tensorforce runner with a random agent, a call runs as
+        # many timesteps as a batch of the benchmarks above
+        def setup():
+            environment = FrameworkBenchmarks.create_simulated_environment()
+            try:
+                from tensorforce import Environment, Runner
+            except ImportError as e:
+                environment.close()
+                raise SkipBenchmark(str(e))
+            # Runs as AtomicEnvironments.py trains, episodes are limited
+            environment = Environment.create(environment=environment,
+                                             max_episode_timesteps=100)
+            return Runner(agent=dict(agent="random"), environment=environment)
+
+        def teardown(runner):
+            runner.close()
+
+        return Benchmark("tensorforce_runner.step_8",
+                         lambda runner: runner.run(num_timesteps=8, use_tqdm=False),
+                         setup=setup, teardown=teardown,
+                         number=self.scaled(100), repeat=3, unit="batch")
@@ -74,4 +74,42 @@ class AbstractEnvironment(Environment, metaclass=abc.ABCMeta):
         """
         super().close()
 
+    @classmethod
+    def vectorized(cls, num_environments, backend="local", **kwargs):
+        """ Creates a batch of instances of this environment
 
+        Parameters
+        ----------
+        num_environments :
+            number of instances stepped by every execute call
+        backend :
+            'local' or 'multiprocessing', see VectorizedEnvironment
+
+        Returns
+        ----------
+        environment :
+            VectorizedEnvironment returning stacked states, terminals and
+            rewards
+        """
+        from src.VectorizedEnvironment import VectorizedEnvironment
+        return VectorizedEnvironment(cls, num_environments, backend, **kwargs)
+
+    @classmethod
+    def rollouts(cls, num_environments, num_steps=1, **kwargs):
+        """ Creates worker processes stepping instances of this environment,
+        with states, rewards and terminals in shared memory
+
+        Parameters
+        ----------
+        num_environments :
+            number of instances stepped by every step call
+        num_steps :
+            steps of all instances returned by every collect call
+
+        Returns
+        ----------
+        collector :
+            RolloutCollector returning views of the shared buffers
+        """
+        from src.RolloutCollector import RolloutCollector
+        return RolloutCollector(cls, num_environments, num_steps, **kwargs)
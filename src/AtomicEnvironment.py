@@ -0,0 +1,169 @@
+from src.AbstractEnvironment import AbstractEnvironment
+from src.CommandRunner import CommandRunner
+import os
+import threading
+
+
+class AtomicEnvironment(AbstractEnvironment):
+
+    # Name of the action determining how long to wait before the outcome
+    # of an action is evaluated
+    wait_action = "wait_time"
+
+    def __init__(self, spec, runner=None, detector=None, reward_pipeline=None):
+        """ Environment executing the command of a compiled specification
+
+        Parameters
+        ----------
+        spec :
+            EnvironmentSpec compiled by the EnvironmentFactory
+        runner :
+            ExecutionBackend running commands, defaults to a CommandRunner
+        detector :
+            optional callable returning whether the last action has been
+            detected, without one the backend decides about detection. If
+            it has a mark method, e.g. a LogDetectionChecker, it is called
+            before every action and check(mark, timeout) is used in the
+            reward pipeline
+        reward_pipeline :
+            optional RewardPipeline evaluating rewards asynchronously,
+            execute then returns a provisional reward of 0 and the state
+            and terminal flag of the most recently evaluated transition
+        """
+        super().__init__()
+        self.spec = spec
+        self.runner = runner if runner is not None else CommandRunner()
+        self.detector = detector
+        # The statuses are the reward conditions followed by 'else', the
+        # state is the index of the last observed status
+        self.num_statuses = len(spec.rewards) + 1
+        self.default_status = len(spec.rewards)
+        self.status = self.default_status
+        self.last_command = None
+        self.last_waited = 0
+        self.spec_directory = os.path.dirname(spec.spec_path)
+        self.reward_pipeline = reward_pipeline
+        self.reward_listeners = []
+        self.episode = 0
+        self.transitions = 0
+        self.last_transition_id = None
+        self.transition_episodes = {}
+        self.lock = threading.Lock()
+
+    def states(self):
+        return dict(type='int', shape=(), num_values=self.num_statuses)
+
+    def actions(self):
+        return {name: dict(type='int', num_values=len(values))
+                for name, values in zip(self.spec.action_names, self.spec.action_values)}
+
+    def reset(self):
+        with self.lock:
+            self.episode += 1
+            self.status = self.default_status
+            return self.status
+
+    def execute(self, actions):
+        values = self.decode_actions(actions)
+        command, _ = self.spec.command_template.render(
+            {name: str(value) for name, value in values.items()})
+        mark = None
+        if hasattr(self.detector, "mark"):
+            mark = self.detector.mark()
+        self.runner.run(command, self.spec.executor_name)
+        self.last_command = command
+        self.last_waited = values.get(self.wait_action, 0)
+        if self.reward_pipeline is not None:
+            return self.submit_transition(command, self.last_waited, mark)
+        if self.last_waited:
+            self.wait(self.last_waited)
+        self.status = self.determine_status()
+        reward = self.calc_reward(self.status)
+        # Episodes end as soon as one of the reward conditions is met
+        terminal = self.status != self.default_status
+        return self.status, terminal, reward
+
+    def decode_actions(self, actions) -> dict:
+        # Maps the integer encoded actions to their values
+        if not isinstance(actions, dict):
+            actions = {self.spec.action_names[0]: actions}
+        return {name: values[int(actions[name])]
+                for name, values in zip(self.spec.action_names, self.spec.action_values)}
+
+    def wait(self, seconds) -> None:
+        # Simulated backends advance a virtual clock instead of sleeping
+        self.runner.wait(seconds)
+
+    def submit_transition(self, command, waited, mark):
+        # Evaluates the reward conditions in the background and returns the
+        # provisional observation
+        with self.lock:
+            transition_id = self.transitions
+            self.transitions += 1
+            self.transition_episodes[transition_id] = self.episode
+            self.last_transition_id = transition_id
+            status = self.status
+        checks = []
+        for index, (condition, reward) in enumerate(self.spec.rewards):
+            checks.append((index, reward, self.create_check(condition, command,
+                                                            waited, mark)))
+        self.reward_pipeline.submit(transition_id, checks,
+                                    (self.default_status, self.spec.default_reward),
+                                    waited, self.credit_reward, self.runner.wait)
+        # Rewards are delivered through credit_reward, the results kept for
+        # callers of collect would otherwise pile up until the pipeline is
+        # drained
+        self.reward_pipeline.collect()
+        return status, status != self.default_status, 0.0
+
+    def create_check(self, condition, command, waited, mark):
+        kind, argument = condition
+        if kind == "passes":
+            return lambda: self.passes_script(argument, command, waited)
+        if mark is not None:
+            timeout = self.reward_pipeline.timeout
+            return lambda: self.detector.check(mark, timeout)
+        if self.detector is not None:
+            return lambda: bool(self.detector())
+        return lambda: self.runner.detected(command, waited) is True
+
+    def add_reward_listener(self, listener) -> None:
+        # Listeners receive transition_id, status and reward of every
+        # asynchronously evaluated transition
+        self.reward_listeners.append(listener)
+
+    def credit_reward(self, transition_id, status, reward) -> None:
+        with self.lock:
+            # Late results of a previous episode do not change the state
+            if self.transition_episodes.pop(transition_id, None) == self.episode:
+                if status != self.default_status:
+                    self.status = status
+        for listener in self.reward_listeners:
+            listener(transition_id, status, reward)
+
+    def determine_status(self) -> int:
+        # Returns the index of the first reward condition that is met
+        for index, (condition, _) in enumerate(self.spec.rewards):
+            kind, argument = condition
+            if kind == "passes" and self.passes_script(argument, self.last_command,
+                                                       self.last_waited):
+                return index
+            if kind == "detected" and self.is_detected():
+                return index
+        return self.default_status
+
+    def passes_script(self, script, command, waited) -> bool:
+        # Check scripts are located next to the specification, the backend
+        # decides whether they pass, simulated backends without running them
+        path = os.path.join(self.spec_directory, script)
+        return bool(self.runner.passes(path, command, waited))
+
+    def is_detected(self) -> bool:
+        if self.detector is not None:
+            return bool(self.detector())
+        return self.runner.detected(self.last_command, self.last_waited) is True
+
+    def calc_reward(self, status):
+        if status == self.default_status:
+            return self.spec.default_reward
+        return self.spec.rewards[status][1]
@@ -0,0 +1,193 @@
+from src.SelectionEngine import SelectionEngine
+import sys
+import typing
+
+
+class AtomicRecord(object):
+
+    # Records are created for every atomic of the corpus, slots keep them
+    # far smaller than the nested dicts loaded from YAML
+    __slots__ = ["technique", "index", "guid", "name", "platforms", "executor",
+                 "elevation_required", "has_dependencies"]
+
+    def __init__(self, technique, index, guid, name, platforms, executor,
+                 elevation_required, has_dependencies) -> None:
+        self.technique = technique
+        self.index = index
+        self.guid = guid
+        self.name = name
+        self.platforms = platforms
+        self.executor = executor
+        self.elevation_required = elevation_required
+        self.has_dependencies = has_dependencies
+
+
+class AtomicStore(object):
+
+    # Fields with a secondary index, queries on them never scan the store
+    fields = ["technique", "platform", "executor", "tactic", "elevation_required",
+              "has_dependencies"]
+
+    def __init__(self, tactics=None) -> None:
+        """ Holds compact records of all atomics with secondary indexes
+
+        Parameters
+        ----------
+        tactics :
+            optional dict mapping technique IDs to sets of tactics, as
+            loaded by SelectionEngine.load_tactics_from_csv
+        """
+        self.tactics = tactics if tactics is not None else {}
+        self.records = []
+        self.guids = {}
+        # Every index maps a value to the positions of its records, in
+        # ascending order
+        self.indexes = {field: {} for field in AtomicStore.fields}
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    @staticmethod
+    def from_index(index, tactics=None) -> "AtomicStore":
+        """ Builds a store from the file entries of a TestContainer index
+
+        Atomics of a technique defined in several files are numbered in
+        file order, as TestContainer.get_technique merges them
+        """
+        store = AtomicStore(tactics)
+        counts = {}
+        for entry in index.values():
+            technique_id = entry["technique"]
+            for guid, name, platforms, executor, elevation_required, \
+                    has_dependencies in entry.get("atomics", []):
+                position = counts.get(technique_id, 0)
+                counts[technique_id] = position + 1
+                store.add(technique_id, position, guid, name, platforms, executor,
+                          elevation_required, has_dependencies)
+        return store
+
+    def add(self, technique, index, guid, name, platforms, executor,
+            elevation_required, has_dependencies) -> AtomicRecord:
+        # Repeated values like platforms and executors are interned, so all
+        # records share a single copy of them
+        technique = sys.intern(technique)
+        platforms = tuple(sys.intern(platform.lower()) for platform in platforms)
+        executor = sys.intern(executor.lower()) if executor else ""
+        record = AtomicRecord(technique, index, guid, name, platforms, executor,
+                              bool(elevation_required), bool(has_dependencies))
+        position = len(self.records)
+        self.records.append(record)
+        if guid:
+            self.guids[guid.lower()] = position
+        values = {
+            "technique": [technique],
+            "platform": platforms,
+            "executor": [executor],
+            "tactic": self.tactics.get(technique, ()),
+            "elevation_required": [record.elevation_required],
+            "has_dependencies": [record.has_dependencies]
+        }
+        for field, field_values in values.items():
+            for value in field_values:
+                self.indexes[field].setdefault(value, []).append(position)
+        return record
+
+    def get(self, guid) -> AtomicRecord:
+        position = self.guids.get(guid.lower())
+        return self.records[position] if position is not None else None
+
+    @staticmethod
+    def parse_query(argument) -> dict:
+        """ Parses "field=value" pairs delimited by ",", e.g.
+        "platform=linux,executor=bash,has_dependencies=false"
+
+        Techniques may end with "*" to match all sub-techniques
+        """
+        criteria = {}
+        for token in argument.split(","):
+            if not token.strip():
+                continue
+            if "=" not in token:
+                raise ValueError("Query criteria have to be field=value: " + token.strip())
+            field, value = (part.strip() for part in token.split("=", 1))
+            field = field.lower()
+            if field not in AtomicStore.fields:
+                raise ValueError("Unknown query field: " + field)
+            criteria[field] = value
+        return criteria
+
+    @staticmethod
+    def normalize(field, value):
+        # Converts a queried value to the representation in the index
+        if field in ["elevation_required", "has_dependencies"]:
+            if isinstance(value, bool):
+                return value
+            if str(value).lower() in ["true", "yes", "1"]:
+                return True
+            if str(value).lower() in ["false", "no", "0"]:
+                return False
+            raise ValueError(field + " has to be true or false: " + str(value))
+        if field == "tactic":
+            return SelectionEngine.normalize_tactic(value)
+        if field in ["platform", "executor"]:
+            return value.lower()
+        return value
+
+    def lookup(self, field, value) -> list:
+        # Positions of the records matching a single criterion
+        value = AtomicStore.normalize(field, value)
+        index = self.indexes[field]
+        if field == "technique" and value.endswith("*"):
+            # Only the distinct technique IDs are scanned, not the records
+            positions = []
+            for technique, technique_positions in index.items():
+                if technique.startswith(value[:-1]):
+                    positions += technique_positions
+            return sorted(positions)
+        return index.get(value, [])
+
+    def query(self, criteria=None, **kwargs) -> typing.List[AtomicRecord]:
+        """ Returns all records matching every criterion, in store order
+
+        Parameters
+        ----------
+        criteria :
+            optional dict of field and value, as returned by parse_query,
+            further criteria can be given as keyword arguments
+        """
+        criteria = dict(criteria or {}, **kwargs)
+        if not criteria:
+            return list(self.records)
+        for field in criteria:
+            if field not in AtomicStore.fields:
+                raise ValueError("Unknown query field: " + field)
+        # Intersecting starts with the smallest candidate list, the others
+        # are only probed as sets
+        candidates = sorted((self.lookup(field, value) for field, value in criteria.items()),
+                            key=len)
+        positions = candidates[0]
+        for other in candidates[1:]:
+            if not positions:
+                break
+            other = set(other)
+            positions = [position for position in positions if position in other]
+        return [self.records[position] for position in positions]
+
+    def count_by(self, field, records=None) -> dict:
+        """ Counts records per value of an indexed field, e.g. atomics per
+        platform, over all records or the result of a query
+        """
+        if records is None:
+            return {value: len(positions)
+                    for value, positions in self.indexes[field].items()}
+        counts = {}
+        for record in records:
+            if field == "platform":
+                values = record.platforms
+            elif field == "tactic":
+                values = self.tactics.get(record.technique, ())
+            else:
+                values = [getattr(record, field)]
+            for value in values:
+                counts[value] = counts.get(value, 0) + 1
+        return counts
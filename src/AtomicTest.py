@@ -3,7 +3,19 @@ from src.Event import Event
 from src.Logger import Logger
 from src.Executor import Executor
 from src.TestContainer import TestContainer
+from src.ExecutionPlan import ExecutionPlan
+from src.PrereqCache import PrereqCache
+from src.CommandRunner import CommandRunner
+from src.RunJournal import RunJournal
+from src.Telemetry import Telemetry, JsonlSink, HttpSink
+from src.CleanupManager import CleanupManager
+from src.SelectionEngine import SelectionEngine
+from src.AtomicStore import AtomicStore
+from src.HostFacts import HostFacts
 import argparse
+import typing
+import json
+import os
 import re
 import csv
 
@@ -13,10 +25,19 @@ class AtomicTest(object):
     def __init__(self) -> None:
         # System and execution properties
         self.log_file = "logs/AtomicTest.log"
+        self.journal_file = "logs/AtomicTest.journal"
+        self.cleanup_journal_file = "logs/AtomicTest.cleanup"
+        self.results_file = "logs/AtomicTest.results"
+        # Atomics listed per kind of change when comparing runs
+        self.report_limit = 50
         self.exclude_tests_file = "config/excluded_tests.csv"
         self.mitre_coverage_tests_file = "config/mitre_coverage.csv"
         self.official_tests_path = "tests/official/"
         self.custom_tests_path = "tests/custom/"
+        self.tests_index_file = "tests/.index.json"
+        self.prereq_cache_file = "tests/.prereq_cache.json"
+        self.host_facts_file = "tests/.host_facts.json"
+        self.atomics_archive_file = "tests/.atomics.zip"
         self.atomic_test_official_repo = "https://github.com/redcanaryco/atomic-red-team/"
         self.test_container = None
         self.executor = None
@@ -45,6 +66,17 @@ class AtomicTest(object):
                 help="Installs/updates the official Atomic Tests",
                 action='store_true')
 
+        # Sync argument updates the official Atomic Red Team test suite
+        # incrementally, only changed files are written
+        self.parser.add_argument(
+                "--sync",
+                help="Incrementally updates the official Atomic Tests from" +
+                " the official repository, a zip archive URL, a local zip" +
+                " archive or a local mirror of the repository",
+                type=str,
+                nargs="?",
+                const="")
+
         # Runtype argument to determine if provided test list CSV 
         # will include or exclude tests, or if tests are provided 
         # via command line parameter
@@ -60,6 +92,25 @@ class AtomicTest(object):
                 choices=["manual", "exclude", "include"],
                 nargs=1)
 
+        # Select and exclude arguments supply selection rules, i.e.
+        # technique IDs, wildcards like T1059.*, GUIDs or field rules like
+        # platform:windows, executor:powershell and tactic:execution
+        self.parser.add_argument(
+                "--select",
+                help="Specify ',' delimited rules or a CSV file with a rule" +
+                " in every line, only matching atomics are run. Rules are" +
+                " technique IDs, wildcards like T1059.*, GUIDs or one of" +
+                " platform:, executor:, tactic: followed by a value",
+                type=str,
+                action="append")
+
+        self.parser.add_argument(
+                "--exclude",
+                help="Specify ',' delimited rules or a CSV file with a rule" +
+                " in every line, matching atomics are never run",
+                type=str,
+                action="append")
+
         # Test_list argument supplies either a path to a CSV file 
         # with techniques to be handeled according to runtype, or 
         # a string with "," delimited test techniques, if runtype 
@@ -70,6 +121,305 @@ class AtomicTest(object):
                 ", or a CSV file containing techniques in every line",
                 type=str,
                 nargs=1)
+
+        # Workers argument determines how many atomics may be executed
+        # concurrently during a run
+        self.parser.add_argument(
+                "--workers",
+                help="Specify the number of atomics executed concurrently",
+                type=int,
+                default=1)
+
+        # Affinity argument determines which atomics have to be executed
+        # one after another, because they mutate shared state
+        self.parser.add_argument(
+                "--affinity",
+                help="Specify how atomics are serialized when running with" +
+                " multiple workers where 'technique' serializes the atomics" +
+                " of a technique, 'none' runs all atomics independently, or" +
+                " a CSV file with 'technique ID or GUID,group' in every line" +
+                " serializes all atomics of a group",
+                type=str,
+                default="technique")
+
+        # Dry_run argument compiles the execution plan without running
+        # any atomic
+        self.parser.add_argument(
+                "--dry_run",
+                help="Only compile and print the execution plan",
+                action='store_true')
+
+        # Plan_file argument stores the compiled execution plan as JSON
+        self.parser.add_argument(
+                "--plan_file",
+                help="Specify a JSON file the execution plan is saved to",
+                type=str,
+                nargs=1)
+
+        # Compare_plans argument shows the differences of two saved
+        # execution plans, e.g. compiled on different hosts
+        self.parser.add_argument(
+                "--compare_plans",
+                help="Specify two execution plan JSON files to compare",
+                type=str,
+                nargs=2)
+
+        # Prereq_cache_ttl argument determines how long satisfied
+        # prerequisites are trusted across runs, 0 checks them every run
+        self.parser.add_argument(
+                "--prereq_cache_ttl",
+                help="Specify for how many seconds satisfied prerequisites" +
+                " are not checked again, 0 disables the persistent cache",
+                type=int,
+                default=86400)
+
+        # Invalidate_prereq_cache argument forgets all satisfied prerequisites
+        self.parser.add_argument(
+                "--invalidate_prereq_cache",
+                help="Check all prerequisites again in this run",
+                action='store_true')
+
+        # Host_facts_ttl argument determines how long the probed facts of
+        # this host, e.g. installed interpreters, are trusted across runs
+        self.parser.add_argument(
+                "--host_facts_ttl",
+                help="Specify for how many seconds the probed interpreters" +
+                " and privilege of this host are not probed again, 0 probes" +
+                " them every run. Installed tools are looked up every run",
+                type=int,
+                default=86400)
+
+        # Host facts argument probes the host and prints its facts
+        self.parser.add_argument(
+                "--host_facts",
+                help="Probe this host, including interpreter versions, and" +
+                " print the facts preconditions are checked against",
+                action='store_true')
+
+        # Input_arguments argument supplies values replacing the default
+        # input arguments of atomics
+        self.parser.add_argument(
+                "--input_arguments",
+                help="Specify a JSON file mapping GUIDs, or '*' for all" +
+                " atomics, to input argument names and their values",
+                type=str,
+                nargs=1)
+
+        # Timeout argument limits the wall-clock time of every command
+        self.parser.add_argument(
+                "--timeout",
+                help="Specify the number of seconds after which a command" +
+                " of an atomic is killed",
+                type=float,
+                default=None)
+
+        # Max_output argument limits the output a command may produce
+        self.parser.add_argument(
+                "--max_output",
+                help="Specify the number of bytes a command of an atomic may" +
+                " write to stdout and stderr before it is killed",
+                type=int,
+                default=64 << 20)
+
+        # Shell_pool argument keeps interpreters alive between commands
+        # instead of starting a new process for every command
+        self.parser.add_argument(
+                "--shell_pool",
+                help="Specify the number of interpreter processes kept alive" +
+                " per executor, 0 starts a new process for every command",
+                type=int,
+                default=0)
+
+        # Isolated argument lists atomics that must not share interpreters
+        self.parser.add_argument(
+                "--isolated",
+                help="Specify a CSV file with GUIDs of atomics that always" +
+                " run in a new process when using --shell_pool",
+                type=str,
+                nargs=1)
+
+        # Journal argument determines the file every finished atomic is
+        # recorded in
+        self.parser.add_argument(
+                "--journal",
+                help="Specify the run journal file, defaults to " +
+                self.journal_file,
+                type=str,
+                nargs=1)
+
+        # Resume argument skips all atomics already recorded in the journal
+        self.parser.add_argument(
+                "--resume",
+                help="Resume an interrupted run by skipping all atomics" +
+                " recorded in the run journal",
+                action='store_true')
+
+        # Results argument determines the database the results of every
+        # run are stored and aggregated into coverage in
+        self.parser.add_argument(
+                "--results",
+                help="Specify the result store file, defaults to " +
+                self.results_file,
+                type=str,
+                nargs=1)
+
+        # Run name argument labels the run in the result store, results of
+        # a run with the same name are continued
+        self.parser.add_argument(
+                "--run_name",
+                help="Specify the name of the run in the result store," +
+                " defaults to its start time and host",
+                type=str,
+                nargs=1)
+
+        # Report argument prints the runs of the result store, the coverage
+        # of one run or the differences between two runs
+        self.parser.add_argument(
+                "--report",
+                help="List the runs of the result store, print the coverage" +
+                " per tactic and technique of a run or the differences" +
+                " between two runs, runs are referenced by name, ID," +
+                " 'latest' or 'previous'",
+                type=str,
+                nargs="*",
+                metavar="RUN")
+
+        # Cleanup argument determines when the cleanup commands of executed
+        # atomics are run
+        self.parser.add_argument(
+                "--cleanup",
+                help="Specify when cleanups are run where 'inline' runs" +
+                " them right after their atomic, 'deferred' runs them in" +
+                " a batch once all atomics of a technique are done," +
+                " 'background' runs them concurrently to the following" +
+                " atomics and 'none' only journals them",
+                choices=CleanupManager.modes,
+                default="inline")
+
+        self.parser.add_argument(
+                "--cleanup_timeout",
+                help="Specify a timeout in seconds for every cleanup command",
+                type=float)
+
+        self.parser.add_argument(
+                "--cleanup_workers",
+                help="Specify the number of threads running background cleanups",
+                type=int,
+                default=1)
+
+        # Cleanup journal argument sets the file all cleanups are recorded
+        # in before their atomic is run
+        self.parser.add_argument(
+                "--cleanup_journal",
+                help="Specify the cleanup journal file, defaults to " +
+                self.cleanup_journal_file,
+                type=str,
+                nargs=1)
+
+        # Recover cleanup argument runs all outstanding cleanups of the
+        # cleanup journal, e.g. after a crashed run
+        self.parser.add_argument(
+                "--recover_cleanup",
+                help="Run all cleanups of the cleanup journal which have" +
+                " not been run successfully",
+                action='store_true')
+
+        # Coordinator argument distributes the selected atomics to remote
+        # workers instead of running them locally
+        self.parser.add_argument(
+                "--coordinator",
+                help="Specify HOST:PORT to hand out the selected atomics" +
+                " to workers started with --worker",
+                type=str,
+                nargs=1)
+
+        # Worker argument runs the atomics handed out by a coordinator
+        self.parser.add_argument(
+                "--worker",
+                help="Specify the URL of a coordinator, e.g." +
+                " http://10.0.0.1:8700, to run its atomics on this host",
+                type=str,
+                nargs=1)
+
+        self.parser.add_argument(
+                "--campaign_token",
+                help="Specify a shared secret of coordinator and workers",
+                type=str,
+                nargs=1)
+
+        self.parser.add_argument(
+                "--min_workers",
+                help="Specify the number of workers that have to register" +
+                " before atomics no worker can run are skipped",
+                type=int,
+                default=1)
+
+        self.parser.add_argument(
+                "--lease_timeout",
+                help="Specify the seconds after which atomics of an" +
+                " unresponsive worker are handed out again",
+                type=float,
+                default=300.0)
+
+        self.parser.add_argument(
+                "--lease_batch",
+                help="Specify the number of atomics a worker leases at once",
+                type=int,
+                default=1)
+
+        # Telemetry arguments emit per phase timings and counters of every
+        # atomic to a JSONL file and/or an HTTP event collector
+        self.parser.add_argument(
+                "--telemetry",
+                help="Specify a JSONL file telemetry events are appended to",
+                type=str,
+                nargs=1)
+
+        self.parser.add_argument(
+                "--telemetry_url",
+                help="Specify the URL of an HTTP event collector, e.g." +
+                " Splunk HEC, telemetry events are posted to",
+                type=str,
+                nargs=1)
+
+        self.parser.add_argument(
+                "--telemetry_token",
+                help="Specify the token of the HTTP event collector",
+                type=str,
+                nargs=1)
+
+        # List techniques argument prints the indexed techniques, narrowed
+        # down by --select and --exclude, without loading their YAML files
+        self.parser.add_argument(
+                "--list_techniques",
+                help="List the techniques of the test index",
+                action='store_true')
+
+        # Query argument lists the indexed atomics matching all criteria,
+        # answered from the test index without loading YAML files
+        self.parser.add_argument(
+                "--query",
+                help="List the atomics matching \"field=value\" criteria" +
+                " delimited by \",\", e.g." +
+                " \"platform=linux,executor=bash,has_dependencies=false\"," +
+                " fields are " + ", ".join(AtomicStore.fields),
+                type=str,
+                nargs=1)
+
+        # Group by argument counts the queried atomics per value of a field
+        self.parser.add_argument(
+                "--group_by",
+                help="Count the atomics of --query per value of a field",
+                choices=AtomicStore.fields,
+                nargs=1)
+
+        # Telemetry report argument lists the atomics dominating wall time
+        self.parser.add_argument(
+                "--telemetry_report",
+                help="Print the atomics with the longest total duration" +
+                " recorded in a JSONL telemetry file",
+                type=str,
+                nargs=1)
         return
 
     def parse_arguments(self) -> None:
@@ -80,10 +430,39 @@ class AtomicTest(object):
         # Install argument
         elif (args.install):
             self.install_atomics()
+        # Sync argument
+        elif (args.sync is not None):
+            self.sync_atomics(args.sync)
+        # Compare plans
+        elif (args.compare_plans is not None):
+            self.compare_plans(args.compare_plans[0], args.compare_plans[1])
+        # Worker of a distributed campaign
+        elif (args.worker is not None):
+            self.run_worker(args)
+        # Recover cleanups
+        elif (args.recover_cleanup):
+            self.recover_cleanup(args)
+        # Coverage report
+        elif (args.report is not None):
+            self.report_results(args)
+        # Telemetry report
+        elif (args.telemetry_report is not None):
+            self.report_telemetry(args.telemetry_report[0])
+        # Host facts
+        elif (args.host_facts):
+            self.print_host_facts(args)
+        # Query atomics
+        elif (args.query is not None):
+            self.query_atomics(args)
+        # List techniques
+        elif (args.list_techniques):
+            self.list_techniques(args)
         # Run tests
         elif (args.runtype is not None and args.test_list is not None):
             test_list = self.parse_test_list(args)
-            self.run_tests()
+            self.run_tests(args, test_list)
+        elif (args.select is not None or args.exclude is not None):
+            self.run_tests(args, None)
         else:
             self.parser.print_help()
         return
@@ -125,26 +504,521 @@ class AtomicTest(object):
         message, is_error = Helper.delete_directory(at_temp_folder)
         Event(message=message, is_error=is_error, is_success=not is_error, exit=is_error)
 
-        # Load tests
-        self.test_container = TestContainer(self.official_tests_path,
-                                            self.custom_tests_path,
-                                            self.exclude_tests_file)
+        # Index tests
+        self.test_container = self.create_test_container()
         return
 
-    def run_tests(self) -> None:
-        # Load tests
-        self.test_container = TestContainer(self.official_tests_path,
-                                            self.custom_tests_path,
-                                            self.exclude_tests_file)
+    def create_test_container(self) -> TestContainer:
+        # Indexes the tests, a failure to persist the index only costs
+        # time on the next run
+        test_container = TestContainer(self.official_tests_path,
+                                       self.custom_tests_path,
+                                       self.exclude_tests_file,
+                                       index_file=self.tests_index_file)
+        message, is_error = test_container.index_status
+        if is_error:
+            Event(message=message, is_error=is_error)
+        return test_container
+
+    def sync_atomics(self, source) -> None:
+        # Downloaded archives are kept next to the tests, so unchanged
+        # archives are not downloaded again
+        if source == "":
+            source = self.atomic_test_official_repo + "archive/refs/heads/master.zip"
+        Event("Initiating sync of atomic tests from " + source + "...")
+        from src.RepositorySync import RepositorySync
+        repository_sync = RepositorySync(self.official_tests_path,
+                                         archive_file=self.atomics_archive_file)
+        message, is_error = repository_sync.sync(source)
+        Event(message=message, is_error=is_error, is_success=not is_error, exit=is_error)
+
+        # Index tests, unchanged files keep their index entries
+        self.test_container = self.create_test_container()
+        return
+
+    def list_techniques(self, args) -> None:
+        # Reads atomics and platforms from the index, unchanged techniques
+        # are not parsed again
+        selection = self.create_selection(args, None)
+        self.test_container = self.create_test_container()
+        entries = {}
+        for entry in self.test_container.index.values():
+            entries.setdefault(entry["technique"], []).append(entry)
+        technique_ids = self.test_container.get_technique_ids(selection.could_select)
+        for technique_id in technique_ids:
+            atomics = sum(len(entry["guids"]) for entry in entries[technique_id])
+            platforms = sorted({platform for entry in entries[technique_id]
+                                for platform in entry["platforms"]})
+            Event(technique_id + ": " + str(atomics) + " atomics (" +
+                  ", ".join(platforms) + ")")
+        Event(str(len(technique_ids)) + " techniques")
+        return
+
+    def query_atomics(self, args) -> None:
+        try:
+            criteria = AtomicStore.parse_query(args.query[0])
+        except ValueError as e:
+            Event(message=str(e), is_error=True, exit=True)
+        self.test_container = self.create_test_container()
+        store = self.test_container.create_atomic_store(self.load_tactics())
+        try:
+            records = store.query(criteria)
+        except ValueError as e:
+            Event(message=str(e), is_error=True, exit=True)
+        if args.group_by is not None:
+            counts = store.count_by(args.group_by[0], records)
+            for value, count in sorted(counts.items(), key=lambda item: -item[1]):
+                Event(str(value) + ": " + str(count) + " atomics")
+        else:
+            for record in records:
+                Event(record.technique + " " + record.guid + " " + record.name +
+                      " (" + ", ".join(record.platforms) + "; " + record.executor + ")")
+        techniques = len({record.technique for record in records})
+        Event(str(len(records)) + " atomics in " + str(techniques) + " techniques")
+        return
+
+    def run_tests(self, args, test_list) -> None:
+        affinity = self.parse_affinity(args)
+        selection = self.create_selection(args, test_list)
+        # Index tests, only techniques which may hold selected atomics are
+        # loaded afterwards
+        self.test_container = self.create_test_container()
+        self.test_container.selected_ids = \
+            self.test_container.get_technique_ids(selection.could_select)
         techniques = self.test_container.get_techniques()
 
-        # Initiate the Executor
-        self.executor = Executor(self.test_container.exclude_guids_list,
-                                 self.logger)
-        for technique in techniques:
-            self.executor.run_technique(techniques[technique])
+        # Remote workers run the atomics of a distributed campaign
+        if args.coordinator is not None:
+            self.run_coordinator(args, techniques, selection)
+            return
+
+        # Initiate the Executor and decide which atomics can be run
+        self.executor = self.create_executor(args, self.test_container.exclude_guids_list)
+        plan = self.executor.compile_plan(techniques.values(), selection)
+        if args.plan_file is not None:
+            message, is_error = plan.save(args.plan_file[0])
+            Event(message=message, is_error=is_error, is_success=not is_error)
+        journal_file = self.journal_file
+        if args.journal is not None:
+            journal_file = args.journal[0]
+        if args.resume:
+            self.resume_plan(plan, journal_file)
+        if args.dry_run:
+            for entry in plan.entries:
+                message = entry["technique"] + " " + entry["guid"] + " " + \
+                    entry["name"]
+                if entry["run"]:
+                    if entry.get("rule"):
+                        message += " (" + entry["rule"] + ")"
+                    Event(message, is_success=True)
+                else:
+                    Event(message + ": " + entry["reason"], is_error=True)
+            Event(plan.summary())
+            self.close_executor(args)
+            return
+        message, is_error = Helper.create_directory(os.path.dirname(journal_file) or ".")
+        if is_error:
+            Event(message=message, is_error=is_error, exit=is_error)
+        journal = RunJournal(journal_file)
+        journal.start(plan, resumed=args.resume)
+        self.executor.add_result_listener(journal.record)
+        result_store = self.create_result_store(args, plan)
+        self.executor.add_result_listener(result_store.record)
+        try:
+            results = self.executor.run_plan(plan, techniques.values(), args.workers,
+                                             affinity)
+        finally:
+            journal.close()
+            result_store.finish_run()
+            result_store.close()
+            self.close_executor(args)
+        self.print_results(plan, results)
+        return
+
+    def print_results(self, plan, results) -> None:
+        # Atomics finish in any order with several workers, the summary
+        # lists them in plan order
+        Event("Results of " + str(len(results)) + " atomics:")
+        for entry, result in zip(plan.entries, results):
+            message = entry["technique"] + " " + result["guid"] + " " + result["name"]
+            if not result["executed"]:
+                Event(message + ": skipped, " + result["status"], is_error=True)
+            elif result["success"]:
+                Event(message + ": succeeded", is_success=True)
+            else:
+                status = result["status"] or "exit code " + str(result["exit_code"])
+                Event(message + ": failed, " + status, is_error=True)
+        return
+
+    def create_executor(self, args, excluded_tests) -> Executor:
+        prereq_cache = PrereqCache()
+        if args.prereq_cache_ttl > 0:
+            prereq_cache = PrereqCache(self.prereq_cache_file,
+                                       args.prereq_cache_ttl)
+        if args.invalidate_prereq_cache:
+            prereq_cache.invalidate()
+        host_facts = self.create_host_facts(args)
+        input_overrides = self.parse_input_arguments(args)
+        runner = CommandRunner(args.timeout, args.max_output)
+        if args.shell_pool > 0:
+            from src.ShellPool import ShellPool
+            runner = ShellPool(args.shell_pool, args.timeout, args.max_output,
+                               fallback=runner)
+        isolated_tests = []
+        if args.isolated is not None:
+            if not Helper.check_file_existing(args.isolated[0]):
+                message = "supplied isolation file does not exist: " + args.isolated[0]
+                Event(message=message, is_error=True, exit=True)
+            isolated_tests = Helper.load_guids_from_csv(args.isolated[0])
+        telemetry = self.create_telemetry(args)
+        cleanup_journal_file = self.cleanup_journal_file
+        if args.cleanup_journal is not None:
+            cleanup_journal_file = args.cleanup_journal[0]
+        message, is_error = Helper.create_directory(
+            os.path.dirname(cleanup_journal_file) or ".")
+        if is_error:
+            Event(message=message, is_error=is_error, exit=is_error)
+        cleanup_manager = CleanupManager(runner, args.cleanup, cleanup_journal_file,
+                                         args.cleanup_timeout, args.cleanup_workers,
+                                         telemetry)
+        return Executor(excluded_tests, self.logger, prereq_cache, input_overrides,
+                        runner, isolated_tests, telemetry, cleanup_manager, host_facts)
+
+    def create_host_facts(self, args, probe_versions=False) -> HostFacts:
+        if args.host_facts_ttl <= 0:
+            return HostFacts(probe_versions=probe_versions)
+        message, is_error = Helper.create_directory(
+            os.path.dirname(self.host_facts_file) or ".")
+        if is_error:
+            Event(message=message, is_error=is_error, exit=is_error)
+        return HostFacts(self.host_facts_file, args.host_facts_ttl, probe_versions)
+
+    def print_host_facts(self, args) -> None:
+        host_facts = self.create_host_facts(args, probe_versions=True)
+        facts = host_facts.facts
+        Event("Operating system: " + facts["os"] + " (" + facts["distro"]["name"] +
+              " " + facts["distro"]["version"] + ")")
+        Event("Elevated: " + str(facts["elevation"]))
+        for executor, interpreter in sorted(facts["executors"].items()):
+            Event("Executor " + executor + ": " + interpreter["path"] +
+                  (" (" + interpreter["version"] + ")" if interpreter["version"] else ""))
+        missing = sorted(set(HostFacts.executor_binaries) - set(facts["executors"]))
+        if missing:
+            Event("Executors not installed: " + ", ".join(missing))
+        message, is_error = host_facts.save()
+        if is_error:
+            Event(message=message, is_error=is_error)
+        return
+
+    def close_executor(self, args) -> None:
+        # Runs outstanding cleanups before the runner is closed
+        self.executor.cleanup_manager.close()
+        self.executor.telemetry.close()
+        if args.shell_pool > 0:
+            self.executor.runner.close()
+        message, is_error = self.executor.prereq_cache.save()
+        if is_error:
+            Event(message=message, is_error=is_error)
+        message, is_error = self.executor.host_facts.save()
+        if is_error:
+            Event(message=message, is_error=is_error)
+        return
+
+    def run_coordinator(self, args, techniques, selection) -> None:
+        # Hands out the selected atomics to remote workers and journals
+        # their results
+        host, _, port = args.coordinator[0].rpartition(":")
+        try:
+            address = (host or "127.0.0.1", int(port))
+        except ValueError:
+            message = "coordinator address has to be HOST:PORT: " + args.coordinator[0]
+            Event(message=message, is_error=True, exit=True)
+        token = args.campaign_token[0] if args.campaign_token is not None else None
+        from src.CampaignCoordinator import CampaignCoordinator
+        coordinator = CampaignCoordinator(techniques.values(),
+                                          self.test_container.exclude_guids_list,
+                                          address, args.lease_timeout, token,
+                                          selection)
+        journal_file = self.journal_file
+        if args.journal is not None:
+            journal_file = args.journal[0]
+        message, is_error = Helper.create_directory(os.path.dirname(journal_file) or ".")
+        if is_error:
+            Event(message=message, is_error=is_error, exit=is_error)
+        journal = RunJournal(journal_file)
+        journal.start(coordinator.plan)
+        coordinator.add_result_listener(journal.record)
+        # Results of all workers belong to one run of the campaign
+        result_store = self.create_result_store(args, coordinator.plan,
+                                                host="campaign@" + args.coordinator[0])
+        coordinator.add_result_listener(result_store.record)
+        coordinator.start()
+        Event("Coordinating " + str(len(coordinator.plan.entries)) + " atomics at " +
+              coordinator.url + ", waiting for " + str(args.min_workers) + " workers")
+        try:
+            results = coordinator.wait(args.min_workers)
+        finally:
+            coordinator.close()
+            journal.close()
+            result_store.finish_run()
+            result_store.close()
+        for name, completed in coordinator.summary().items():
+            Event(name + ": " + str(completed) + " atomics")
+        succeeded = sum(1 for result in results if result["success"])
+        Event("Campaign done: " + str(succeeded) + " of " + str(len(results)) +
+              " atomics succeeded")
+        return
+
+    def open_result_store(self, args) -> "ResultStore":
+        results_file = self.results_file
+        if args.results is not None:
+            results_file = args.results[0]
+        message, is_error = Helper.create_directory(os.path.dirname(results_file) or ".")
+        if is_error:
+            Event(message=message, is_error=is_error, exit=is_error)
+        from src.ResultStore import ResultStore
+        try:
+            result_store = ResultStore(results_file)
+        except Exception as e:
+            message = "could not open result store " + results_file + ": " + str(e)
+            Event(message=message, is_error=True, exit=True)
+        # Coverage matrices are keyed to the techniques of the coverage file
+        result_store.set_tactics(self.load_tactics())
+        return result_store
+
+    def create_result_store(self, args, plan, host=None) -> "ResultStore":
+        # Starts a run in the result store, a resumed run continues the
+        # last run of this host or campaign unless it is named. Runs of
+        # other plans are not continued
+        result_store = self.open_result_store(args)
+        name = args.run_name[0] if args.run_name is not None else None
+        digest = RunJournal.create_plan_digest(plan)
+        if name is None and args.resume:
+            latest = result_store.find_latest_run(host)
+            if latest is not None and latest["plan"] == digest:
+                name = latest["name"]
+            elif latest is not None:
+                Event("The last stored run " + latest["name"] + " ran other atomics," +
+                      " results are stored in a new run", is_error=True)
+        result_store.start_run(name, digest, host)
+        return result_store
+
+    def run_worker(self, args) -> None:
+        # Runs the atomics handed out by a coordinator on this host
+        excluded_tests = []
+        if Helper.check_file_existing(self.exclude_tests_file):
+            excluded_tests = Helper.load_guids_from_csv(self.exclude_tests_file)
+        self.executor = self.create_executor(args, excluded_tests)
+        token = args.campaign_token[0] if args.campaign_token is not None else None
+        from src.CampaignWorker import CampaignWorker
+        worker = CampaignWorker(args.worker[0], self.executor,
+                                batch_size=args.lease_batch, token=token)
+        try:
+            completed = worker.run()
+        finally:
+            self.close_executor(args)
+        Event("Worker done after " + str(completed) + " atomics")
+        return
+
+    def resume_plan(self, plan, journal_file) -> None:
+        # Skips every atomic of the plan already recorded in the journal
+        replayed = RunJournal.replay(journal_file)
+        if replayed["plan"] is None:
+            message = "no previous run found in journal: " + journal_file
+            Event(message=message, is_error=True, exit=True)
+        if replayed["plan"] != RunJournal.create_plan_digest(plan):
+            Event("The selected atomics differ from the journaled run," +
+                  " only recorded atomics are skipped", is_error=True)
+        completed = 0
+        for entry in plan.entries:
+            if entry["run"] and entry["guid"] in replayed["records"]:
+                entry["run"] = False
+                entry["reason"] = "Completed in a previous run"
+                completed += 1
+        Event("Resuming run, skipping " + str(completed) + " completed atomics")
+        return
+
+    def recover_cleanup(self, args) -> None:
+        cleanup_journal_file = self.cleanup_journal_file
+        if args.cleanup_journal is not None:
+            cleanup_journal_file = args.cleanup_journal[0]
+        if not Helper.check_file_existing(cleanup_journal_file):
+            message = "supplied cleanup journal does not exist: " + cleanup_journal_file
+            Event(message=message, is_error=True, exit=True)
+        runner = CommandRunner(args.timeout, args.max_output)
+        succeeded, failed = CleanupManager.recover(cleanup_journal_file, runner,
+                                                   args.cleanup_timeout)
+        message = "Recovered cleanups: " + str(succeeded) + " succeeded, " + \
+            str(failed) + " failed"
+        Event(message=message, is_error=failed > 0, is_success=failed == 0)
+        return
+
+    def create_telemetry(self, args) -> Telemetry:
+        # Telemetry stays disabled unless a sink has been supplied
+        sinks = []
+        if args.telemetry is not None:
+            message, is_error = Helper.create_directory(
+                os.path.dirname(args.telemetry[0]) or ".")
+            if is_error:
+                Event(message=message, is_error=is_error, exit=is_error)
+            sinks.append(JsonlSink(args.telemetry[0]))
+        if args.telemetry_url is not None:
+            token = args.telemetry_token[0] if args.telemetry_token is not None else None
+            sinks.append(HttpSink(args.telemetry_url[0], token))
+        return Telemetry(sinks)
+
+    def report_results(self, args) -> None:
+        # Lists the runs, prints the coverage of one run or the differences
+        # between two runs, all answered from the aggregated coverage
+        if len(args.report) > 2:
+            Event(message="--report takes at most two runs", is_error=True, exit=True)
+        result_store = self.open_result_store(args)
+        try:
+            runs = [result_store.find_run(reference) for reference in args.report]
+        except ValueError as e:
+            result_store.close()
+            Event(message=str(e), is_error=True, exit=True)
+        if not runs:
+            for run in result_store.list_runs():
+                Event(str(run["id"]) + " " + run["name"] + " (" + run["host"] + "): " +
+                      str(run["succeeded"]) + " of " + str(run["atomics"]) +
+                      " atomics succeeded" + ("" if run["finished"] else ", unfinished"))
+        elif len(runs) == 1:
+            self.print_coverage(result_store, runs[0])
+        else:
+            self.print_coverage_diff(result_store, runs[0], runs[1])
+        result_store.close()
         return
 
+    def print_coverage(self, result_store, run) -> None:
+        Event("Coverage of run " + run["name"] + " (" + run["host"] + ")")
+        for tactic, (techniques, executed, succeeded) in \
+                result_store.get_tactic_coverage(run["id"]).items():
+            Event(tactic + ": " + str(succeeded) + " of " + str(techniques) +
+                  " techniques succeeded, " + str(executed) + " executed")
+        for technique, (atomics, executed, succeeded) in \
+                sorted(result_store.get_technique_coverage(run["id"]).items()):
+            Event(technique + ": " + str(succeeded) + " of " + str(atomics) +
+                  " atomics succeeded, " + str(executed) + " executed",
+                  is_success=succeeded > 0)
+        uncovered = result_store.get_uncovered_techniques(run["id"])
+        if uncovered:
+            Event("Techniques of the coverage file without a succeeded atomic: " +
+                  ", ".join(uncovered), is_error=True)
+        return
+
+    def print_coverage_diff(self, result_store, run, other_run) -> None:
+        Event("Differences from run " + run["name"] + " to " + other_run["name"])
+        before = result_store.get_tactic_coverage(run["id"])
+        after = result_store.get_tactic_coverage(other_run["id"])
+        for tactic, counts in after.items():
+            if before.get(tactic) != counts:
+                Event(tactic + ": " + str(before[tactic][2]) + " -> " + str(counts[2]) +
+                      " of " + str(counts[0]) + " techniques succeeded",
+                      is_error=before[tactic][2] > counts[2],
+                      is_success=before[tactic][2] < counts[2])
+        for technique, counts, other_counts in \
+                result_store.diff_techniques(run["id"], other_run["id"]):
+            descriptions = []
+            for c in [counts, other_counts]:
+                if c is None:
+                    descriptions.append("missing")
+                else:
+                    descriptions.append(str(c[2]) + " of " + str(c[0]) + " succeeded")
+            Event(technique + ": " + descriptions[0] + " <> " + descriptions[1])
+        changes = result_store.diff_atomics(run["id"], other_run["id"])
+        for change in ["regressed", "fixed", "added", "removed"]:
+            atomics = changes[change]
+            if not atomics:
+                continue
+            Event(str(len(atomics)) + " atomics " + change + ": " +
+                  ", ".join(technique + " " + guid for technique, guid in
+                            atomics[:self.report_limit]) +
+                  (", ..." if len(atomics) > self.report_limit else ""),
+                  is_error=change == "regressed", is_success=change == "fixed")
+        return
+
+    def report_telemetry(self, filename) -> None:
+        try:
+            summary = Telemetry.summarize(filename)
+        except OSError as e:
+            message = "could not load telemetry: " + str(e)
+            Event(message=message, is_error=True, exit=True)
+        for atomic in summary:
+            phases = ", ".join(phase + " " + str(round(atomic[phase], 2)) + "s"
+                               for phase in Telemetry.phases if phase in atomic)
+            Event(str(atomic["technique"]) + " " + atomic["guid"] + ": " +
+                  str(round(atomic["total"], 2)) + "s" +
+                  (" (" + phases + ")" if phases else ""))
+        return
+
+    def compare_plans(self, filename, other_filename) -> None:
+        try:
+            plan = ExecutionPlan.load(filename)
+            other_plan = ExecutionPlan.load(other_filename)
+        except (OSError, ValueError, KeyError) as e:
+            message = "could not load execution plans: " + str(e)
+            Event(message=message, is_error=True, exit=True)
+        Event(filename + ": " + plan.summary())
+        Event(other_filename + ": " + other_plan.summary())
+        for guid, entry, other_entry in plan.diff(other_plan):
+            descriptions = []
+            for e in [entry, other_entry]:
+                if e is None:
+                    descriptions.append("missing")
+                elif e["run"]:
+                    descriptions.append("run")
+                else:
+                    descriptions.append("skip (" + e["reason"] + ")")
+            Event(guid + ": " + descriptions[0] + " <> " + descriptions[1])
+        return
+
+    def parse_input_arguments(self, args) -> dict:
+        if args.input_arguments is None:
+            return {}
+        filename = args.input_arguments[0]
+        try:
+            with open(filename) as input_arguments_file:
+                input_overrides = json.load(input_arguments_file)
+        except (OSError, ValueError) as e:
+            message = "could not load input arguments from " + filename + \
+                ": " + str(e)
+            Event(message=message, is_error=True, exit=True)
+        return input_overrides
+
+    def parse_affinity(self, args) -> typing.Union[str, dict]:
+        arg_affinity = args.affinity
+        if arg_affinity in ["technique", "none"]:
+            return arg_affinity
+        # Otherwise the affinity groups are loaded from a CSV file
+        if not Helper.check_file_existing(arg_affinity):
+            message = "supplied affinity file does not exist: " + arg_affinity
+            Event(message=message, is_error=True, exit=True)
+        return Helper.load_affinity_groups_from_csv(arg_affinity)
+
+    def load_tactics(self) -> dict:
+        # Tactics of the techniques, if a coverage file exists
+        if Helper.check_file_existing(self.mitre_coverage_tests_file):
+            return SelectionEngine.load_tactics_from_csv(self.mitre_coverage_tests_file)
+        return {}
+
+    def create_selection(self, args, test_list) -> SelectionEngine:
+        # Compiles the test list of the runtype and the select and exclude
+        # arguments into one set of rules, in this order
+        selection = SelectionEngine(self.load_tactics())
+        try:
+            if test_list is not None:
+                kind = "exclude" if args.runtype[0] == "exclude" else "include"
+                for token in test_list:
+                    selection.add(kind, token)
+            for argument in args.select or []:
+                selection.add_all("include", argument)
+            for argument in args.exclude or []:
+                selection.add_all("exclude", argument)
+        except ValueError as e:
+            Event(message=str(e), is_error=True, exit=True)
+        return selection
+
     def parse_test_list(self, args) -> list:
         arg_test_list = args.test_list[0]
         parsed_test_list = []
@@ -160,7 +1034,12 @@ class AtomicTest(object):
                 Event(message=message, is_error=True, exit=True)
         # When there is no csv file, parse "," delimited tests from parameter
         else:
-            parsed_test_list = Helper.parse_technique_ids_from_string(arg_test_list)
+            parsed_test_list = SelectionEngine.parse_rules(arg_test_list)
+            try:
+                for token in parsed_test_list:
+                    SelectionEngine.parse_rule(token)
+            except ValueError:
+                parsed_test_list = []
             if parsed_test_list == []: 
                 message = "could not parse any technique IDs from input: " + arg_test_list
                 event = Event(message=message, is_error=True, exit=True)
@@ -0,0 +1,315 @@
+from src.Executor import Executor
+from src.ExecutionPlan import ExecutionPlan
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hmac
+import json
+import threading
+import time
+import uuid
+
+
+class CampaignCoordinator(object):
+
+    def __init__(self, techniques, excluded_tests=None, address=("127.0.0.1", 0),
+                 lease_timeout=300.0, token=None, selection=None) -> None:
+        """ Hands out the atomics of a campaign to remote workers
+
+        Parameters
+        ----------
+        techniques :
+            techniques whose atomics are distributed
+        excluded_tests :
+            GUIDs never handed out, in addition to the exclusions of workers
+        address :
+            (host, port) the HTTP server listens on, port 0 picks a free one
+        lease_timeout :
+            seconds after which atomics of a worker without heartbeat are
+            handed out again
+        token :
+            optional shared secret workers have to send
+        selection :
+            optional SelectionEngine, unselected atomics are not handed out
+        """
+        self.techniques = list(techniques)
+        self.excluded_tests = set(excluded_tests) if excluded_tests is not None else set()
+        self.lease_timeout = lease_timeout
+        self.token = token
+        # Every atomic becomes a plan entry, whether it can be run is only
+        # decided per worker once it asks for work
+        entries = []
+        self.atomics = []
+        for technique in self.techniques:
+            technique_id = technique.get("attack_technique", "")
+            for index, atomic in enumerate(technique["atomic_tests"]):
+                rule = ""
+                if selection is not None:
+                    selected, rule = selection.evaluate(technique_id, atomic)
+                    if not selected:
+                        continue
+                entries.append(ExecutionPlan.create_entry(technique_id, index, atomic,
+                                                          True, "", rule))
+                self.atomics.append(atomic)
+        self.plan = ExecutionPlan(entries, {"coordinator": True})
+        self.results = [None] * len(entries)
+        self.queue = deque(range(len(entries)))
+        # Leases by ID, a lease holds one atomic of one worker
+        self.leases = {}
+        self.workers = {}
+        self.result_listeners = []
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.server = ThreadingHTTPServer(address, CampaignRequestHandler)
+        self.server.daemon_threads = True
+        self.server.coordinator = self
+        self.server_thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return "http://" + host + ":" + str(port)
+
+    def start(self) -> None:
+        self.server_thread = threading.Thread(target=self.server.serve_forever,
+                                              daemon=True)
+        self.server_thread.start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def add_result_listener(self, listener) -> None:
+        self.result_listeners.append(listener)
+
+    def register(self, request) -> dict:
+        # Workers report the facts their preconditions are checked against
+        facts = request["facts"]
+        worker = {
+            "name": request.get("name") or "worker",
+            "preconditions": {
+                "os": facts["os"],
+                "elevation": bool(facts["elevation"]),
+                "supported_executors": list(facts["supported_executors"]),
+                "excluded_tests": self.excluded_tests
+            },
+            "last_seen": time.monotonic(),
+            "idle": False,
+            "completed": 0
+        }
+        worker_id = uuid.uuid4().hex
+        with self.changed:
+            self.workers[worker_id] = worker
+            self.changed.notify_all()
+        return {"worker": worker_id, "lease_timeout": self.lease_timeout}
+
+    def heartbeat(self, request) -> dict:
+        # Extends all leases of a worker
+        with self.lock:
+            worker = self.workers.get(request["worker"])
+            if worker is None:
+                return {"ok": False}
+            worker["last_seen"] = time.monotonic()
+            expires = worker["last_seen"] + self.lease_timeout
+            for lease in self.leases.values():
+                if lease["worker"] == request["worker"]:
+                    lease["expires"] = expires
+        return {"ok": True}
+
+    def expire_leases(self) -> None:
+        # Has to be called with the lock held. Atomics of workers that have
+        # not been heard of in time go back to the front of the queue
+        now = time.monotonic()
+        expired = [lease_id for lease_id, lease in self.leases.items()
+                   if lease["expires"] <= now]
+        for lease_id in expired:
+            self.requeue(self.leases.pop(lease_id)["index"])
+
+    def requeue(self, index) -> None:
+        # Has to be called with the lock held
+        self.queue.appendleft(index)
+        for worker in self.workers.values():
+            worker["idle"] = False
+
+    def lease(self, request) -> dict:
+        """ Hands out up to max_atomics atomics a worker can run
+
+        Atomics leased by other workers which have not been started yet are
+        stolen once the queue has nothing left for the worker
+        """
+        max_atomics = max(1, int(request.get("max_atomics", 1)))
+        with self.changed:
+            worker = self.workers.get(request["worker"])
+            if worker is None:
+                return {"atomics": [], "done": False, "unknown": True}
+            worker["last_seen"] = time.monotonic()
+            self.expire_leases()
+            indices = []
+            for index in list(self.queue):
+                if len(indices) >= max_atomics:
+                    break
+                if self.can_run(worker, index):
+                    self.queue.remove(index)
+                    indices.append(index)
+            if not indices:
+                indices = self.steal(request["worker"], worker, max_atomics)
+            atomics = []
+            expires = time.monotonic() + self.lease_timeout
+            for index in indices:
+                lease_id = uuid.uuid4().hex
+                self.leases[lease_id] = {"index": index, "worker": request["worker"],
+                                         "expires": expires, "started": False}
+                atomics.append({"lease": lease_id, "entry": self.plan.entries[index],
+                                "atomic": self.atomics[index]})
+            worker["idle"] = not atomics
+            self.changed.notify_all()
+            return {"atomics": atomics, "done": self.is_finished()}
+
+    def steal(self, worker_id, worker, max_atomics) -> list:
+        # Has to be called with the lock held
+        indices = []
+        for lease_id, lease in list(self.leases.items()):
+            if len(indices) >= max_atomics:
+                break
+            if lease["worker"] != worker_id and not lease["started"] and \
+                    self.can_run(worker, lease["index"]):
+                del self.leases[lease_id]
+                indices.append(lease["index"])
+        return indices
+
+    def can_run(self, worker, index) -> bool:
+        atomic = self.atomics[index]
+        can_be_run, _ = Executor.evaluate_preconditions(
+            worker["preconditions"], atomic["auto_generated_guid"],
+            atomic["supported_platforms"], atomic["executor"],
+            atomic.get("dependency_executor_name", []))
+        return can_be_run
+
+    def start_atomic(self, request) -> dict:
+        # Workers confirm a lease right before running its atomic, stolen
+        # leases are not confirmed
+        with self.lock:
+            lease = self.leases.get(request["lease"])
+            if lease is None or lease["worker"] != request["worker"]:
+                return {"ok": False}
+            lease["started"] = True
+            return {"ok": True}
+
+    def complete(self, request) -> dict:
+        with self.changed:
+            lease = self.leases.pop(request["lease"], None)
+            worker = self.workers.get(request["worker"])
+            if lease is None or worker is None or \
+                    self.results[lease["index"]] is not None:
+                return {"ok": False}
+            result = dict(request["result"])
+            result["worker"] = worker["name"]
+            self.results[lease["index"]] = result
+            worker["completed"] += 1
+            entry = self.plan.entries[lease["index"]]
+            self.changed.notify_all()
+        for listener in self.result_listeners:
+            listener(entry, result)
+        return {"ok": True}
+
+    def is_finished(self) -> bool:
+        # Has to be called with the lock held
+        return all(result is not None for result in self.results)
+
+    def skip_unassignable(self) -> list:
+        # Has to be called with the lock held. Once no atomic is leased and
+        # every worker came back empty handed, the queued atomics cannot be
+        # run by any of the registered workers
+        # Workers not heard of within the lease timeout are considered gone
+        stale = time.monotonic() - self.lease_timeout
+        workers = [worker for worker in self.workers.values()
+                   if worker["last_seen"] > stale]
+        if self.leases or not workers or \
+                not all(worker["idle"] for worker in workers):
+            return []
+        skipped = []
+        while self.queue:
+            index = self.queue.popleft()
+            entry = self.plan.entries[index]
+            result = Executor.create_result(entry["guid"], entry["name"], False,
+                                            "No worker satisfies the preconditions")
+            result["worker"] = None
+            self.results[index] = result
+            skipped.append((entry, result))
+        return skipped
+
+    def wait(self, min_workers=1, timeout=None) -> list:
+        """ Waits until every atomic has a result
+
+        Returns
+        ----------
+        results :
+            results in plan order, with the name of the worker that ran
+            them, or None for atomics without result at the timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.changed:
+                self.expire_leases()
+                skipped = []
+                if len(self.workers) >= min_workers:
+                    skipped = self.skip_unassignable()
+                finished = self.is_finished()
+                if not finished and not skipped:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return list(self.results)
+                    # Wake up regularly, leases expire without notification
+                    self.changed.wait(1.0 if remaining is None else min(1.0, remaining))
+            for entry, result in skipped:
+                for listener in self.result_listeners:
+                    listener(entry, result)
+            if finished:
+                return list(self.results)
+
+    def summary(self) -> dict:
+        with self.lock:
+            return {worker["name"]: worker["completed"]
+                    for worker in self.workers.values()}
+
+
+class CampaignRequestHandler(BaseHTTPRequestHandler):
+
+    # Paths of the JSON endpoints and the coordinator methods serving them
+    routes = {
+        "/register": "register",
+        "/heartbeat": "heartbeat",
+        "/lease": "lease",
+        "/start": "start_atomic",
+        "/result": "complete"
+    }
+
+    def do_POST(self) -> None:
+        coordinator = self.server.coordinator
+        if coordinator.token is not None and not hmac.compare_digest(
+                self.headers.get("X-Campaign-Token", ""), coordinator.token):
+            self.send_json(403, {"error": "invalid token"})
+            return
+        method = CampaignRequestHandler.routes.get(self.path)
+        if method is None:
+            self.send_json(404, {"error": "unknown endpoint"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length))
+            response = getattr(coordinator, method)(request)
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        self.send_json(200, response)
+
+    def send_json(self, code, response) -> None:
+        body = json.dumps(response, default=str).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        # Requests are far too frequent to be printed
+        return
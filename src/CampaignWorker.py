@@ -0,0 +1,146 @@
+from src.Event import Event
+import json
+import platform
+import threading
+import time
+
+
+class CampaignWorker(object):
+
+    # Attempts to report a result before it is given up, the coordinator
+    # hands the atomic out again once its lease expires
+    result_attempts = 3
+
+    def __init__(self, url, executor, name=None, batch_size=1, poll_interval=1.0,
+                 token=None, timeout=30.0) -> None:
+        """ Runs the atomics handed out by a CampaignCoordinator
+
+        Parameters
+        ----------
+        url :
+            URL of the coordinator, e.g. http://10.0.0.1:8700
+        executor :
+            Executor running the atomics, its preconditions are reported to
+            the coordinator
+        name :
+            name of the worker in the aggregated results, defaults to the
+            host name
+        batch_size :
+            atomics leased at once, leased atomics not started yet may be
+            stolen by idle workers
+        poll_interval :
+            seconds to wait before asking again while there is no work
+        token :
+            optional shared secret of the coordinator
+        timeout :
+            seconds to wait for a response of the coordinator
+        """
+        self.url = url.rstrip("/")
+        self.executor = executor
+        self.name = name if name is not None else platform.node()
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.token = token
+        self.timeout = timeout
+        self.worker_id = None
+        self.stopped = threading.Event()
+
+    def request(self, path, body) -> dict:
+        from urllib.request import Request, urlopen
+        headers = {"Content-Type": "application/json"}
+        if self.token is not None:
+            headers["X-Campaign-Token"] = self.token
+        data = json.dumps(body, default=str).encode("utf-8")
+        request = Request(self.url + path, data=data, headers=headers, method="POST")
+        with urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def register(self) -> float:
+        preconditions = self.executor.preconditions
+        response = self.request("/register", {
+            "name": self.name,
+            "facts": {
+                "os": preconditions["os"],
+                "elevation": bool(preconditions["elevation"]),
+                "supported_executors": list(preconditions["supported_executors"])
+            }
+        })
+        self.worker_id = response["worker"]
+        return response["lease_timeout"]
+
+    def send_heartbeats(self, interval) -> None:
+        # Keeps the leases of long running atomics alive
+        while not self.stopped.wait(interval):
+            try:
+                self.request("/heartbeat", {"worker": self.worker_id})
+            except OSError:
+                continue
+
+    def run(self) -> int:
+        """ Works until the coordinator has no atomics left or is gone
+
+        Returns
+        ----------
+        completed :
+            number of atomics this worker has run
+        """
+        # URLError and the HTTP errors of urllib are OSErrors
+        try:
+            lease_timeout = self.register()
+        except OSError as e:
+            Event("Could not register at coordinator " + self.url + ": " + str(e),
+                  is_error=True, exit=True)
+        heartbeat = threading.Thread(target=self.send_heartbeats,
+                                     args=(max(1.0, lease_timeout / 3),), daemon=True)
+        heartbeat.start()
+        completed = 0
+        try:
+            while True:
+                try:
+                    response = self.request("/lease", {"worker": self.worker_id,
+                                                       "max_atomics": self.batch_size})
+                except OSError:
+                    # The coordinator shuts down once the campaign is done
+                    Event("Coordinator is gone, stopping worker")
+                    break
+                if response.get("unknown"):
+                    self.register()
+                    continue
+                if not response["atomics"]:
+                    if response["done"]:
+                        break
+                    time.sleep(self.poll_interval)
+                    continue
+                for leased in response["atomics"]:
+                    if self.run_leased(leased):
+                        completed += 1
+        finally:
+            self.stopped.set()
+        return completed
+
+    def run_leased(self, leased) -> bool:
+        # Runs a leased atomic unless it has been stolen in the meantime or
+        # the coordinator cannot be reached to confirm the lease
+        try:
+            started = self.request("/start", {"worker": self.worker_id,
+                                              "lease": leased["lease"]})["ok"]
+        except OSError as e:
+            Event("Could not start leased atomic " + leased["entry"]["guid"] + ": " +
+                  str(e), is_error=True)
+            return False
+        if not started:
+            return False
+        result = self.executor.run_atomic(leased["atomic"],
+                                          technique=leased["entry"]["technique"])
+        for attempt in range(1, CampaignWorker.result_attempts + 1):
+            try:
+                self.request("/result", {"worker": self.worker_id,
+                                         "lease": leased["lease"], "result": result})
+                break
+            except OSError as e:
+                if attempt == CampaignWorker.result_attempts:
+                    Event("Could not report result of atomic " +
+                          leased["entry"]["guid"] + ": " + str(e), is_error=True)
+                else:
+                    time.sleep(self.poll_interval * attempt)
+        return True
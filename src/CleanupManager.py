@@ -0,0 +1,176 @@
+from src.RunJournal import RunJournal
+from src.Telemetry import Telemetry
+import json
+import threading
+import typing
+import uuid
+
+
+class CleanupManager(object):
+
+    # Inline runs a cleanup right after its atomic, deferred runs the
+    # cleanups of a technique in one batch once all of its atomics are
+    # done and background runs cleanups on worker threads. None only
+    # journals cleanups, they can be run later by recover
+    modes = ["inline", "deferred", "background", "none"]
+
+    def __init__(self, runner, mode="inline", journal_file=None, timeout=None,
+                 workers=1, telemetry=None) -> None:
+        """ Schedules the cleanup commands of executed atomics
+
+        Parameters
+        ----------
+        runner :
+            ExecutionBackend running the cleanup commands
+        mode :
+            one of CleanupManager.modes
+        journal_file :
+            optional file every cleanup is recorded in before its atomic
+            runs, so cleanups of a crashed run can be recovered
+        timeout :
+            optional wall-clock limit in seconds per cleanup command
+        workers :
+            number of threads running cleanups in background mode
+        telemetry :
+            optional Telemetry receiving a cleanup span per command
+        """
+        if mode not in CleanupManager.modes:
+            raise ValueError("Unknown cleanup mode: " + str(mode))
+        self.runner = runner
+        self.mode = mode
+        self.timeout = timeout
+        self.telemetry = telemetry if telemetry is not None else Telemetry()
+        self.journal = RunJournal(journal_file) if journal_file is not None else None
+        self.lock = threading.Lock()
+        # Registered cleanups by ID, and the IDs waiting per technique
+        self.cleanups = {}
+        self.deferred = {}
+        self.background = None
+        if self.mode == "background":
+            from concurrent.futures import ThreadPoolExecutor
+            self.background = ThreadPoolExecutor(max_workers=workers)
+        # GUIDs and results of failed cleanups
+        self.failed = []
+        # Callables receiving every cleanup record and its result after
+        # the cleanup ran
+        self.cleanup_listeners = []
+
+    def register(self, technique, guid, command, executor, prereqs=None) -> str:
+        """ Records the cleanup of an atomic before the atomic is run
+
+        Parameters
+        ----------
+        prereqs :
+            optional (executor, check command) of every prerequisite of
+            the atomic, the cleanup may undo them
+
+        Returns
+        ----------
+        cleanup_id :
+            ID passed to schedule once the atomic has been run
+        """
+        cleanup_id = uuid.uuid4().hex
+        cleanup = {"c": cleanup_id, "t": technique, "g": guid, "e": executor,
+                   "cmd": command}
+        if prereqs:
+            cleanup["p"] = [list(prereq) for prereq in prereqs]
+        with self.lock:
+            self.cleanups[cleanup_id] = cleanup
+        if self.journal is not None:
+            self.journal.write(cleanup, force_sync=True)
+        return cleanup_id
+
+    def schedule(self, cleanup_id) -> None:
+        # Runs, defers or submits a registered cleanup according to the mode
+        with self.lock:
+            cleanup = self.cleanups.get(cleanup_id)
+            if cleanup is None or self.mode == "none":
+                return
+            if self.mode == "deferred":
+                self.deferred.setdefault(cleanup["t"], []).append(cleanup_id)
+                return
+        if self.mode == "background":
+            self.background.submit(self.run_cleanup, cleanup_id)
+            return
+        self.run_cleanup(cleanup_id)
+
+    def flush(self, technique=None) -> None:
+        # Runs the deferred cleanups of a technique, or of all techniques,
+        # in reverse order so later atomics are undone first
+        with self.lock:
+            if technique is None:
+                techniques = list(self.deferred.keys())
+            else:
+                techniques = [technique] if technique in self.deferred else []
+            cleanup_ids = []
+            for t in techniques:
+                cleanup_ids += self.deferred.pop(t)
+        for cleanup_id in reversed(cleanup_ids):
+            self.run_cleanup(cleanup_id)
+
+    def run_cleanup(self, cleanup_id) -> bool:
+        with self.lock:
+            cleanup = self.cleanups.pop(cleanup_id, None)
+        if cleanup is None:
+            return True
+        with self.telemetry.context(technique=cleanup["t"], guid=cleanup["g"]), \
+                self.telemetry.span("cleanup") as span:
+            result = self.runner.run(cleanup["cmd"], cleanup["e"], self.timeout)
+            span.set(exit_code=result.exit_code, timed_out=result.timed_out)
+        if not result.success:
+            with self.lock:
+                self.failed.append((cleanup["g"], result))
+        for listener in self.cleanup_listeners:
+            listener(cleanup, result)
+        if self.journal is not None:
+            self.journal.write({"c": cleanup_id, "done": result.success})
+        return result.success
+
+    def add_cleanup_listener(self, listener) -> None:
+        self.cleanup_listeners.append(listener)
+
+    def close(self) -> None:
+        # Runs everything still outstanding
+        self.flush()
+        if self.background is not None:
+            self.background.shutdown(wait=True)
+        if self.journal is not None:
+            self.journal.close()
+
+    @staticmethod
+    def replay(filename) -> list:
+        # Returns the cleanups of a journal which have not been run
+        # successfully, a partially written last line is ignored
+        cleanups = {}
+        try:
+            journal_file = open(filename, "rb")
+        except OSError:
+            return []
+        with journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if "cmd" in record:
+                    cleanups[record["c"]] = record
+                elif record.get("done"):
+                    cleanups.pop(record.get("c"), None)
+        return list(cleanups.values())
+
+    @staticmethod
+    def recover(filename, runner, timeout=None) -> typing.Tuple[int, int]:
+        """ Runs the outstanding cleanups of a crashed run, newest first
+
+        Returns
+        ----------
+        counts :
+            number of successful and failed cleanups
+        """
+        cleanups = CleanupManager.replay(filename)
+        manager = CleanupManager(runner, "inline", filename, timeout)
+        for cleanup in reversed(cleanups):
+            manager.cleanups[cleanup["c"]] = cleanup
+            manager.run_cleanup(cleanup["c"])
+        manager.close()
+        return len(cleanups) - len(manager.failed), len(manager.failed)
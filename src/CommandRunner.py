@@ -0,0 +1,183 @@
+from src.ExecutionBackend import ExecutionBackend
+from collections import deque
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+
+class ExecutionResult(object):
+
+    def __init__(self, exit_code=None, duration=0.0, bytes_out=0,
+                 truncated=False, timed_out=False, peak_rss=0,
+                 stdout="", stderr="") -> None:
+        # Compact record of a finished command, stdout and stderr only
+        # hold the tail of the output that fit into the ring buffers
+        self.exit_code = exit_code
+        self.duration = duration
+        self.bytes_out = bytes_out
+        self.truncated = truncated
+        self.timed_out = timed_out
+        # Peak resident set size of the process in kilobytes, 0 if unknown
+        self.peak_rss = peak_rss
+        self.stdout = stdout
+        self.stderr = stderr
+
+    @property
+    def success(self) -> bool:
+        return self.exit_code == 0 and not self.timed_out
+
+    def to_dict(self) -> dict:
+        return {
+            "exit_code": self.exit_code,
+            "duration": self.duration,
+            "bytes_out": self.bytes_out,
+            "truncated": self.truncated,
+            "timed_out": self.timed_out,
+            "peak_rss": self.peak_rss
+        }
+
+
+class CommandRunner(ExecutionBackend):
+
+    # Lines longer than this are split, so a single line cannot exhaust
+    # the ring buffer's memory bound
+    max_line_bytes = 1 << 16
+
+    def __init__(self, timeout=None, max_output_bytes=64 << 20,
+                 buffer_lines=200) -> None:
+        # Wall-clock limit in seconds, None waits forever
+        self.timeout = timeout
+        # Processes writing more than this to stdout and stderr are killed
+        self.max_output_bytes = max_output_bytes
+        # Number of trailing lines kept per stream
+        self.buffer_lines = buffer_lines
+
+    @staticmethod
+    def build_arguments(command, executor) -> list:
+        # Creates the process arguments according to the executor
+        if executor == "sh":
+            return ["sh", "-c", command]
+        elif executor == "bash":
+            return ["bash", "-c", command]
+        elif executor == "powershell":
+            return ["powershell", "-Command", command]
+        elif executor == "command_prompt":
+            return ["cmd.exe", "/c", command]
+        return None
+
+    def run(self, command, executor, timeout=None, isolated=False) -> ExecutionResult:
+        # Every command runs in a fresh process, so it is always isolated
+        args = CommandRunner.build_arguments(command, executor)
+        if args is None:
+            return ExecutionResult(stderr="Unsupported executor: " + str(executor))
+        if timeout is None:
+            timeout = self.timeout
+
+        # Every command gets its own process group, so that a timeout also
+        # kills everything the command spawned
+        popen_kwargs = {}
+        if os.name == "posix":
+            popen_kwargs["start_new_session"] = True
+        else:
+            popen_kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+        start = time.monotonic()
+        try:
+            process = subprocess.Popen(args, stdin=subprocess.DEVNULL,
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE, **popen_kwargs)
+        except OSError as e:
+            return ExecutionResult(duration=time.monotonic() - start,
+                                   stderr=str(e))
+
+        buffers = [deque(maxlen=self.buffer_lines), deque(maxlen=self.buffer_lines)]
+        state = {"bytes_out": 0, "dropped": False}
+        state_lock = threading.Lock()
+        exceeded = threading.Event()
+
+        def read_stream(stream, buffer):
+            for line in iter(lambda: stream.readline(CommandRunner.max_line_bytes), b""):
+                with state_lock:
+                    if len(buffer) == buffer.maxlen:
+                        state["dropped"] = True
+                    buffer.append(line)
+                    state["bytes_out"] += len(line)
+                    if state["bytes_out"] > self.max_output_bytes:
+                        exceeded.set()
+            stream.close()
+
+        readers = [
+            threading.Thread(target=read_stream, args=(process.stdout, buffers[0]), daemon=True),
+            threading.Thread(target=read_stream, args=(process.stderr, buffers[1]), daemon=True)
+        ]
+        for reader in readers:
+            reader.start()
+
+        deadline = None if timeout is None else start + timeout
+        exit_code, peak_rss, timed_out = self.wait(process, deadline, exceeded)
+        duration = time.monotonic() - start
+        for reader in readers:
+            reader.join(1.0)
+
+        with state_lock:
+            stdout = b"".join(buffers[0]).decode("utf-8", errors="replace")
+            stderr = b"".join(buffers[1]).decode("utf-8", errors="replace")
+            return ExecutionResult(exit_code=exit_code, duration=duration,
+                                   bytes_out=state["bytes_out"],
+                                   truncated=state["dropped"] or exceeded.is_set(),
+                                   timed_out=timed_out, peak_rss=peak_rss,
+                                   stdout=stdout, stderr=stderr)
+
+    def wait(self, process, deadline, exceeded) -> tuple:
+        # Waits for the process while enforcing the deadline and the output
+        # limit, returns the exit code, peak RSS and whether it timed out
+        timed_out = False
+        if not hasattr(os, "wait4"):
+            while True:
+                try:
+                    process.wait(0.05)
+                    break
+                except subprocess.TimeoutExpired:
+                    pass
+                if deadline is not None and time.monotonic() >= deadline:
+                    timed_out = True
+                if timed_out or exceeded.is_set():
+                    CommandRunner.kill(process)
+                    process.wait()
+                    break
+            return process.returncode, 0, timed_out
+
+        # os.wait4 reaps the process itself and reports its resource usage
+        delay = 0.001
+        while True:
+            pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+            if pid != 0:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                timed_out = True
+            if timed_out or exceeded.is_set():
+                CommandRunner.kill(process)
+                pid, status, rusage = os.wait4(process.pid, 0)
+                break
+            exceeded.wait(delay)
+            delay = min(delay * 2, 0.05)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        peak_rss = rusage.ru_maxrss
+        if sys.platform == "darwin":
+            peak_rss //= 1024
+        return process.returncode, peak_rss, timed_out
+
+    @staticmethod
+    def kill(process) -> None:
+        # Kills the process group of the process
+        try:
+            if os.name == "posix":
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)],
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+        except OSError:
+            process.kill()
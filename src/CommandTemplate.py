@@ -0,0 +1,49 @@
+import functools
+import re
+import typing
+
+
+class CommandTemplate(object):
+
+    placeholder_pattern = re.compile(r"#\{([^{}]+)\}")
+
+    def __init__(self, command) -> None:
+        # Splits the command once into literal text and placeholder names,
+        # odd positions of the token list are placeholders
+        self.command = command
+        self.tokens = CommandTemplate.placeholder_pattern.split(command)
+        self.placeholders = frozenset(self.tokens[1::2])
+
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def compile(command) -> "CommandTemplate":
+        # Templates are immutable, so every distinct command is parsed once
+        return CommandTemplate(command)
+
+    @staticmethod
+    def create_values(input_args, overrides=None) -> dict:
+        # Layers user supplied overrides over the input argument defaults
+        values = {}
+        for name, argument in (input_args or {}).items():
+            if isinstance(argument, dict) and "default" in argument:
+                values[name] = str(argument["default"])
+        for name, value in (overrides or {}).items():
+            values[name] = str(value)
+        return values
+
+    def render(self, values) -> typing.Tuple[str, list]:
+        # Renders the command in a single pass, placeholders without a
+        # value are kept as they are and reported
+        if not self.placeholders:
+            return self.command, []
+        parts = list(self.tokens)
+        unresolved = []
+        for i in range(1, len(parts), 2):
+            name = parts[i]
+            if name in values:
+                parts[i] = values[name]
+            else:
+                parts[i] = "#{" + name + "}"
+                if name not in unresolved:
+                    unresolved.append(name)
+        return "".join(parts), unresolved
@@ -0,0 +1,144 @@
+from src.CommandTemplate import CommandTemplate
+from src.Helper import Helper
+import collections
+import functools
+import json
+import os
+
+# Immutable, compiled environment definition. Every discrete action is
+# integer encoded, action_values holds per action name the tuple of values
+# its indices decode to. rewards holds (condition, reward) pairs in the
+# order of the specification, conditions are (kind, argument) tuples
+EnvironmentSpec = collections.namedtuple("EnvironmentSpec", [
+    "technique",
+    "action_names",
+    "action_values",
+    "executor_name",
+    "command_template",
+    "rewards",
+    "default_reward",
+    "spec_path"
+])
+
+
+class EnvironmentFactory(object):
+
+    # Environment classes registered for specific technique IDs
+    environment_classes = {}
+
+    @staticmethod
+    def register(technique, environment_class) -> None:
+        EnvironmentFactory.environment_classes[technique] = environment_class
+
+    @staticmethod
+    def load_spec(path, technique) -> EnvironmentSpec:
+        # Compiles the JSON specification of a technique, compiled specs
+        # are cached until the file changes
+        filename = Helper.create_technique_json_paths(path, technique)
+        try:
+            mtime_ns = os.stat(filename).st_mtime_ns
+        except OSError:
+            raise ValueError("No environment specification found: " + filename)
+        return EnvironmentFactory.compile_spec_file(filename, mtime_ns)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=64)
+    def compile_spec_file(filename, mtime_ns) -> EnvironmentSpec:
+        # The modification time is part of the cache key only
+        try:
+            with open(filename) as spec_file:
+                spec = json.load(spec_file)
+        except (OSError, ValueError) as e:
+            raise ValueError("Loading environment specification went wrong: " +
+                             filename + "\n" + str(e))
+        return EnvironmentFactory.compile_spec(spec, filename)
+
+    @staticmethod
+    def compile_spec(spec, spec_path="") -> EnvironmentSpec:
+        # Validates a parsed specification and compiles it
+        for key in ["mitre_mapping", "action", "executor", "reward"]:
+            if key not in spec:
+                raise ValueError("Environment specification misses '" + key + "'")
+        technique = spec["mitre_mapping"]
+        if not Helper.check_technique_convention(technique):
+            raise ValueError("Invalid technique ID in environment specification: " +
+                             str(technique))
+
+        action_values = {}
+        for name, action in spec["action"].items():
+            action_values[name] = EnvironmentFactory.compile_action(name, action)
+
+        executor = spec["executor"]
+        if "name" not in executor or "command" not in executor:
+            raise ValueError("Environment executor needs a 'name' and a 'command'")
+        command_template = CommandTemplate.compile(executor["command"])
+        unknown = command_template.placeholders - set(action_values)
+        if unknown:
+            raise ValueError("Command uses placeholders without action: " +
+                             ", ".join(sorted(unknown)))
+
+        rewards = []
+        default_reward = None
+        for reward, condition in spec["reward"].items():
+            try:
+                reward = float(reward)
+            except ValueError:
+                raise ValueError("Reward is not numeric: " + str(reward))
+            condition = EnvironmentFactory.compile_condition(condition)
+            if condition[0] == "else":
+                default_reward = reward
+            else:
+                rewards.append((condition, reward))
+        if default_reward is None:
+            raise ValueError("Reward table needs an 'else' condition")
+
+        return EnvironmentSpec(
+            technique=technique,
+            action_names=tuple(action_values),
+            action_values=tuple(action_values.values()),
+            executor_name=executor["name"],
+            command_template=command_template,
+            rewards=tuple(rewards),
+            default_reward=default_reward,
+            spec_path=spec_path)
+
+    @staticmethod
+    def compile_action(name, action) -> tuple:
+        # Comma separated strings are choices, dicts with low and high are
+        # inclusive integer ranges
+        if isinstance(action, str):
+            values = tuple(value.strip() for value in action.split(",") if value.strip())
+        elif isinstance(action, dict) and "low" in action and "high" in action:
+            try:
+                low, high = int(action["low"]), int(action["high"])
+            except ValueError:
+                raise ValueError("Range of action '" + name + "' is not numeric")
+            values = tuple(range(low, high + 1))
+        elif isinstance(action, list):
+            values = tuple(action)
+        else:
+            raise ValueError("Unsupported definition of action '" + name + "'")
+        if not values:
+            raise ValueError("Action '" + name + "' has no values")
+        return values
+
+    @staticmethod
+    def compile_condition(condition) -> tuple:
+        condition = condition.strip()
+        if condition == "else":
+            return ("else", None)
+        if condition == "detected":
+            return ("detected", None)
+        if condition.startswith("passes "):
+            return ("passes", condition[len("passes "):].strip())
+        raise ValueError("Unsupported reward condition: " + condition)
+
+    @staticmethod
+    def create(path, technique, **kwargs):
+        # Instantiates the environment registered for the technique, or the
+        # generic atomic environment otherwise
+        from src.AtomicEnvironment import AtomicEnvironment
+        spec = EnvironmentFactory.load_spec(path, technique)
+        environment_class = EnvironmentFactory.environment_classes.get(
+            spec.technique, AtomicEnvironment)
+        return environment_class(spec, **kwargs)
@@ -0,0 +1,79 @@
+import abc
+import os
+import shlex
+import subprocess
+import sys
+import time
+import typing
+
+
+class ExecutionBackend(object, metaclass=abc.ABCMeta):
+
+    @abc.abstractmethod
+    def run(self, command, executor, timeout=None, isolated=False):
+        """ Runs a command with the interpreter of an executor
+
+        Parameters
+        ----------
+        command :
+            command with all placeholders replaced
+        executor :
+            name of the executor, e.g. 'sh' or 'powershell'
+        timeout :
+            optional wall-clock limit in seconds
+        isolated :
+            whether the command must not share state with other commands
+
+        Returns
+        ----------
+        result :
+            ExecutionResult of the command
+        """
+        raise NotImplementedError('run method must defined to use this base class')
+
+    def wait(self, seconds) -> None:
+        """ Waits for the outcome of an action, e.g. for detection
+        """
+        time.sleep(seconds)
+
+    def detected(self, command, waited) -> typing.Optional[bool]:
+        """ Returns whether a command has been detected
+
+        Parameters
+        ----------
+        command :
+            command of the action whose detection is checked
+        waited :
+            seconds waited since the command has been run
+
+        Returns
+        ----------
+        detected :
+            True or False, or None if the backend has no knowledge about
+            detection
+        """
+        return None
+
+    def passes(self, script, command, waited) -> bool:
+        """ Returns whether a check script passes after an action, by
+        running it with the Python interpreter of this process
+
+        Parameters
+        ----------
+        script :
+            path of the check script
+        command :
+            command of the action the script checks the outcome of
+        waited :
+            seconds waited since the command has been run
+        """
+        if os.name == "posix":
+            check = shlex.quote(sys.executable) + " " + shlex.quote(script)
+            return self.run(check, "sh").success
+        check = subprocess.list2cmdline([sys.executable, script])
+        return self.run(check, "command_prompt").success
+
+    def close(self) -> None:
+        """ Optional additional steps to release resources of the backend
+        """
+        return
@@ -0,0 +1,126 @@
+import json
+import typing
+
+
+class ExecutionPlan(object):
+
+    # Bump whenever the layout of a plan entry changes
+    plan_version = 1
+
+    def __init__(self, entries=None, host=None) -> None:
+        # Every entry describes one atomic and whether it will be run
+        self.entries = entries if entries is not None else []
+        # Host facts the plan has been compiled for
+        self.host = host if host is not None else {}
+
+    @staticmethod
+    def compile(techniques, executor, selection=None) -> "ExecutionPlan":
+        # Evaluates the selection rules and preconditions of every atomic
+        # of the supplied techniques up front, before any process is spawned
+        host = {
+            "os": executor.preconditions["os"],
+            "elevation": bool(executor.preconditions["elevation"]),
+            "supported_executors": list(executor.preconditions["supported_executors"])
+        }
+        entries = []
+        for technique in techniques:
+            technique_id = technique.get("attack_technique", "")
+            for index, atomic in enumerate(technique["atomic_tests"]):
+                rule = ""
+                if selection is not None:
+                    selected, rule = selection.evaluate(technique_id, atomic)
+                    if not selected:
+                        entries.append(ExecutionPlan.create_entry(
+                            technique_id, index, atomic, False,
+                            "Not selected: " + rule, rule))
+                        continue
+                can_be_run, status = executor.check_atomic_preconditions(atomic)
+                entries.append(ExecutionPlan.create_entry(technique_id, index, atomic,
+                                                          can_be_run, status, rule))
+        return ExecutionPlan(entries, host)
+
+    @staticmethod
+    def create_entry(technique_id, index, atomic, can_be_run, status, rule="") -> dict:
+        # The rule is the selection rule that decided about the atomic
+        return {
+            "technique": technique_id,
+            "index": index,
+            "guid": atomic["auto_generated_guid"],
+            "name": atomic["name"],
+            "executor": atomic["executor"]["name"],
+            "run": can_be_run,
+            "reason": "" if can_be_run else status,
+            "rule": rule
+        }
+
+    def runnable_entries(self) -> list:
+        return [entry for entry in self.entries if entry["run"]]
+
+    def skipped_entries(self) -> list:
+        return [entry for entry in self.entries if not entry["run"]]
+
+    def resolve(self, techniques) -> list:
+        # Pairs every entry with its atomic definition from the techniques
+        techniques_by_id = {}
+        for technique in techniques:
+            techniques_by_id[technique.get("attack_technique", "")] = technique
+        resolved = []
+        for entry in self.entries:
+            technique = techniques_by_id.get(entry["technique"])
+            atomic = None
+            if technique is not None and \
+                    entry["index"] < len(technique["atomic_tests"]):
+                atomic = technique["atomic_tests"][entry["index"]]
+                if atomic["auto_generated_guid"] != entry["guid"]:
+                    atomic = None
+            resolved.append((entry, atomic))
+        return resolved
+
+    def to_dict(self) -> dict:
+        return {
+            "version": ExecutionPlan.plan_version,
+            "host": self.host,
+            "entries": self.entries
+        }
+
+    @staticmethod
+    def from_dict(plan) -> "ExecutionPlan":
+        if plan.get("version") != ExecutionPlan.plan_version:
+            raise ValueError("Unsupported execution plan version: " +
+                             str(plan.get("version")))
+        return ExecutionPlan(plan["entries"], plan["host"])
+
+    def save(self, filename) -> typing.Tuple[str, bool]:
+        try:
+            with open(filename, "w") as plan_file:
+                json.dump(self.to_dict(), plan_file, indent=1)
+        except OSError as e:
+            return "Saving execution plan went wrong: " + str(e), True
+        return "Saved execution plan to " + filename, False
+
+    @staticmethod
+    def load(filename) -> "ExecutionPlan":
+        with open(filename) as plan_file:
+            return ExecutionPlan.from_dict(json.load(plan_file))
+
+    def diff(self, other) -> list:
+        # Returns (guid, own entry, other entry) for every atomic whose
+        # decision differs, entries missing on one side are None
+        own_entries = {entry["guid"]: entry for entry in self.entries}
+        other_entries = {entry["guid"]: entry for entry in other.entries}
+        differences = []
+        for guid, entry in own_entries.items():
+            other_entry = other_entries.get(guid)
+            if other_entry is None or entry["run"] != other_entry["run"] or \
+                    entry["reason"] != other_entry["reason"]:
+                differences.append((guid, entry, other_entry))
+        for guid, other_entry in other_entries.items():
+            if guid not in own_entries:
+                differences.append((guid, None, other_entry))
+        return differences
+
+    def summary(self) -> str:
+        runnable = len(self.runnable_entries())
+        return "Execution plan for " + str(self.host.get("os")) + ": " + \
+            str(runnable) + " atomics to run, " + \
+            str(len(self.entries) - runnable) + " skipped"
@@ -1,28 +1,62 @@
-from src.Helper import Helper
 import typing
 from src.Event import Event
-import subprocess
+from src.ExecutionPlan import ExecutionPlan
+from src.PrereqCache import PrereqCache
+from src.CommandTemplate import CommandTemplate
+from src.CommandRunner import CommandRunner, ExecutionResult
+from src.Telemetry import Telemetry
+from src.CleanupManager import CleanupManager
+from src.HostFacts import HostFacts
+import threading
 
 
 class Executor(object):
 
-    def __init__(self, excluded_tests, logger=None) -> None:
-        # Initiate system properties for precondition checks
+    def __init__(self, excluded_tests, logger=None, prereq_cache=None,
+                 input_overrides=None, runner=None, isolated_tests=None,
+                 telemetry=None, cleanup_manager=None, host_facts=None) -> None:
+        # Initiate system properties for precondition checks, only the
+        # executors whose interpreters are installed are supported
+        self.host_facts = host_facts if host_facts is not None else HostFacts()
         self.preconditions = {}
-        self.preconditions["os"] = Helper.determine_os()
-        self.preconditions["elevation"] =  Helper.determine_privilege()
-        self.preconditions["excluded_tests"] = excluded_tests
-        supported_executors = [
-            "sh",
-            "bash",
-            "command_prompt",
-            "powershell"
-        ]
-        self.preconditions["supported_executors"] = supported_executors
+        self.preconditions["os"] = self.host_facts.os
+        self.preconditions["elevation"] = self.host_facts.elevation
+        self.preconditions["excluded_tests"] = set(excluded_tests)
+        self.preconditions["supported_executors"] = self.host_facts.supported_executors
         self.logger = logger
+        # Without a persistent cache, prerequisites are checked once per run
+        self.prereq_cache = prereq_cache
+        if self.prereq_cache is None:
+            self.prereq_cache = PrereqCache()
+        # Input argument values replacing the defaults, keyed by GUID or
+        # by "*" for all atomics
+        self.input_overrides = input_overrides if input_overrides is not None else {}
+        # Backend creating the processes of commands
+        self.runner = runner if runner is not None else CommandRunner()
+        # Atomics whose commands always run in a fresh process, even if
+        # the backend keeps interpreters alive between commands
+        self.isolated_tests = set(isolated_tests) if isolated_tests is not None else set()
+        # Callables receiving the plan entry and result of every atomic
+        self.result_listeners = []
+        # Per phase timings and counters, disabled without sinks
+        self.telemetry = telemetry if telemetry is not None else Telemetry()
+        # Runs the cleanup commands of executed atomics, right after each
+        # atomic unless configured otherwise
+        self.cleanup_manager = cleanup_manager
+        if self.cleanup_manager is None:
+            self.cleanup_manager = CleanupManager(self.runner, telemetry=self.telemetry)
+        self.cleanup_manager.add_cleanup_listener(self.forget_prereqs)
 
-    def run_atomic(self, atomic) -> None:
-        # Runs an atomic test on the system
+    def run_atomic(self, atomic, planned=False, technique="") -> dict:
+        # Runs an atomic test on the system, preconditions are not checked
+        # again if the atomic is part of a compiled execution plan
+        with self.telemetry.context(guid=atomic["auto_generated_guid"]), \
+                self.telemetry.span("atomic") as span:
+            result = self.run_atomic_phases(atomic, planned, technique)
+            span.set(executed=result["executed"], success=result["success"])
+        return result
+
+    def run_atomic_phases(self, atomic, planned, technique) -> dict:
         atomic_name = atomic["name"]
         atomic_guid = atomic["auto_generated_guid"]
         atomic_description = atomic["description"]
@@ -32,110 +66,377 @@ class Executor(object):
         try:
             atomic_input_arguments = atomic["input_arguments"]
         except Exception as e:
-            atomic_input_arguments = []
+            atomic_input_arguments = {}
+        atomic_input_arguments = self.apply_input_overrides(atomic_guid,
+                                                            atomic_input_arguments)
         try:
             atomic_dependencies["executor"] = atomic["dependency_executor_name"]
         except Exception as e:
-            atomic_dependencies["executor"] = []
+            atomic_dependencies["executor"] = atomic_executor["name"]
         try:
             atomic_dependencies["dependencies"] = atomic["dependencies"]
         except Exception as e:
             atomic_dependencies["dependencies"] = []
 
         # Check preconditions
-        atomic_can_be_executed, status = self.check_preconditions(atomic_guid,
-                                                        atomic_platforms,
-                                                        atomic_executor,
-                                                        atomic_dependencies["executor"])
+        atomic_can_be_executed, status = True, ""
+        if not planned:
+            atomic_can_be_executed, status = self.check_atomic_preconditions(atomic)
 
-        # Execute dependencies
-        atomic_can_be_executed, status = self.execute_dependencies(atomic_dependencies,
-                                                                  atomic_input_arguments)
+        # Execute dependencies, unless the atomic cannot be run anyway
+        isolated = atomic_guid in self.isolated_tests
+        if atomic_can_be_executed:
+            atomic_can_be_executed, status = self.execute_dependencies(atomic_dependencies,
+                                                                      atomic_input_arguments,
+                                                                      isolated)
 
-        # Execute atomic test
+        # Execute atomic test, collecting its output separately from
+        # any other atomic that might be running concurrently
+        execution = None
+        cleanup_id = None
         if atomic_can_be_executed:
             # Execute the atomic
-            command = self.replace_input_placeholders(atomic_executor["command"],
+            command, unresolved = self.render_command(atomic_executor["command"],
                                                       atomic_input_arguments)
-            success = self.execute_command(command, atomic_executor["name"])
+            if unresolved:
+                message = "Unresolved input placeholders in atomic " + \
+                    atomic_guid + ": " + ", ".join(unresolved)
+                Event(message, is_error=True)
+            # The cleanup is recorded before the command runs, so it is
+            # known even if the run crashes while the command is running
+            prereqs = self.list_prereq_checks(atomic_dependencies, atomic_input_arguments)
+            cleanup_id = self.register_cleanup(technique, atomic_guid, atomic_executor,
+                                               atomic_input_arguments, prereqs)
+            with self.telemetry.span("command") as span:
+                execution = self.execute_command(command, atomic_executor["name"],
+                                                 isolated)
+                span.set(exit_code=execution.exit_code, bytes_out=execution.bytes_out)
+            if execution.timed_out:
+                status = "Atomic timed out after " + \
+                    str(round(execution.duration, 1)) + " seconds"
 
-        # Log to Splunk according to execution results
-        # TODO
+        # Telemetry sinks, e.g. Splunk, receive counters per atomic
         if not atomic_can_be_executed:
+            self.telemetry.count("atomic.skipped")
             Event(status, is_error=True)
+        elif execution.timed_out:
+            self.telemetry.count("atomic.timed_out")
+            Event(status + ": " + atomic_name + ", GUID: " + atomic_guid,
+                  is_error=True)
         else:
+            self.telemetry.count("atomic.executed")
+            if not execution.success:
+                self.telemetry.count("atomic.failed")
             message = "Executed atomic: " + atomic_name + ", GUID: " + atomic_guid
             Event(message, is_success=True)
 
-        # Cleanup with another Splunk log
-        # TODO
+        # Commands which did run are cleaned up even if they failed, they
+        # may have left artifacts behind
+        if cleanup_id is not None:
+            self.cleanup_manager.schedule(cleanup_id)
+
+        return Executor.create_result(atomic_guid, atomic_name,
+                                      atomic_can_be_executed, status, execution)
+
+    def register_cleanup(self, technique, guid, executor, input_args,
+                         prereqs=None) -> str:
+        # Returns the ID of the registered cleanup, or None without one
+        cleanup_command = executor.get("cleanup_command") or ""
+        cleanup_command, _ = self.render_command(cleanup_command, input_args)
+        if cleanup_command.strip() == "":
+            return None
+        return self.cleanup_manager.register(technique, guid, cleanup_command,
+                                             executor["name"], prereqs)
 
-    def execute_dependencies(self, dependencies, input_args) -> typing.Tuple[bool, str]:
+    def list_prereq_checks(self, dependencies, input_args) -> list:
+        # Returns (executor, check command) of every checked dependency
+        dependency_list = dependencies["dependencies"]
+        if isinstance(dependency_list, dict):
+            dependency_list = [dependency_list]
+        checks = []
+        for dependency in dependency_list or []:
+            check_command = self.replace_input_placeholders(
+                dependency.get("prereq_command", ""), input_args)
+            if check_command != "":
+                checks.append((dependencies["executor"], check_command))
+        return checks
+
+    def forget_prereqs(self, cleanup, result) -> None:
+        # Cleanups may remove what the prerequisites of their atomic
+        # fetched, e.g. a downloaded payload or tool, so those are checked
+        # again
+        for executor, check_command in cleanup.get("p", []):
+            self.prereq_cache.invalidate(executor, check_command)
+            tool = HostFacts.find_checked_tool(executor, check_command)
+            if tool is not None:
+                self.host_facts.forget_tool(tool)
+
+    @staticmethod
+    def create_result(guid, name, executed, status, execution=None) -> dict:
+        # Creates the result record of an atomic, not executed atomics get
+        # an empty execution result
+        if execution is None:
+            execution = ExecutionResult()
+        result = {
+            "guid": guid,
+            "name": name,
+            "executed": executed,
+            "success": executed and execution.success,
+            "status": status
+        }
+        result.update(execution.to_dict())
+        result["stdout"] = execution.stdout
+        result["stderr"] = execution.stderr
+        return result
+
+    def execute_dependencies(self, dependencies, input_args,
+                             isolated=False) -> typing.Tuple[bool, str]:
         # Runs and confirms dependencies for a given atomic
         # If no dependencies are listed, we are done
         if dependencies["executor"] == [] or \
            dependencies["dependencies"] == []:
             return True, ""
-        status = dependencies["dependencies"]["description"]
-        # Otherwise, the prereq get command is executed
-        if "get_prereq_command" in dependencies["dependencies"].keys():
-            command = dependencies["dependencies"]["get_prereq_command"]
-            command = self.replace_input_placeholders(command, input_args)
-            success_get =  self.execute_command(command, dependencies["executor"])
-        # Confirm successful prereq get command
-        if "prereq_command" in dependencies["dependencies"].keys():
-            command = dependencies["dependencies"]["prereq_command"]
-            command = self.replace_input_placeholders(command, input_args)
-            success = self.execute_command(command, dependencies["executor"])
-        return success, status
+        executor = dependencies["executor"]
+        dependency_list = dependencies["dependencies"]
+        if isinstance(dependency_list, dict):
+            dependency_list = [dependency_list]
+        for dependency in dependency_list:
+            status = dependency.get("description", "")
+            check_command = self.replace_input_placeholders(
+                dependency.get("prereq_command", ""), input_args)
+            get_command = self.replace_input_placeholders(
+                dependency.get("get_prereq_command", ""), input_args)
+            # Without a check, the prereq get command is all we can run
+            if check_command == "":
+                if get_command != "" and \
+                        not self.execute_prereq("prereq_get", get_command, executor,
+                                                isolated):
+                    return False, status
+                continue
+            # Checks for installed tools are answered by the host facts
+            installed = self.host_facts.check_prereq(executor, check_command)
+            if installed:
+                self.telemetry.count("prereq.host_facts_hit")
+                continue
+            if installed is not None and get_command == "":
+                self.telemetry.count("prereq.host_facts_hit")
+                return False, status
+            # Prerequisites shared by several atomics are only checked once
+            # and only fetched when the check actually fails
+            with self.prereq_cache.lock_for(executor, check_command):
+                if self.prereq_cache.is_satisfied(executor, check_command):
+                    self.telemetry.count("prereq.cache_hit")
+                    continue
+                if self.prereq_cache.has_failed(executor, check_command):
+                    self.telemetry.count("prereq.cache_hit")
+                    return False, status
+                # Tools known to be missing are fetched right away
+                if installed is None and \
+                        self.execute_prereq("prereq_check", check_command, executor, isolated):
+                    self.prereq_cache.mark_satisfied(executor, check_command)
+                    continue
+                if get_command != "":
+                    self.execute_prereq("prereq_get", get_command, executor, isolated)
+                    tool = HostFacts.find_checked_tool(executor, check_command)
+                    if tool is not None:
+                        self.host_facts.forget_tool(tool)
+                if self.execute_prereq("prereq_check", check_command, executor, isolated):
+                    self.prereq_cache.mark_satisfied(executor, check_command)
+                    continue
+                self.prereq_cache.mark_failed(executor, check_command)
+                return False, status
+        return True, ""
+
+    def execute_prereq(self, phase, command, executor, isolated) -> bool:
+        # Runs a prerequisite check or get command within its telemetry span
+        with self.telemetry.span(phase) as span:
+            success = self.execute_command(command, executor, isolated).success
+            span.set(success=success)
+        return success
+
+    def apply_input_overrides(self, guid, input_args) -> dict:
+        # Returns the input arguments with user supplied values as defaults
+        overrides = dict(self.input_overrides.get("*", {}))
+        overrides.update(self.input_overrides.get(guid, {}))
+        if not overrides:
+            return input_args
+        input_args = {name: dict(argument) for name, argument in input_args.items()}
+        for name, value in overrides.items():
+            input_args.setdefault(name, {})["default"] = value
+        return input_args
+
+    def render_command(self, command, input_args) -> typing.Tuple[str, list]:
+        # Replaces all placeholders with supplied input arguments and
+        # returns the names of placeholders without a value
+        template = CommandTemplate.compile(command)
+        command, unresolved = template.render(CommandTemplate.create_values(input_args))
+        if input_args:
+            command = command.replace("\n", "")
+        return command, unresolved
 
     def replace_input_placeholders(self, command, input_args) -> str:
         # Replaces all placeholders with supplied input arguments
-        placeholders = input_args.keys()
-        print(placeholders)
-        for placeholder in placeholders:
-            print(placeholder)
-            value = str(input_args[placeholder]["default"])
-            print(value)
-            placeholder = "#{" + placeholder + "}"
-            print(placeholder)
-            command = command.replace(placeholder, value)
-            command = command.replace("\n", "")
-        return command
-
-    def execute_command(self, command, executor) -> bool:
-        # Creates a process according to the executor with the supplied command
-        if executor == "sh":
-            returncode = subprocess.run(["sh", "-c", command])
-        elif executor == "bash":
-            returncode = subprocess.run(["bash", "-c", command])
-        elif executor == "powershell":
-            returncode = subprocess.run(["powershell", "-Command", command])
-        elif executor == "command_prompt":
-            returncode = subprocess.run([command])
-        return returncode == 0
-
-    def run_technique(self, technique) -> None:
+        return self.render_command(command, input_args)[0]
+
+    def execute_command(self, command, executor, isolated=False) -> ExecutionResult:
+        # Runs the supplied command with the executor's interpreter, output
+        # is captured per command, so that concurrently running atomics
+        # neither interleave on the console nor share stdin
+        return self.runner.run(command, executor, isolated=isolated)
+
+    def run_technique(self, technique, workers=1, affinity="technique") -> list:
         # Runs all the atomics for a given technique
-        for atomic in technique["atomic_tests"]:
-            self.run_atomic(atomic)
+        return self.run_techniques([technique], workers, affinity)
+
+    def run_techniques(self, techniques, workers=1, affinity="technique") -> list:
+        # Runs the atomics of all supplied techniques
+        techniques = list(techniques)
+        plan = self.compile_plan(techniques)
+        return self.run_plan(plan, techniques, workers, affinity)
+
+    def compile_plan(self, techniques, selection=None) -> ExecutionPlan:
+        # Decides for every atomic whether it is selected and can be run on
+        # this host
+        with self.telemetry.span("plan") as span:
+            plan = ExecutionPlan.compile(techniques, self, selection)
+            span.set(entries=len(plan.entries))
+        return plan
+
+    def run_plan(self, plan, techniques, workers=1, affinity="technique") -> list:
+        # Runs the runnable atomics of a compiled plan. With more than one
+        # worker, independent atomics run concurrently while atomics that
+        # share an affinity group are executed one after another. Results
+        # are returned in the order of the plan, skipped atomics included.
+        resolved = plan.resolve(techniques)
+        results = [None] * len(resolved)
+        atomics = []
+        indices = []
+        for index, (entry, atomic) in enumerate(resolved):
+            if not entry["run"] or atomic is None:
+                status = entry["reason"] or "Atomic is missing from the techniques"
+                Event(status, is_error=True)
+                with self.telemetry.context(technique=entry["technique"],
+                                            guid=entry["guid"]):
+                    self.telemetry.count("atomic.skipped")
+                results[index] = Executor.create_result(entry["guid"], entry["name"],
+                                                        False, status)
+                self.notify_result_listeners(entry, results[index])
+                continue
+            atomics.append((entry["technique"], atomic))
+            indices.append(index)
+        groups = self.group_by_affinity(atomics, affinity)
+        # Deferred cleanups of a technique run once its last atomic is done
+        remaining = {}
+        for technique_id, _ in atomics:
+            remaining[technique_id] = remaining.get(technique_id, 0) + 1
+        remaining_lock = threading.Lock()
+
+        def run_group(group):
+            for index in group:
+                technique_id = atomics[index][0]
+                with self.telemetry.context(technique=technique_id):
+                    result = self.run_atomic(atomics[index][1], planned=True,
+                                             technique=technique_id)
+                results[indices[index]] = result
+                self.notify_result_listeners(resolved[indices[index]][0], result)
+                with remaining_lock:
+                    remaining[technique_id] -= 1
+                    finished = remaining[technique_id] == 0
+                if finished:
+                    self.cleanup_manager.flush(technique_id)
+
+        if workers <= 1:
+            for group in groups:
+                run_group(group)
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                # Consume the iterator so exceptions of workers are raised
+                list(pool.map(run_group, groups))
+        return results
+
+    def add_result_listener(self, listener) -> None:
+        self.result_listeners.append(listener)
+
+    def notify_result_listeners(self, entry, result) -> None:
+        for listener in self.result_listeners:
+            listener(entry, result)
+
+    @staticmethod
+    def group_by_affinity(atomics, affinity) -> list:
+        # Groups indices of (technique ID, atomic) pairs into lists that
+        # have to run serially. The affinity is either "technique" to
+        # serialize atomics of the same technique, "none" to run every
+        # atomic independently, or a dict mapping technique IDs or GUIDs
+        # to the name of a serialization group
+        groups = {}
+        for index, (technique_id, atomic) in enumerate(atomics):
+            guid = atomic["auto_generated_guid"]
+            if affinity == "technique":
+                key = technique_id
+            elif isinstance(affinity, dict):
+                key = affinity.get(guid, affinity.get(technique_id, guid))
+            else:
+                key = guid
+            # Dicts keep insertion order, so groups start in plan order
+            groups.setdefault(key, []).append(index)
+        return list(groups.values())
+
+    def check_atomic_preconditions(self, atomic) -> typing.Tuple[bool, str]:
+        # Checks the preconditions of an atomic definition
+        can_be_run, status = self.check_preconditions(
+            atomic["auto_generated_guid"], atomic["supported_platforms"],
+            atomic["executor"], atomic.get("dependency_executor_name", []))
+        if can_be_run:
+            can_be_run, status = self.check_dependency_tools(atomic)
+        return can_be_run, status
+
+    def check_dependency_tools(self, atomic) -> typing.Tuple[bool, str]:
+        # Dependencies that only check for a tool and cannot fetch it are
+        # decided by the host facts, without spawning the check
+        executor = atomic.get("dependency_executor_name") or atomic["executor"]["name"]
+        dependency_list = atomic.get("dependencies") or []
+        if isinstance(dependency_list, dict):
+            dependency_list = [dependency_list]
+        for dependency in dependency_list:
+            if (dependency.get("get_prereq_command") or "").strip() != "":
+                continue
+            tool = HostFacts.find_checked_tool(executor,
+                                               dependency.get("prereq_command") or "")
+            if tool is not None and not self.host_facts.has_tool(tool):
+                return False, "Required tool is not installed: " + tool
+        return True, ""
 
     def check_preconditions(self, guid,platforms, executor,
                             dependent_executor) -> typing.Tuple[bool, str]:
-        # Checks if preconditions of the atomic are fulfilled
+        # Checks if preconditions of the atomic are fulfilled on this host
+        return Executor.evaluate_preconditions(self.preconditions, guid, platforms,
+                                               executor, dependent_executor)
+
+    @staticmethod
+    def evaluate_preconditions(preconditions, guid, platforms, executor,
+                               dependent_executor) -> typing.Tuple[bool, str]:
+        # Checks the preconditions of an atomic against the facts of a host,
+        # which may be a remote worker
         status = "Yesterday was a good day :)"
-        can_be_run = self.preconditions["os"] in platforms
+        can_be_run = preconditions["os"] in platforms
         if not can_be_run:
             status = "Required operating system not present"
             return can_be_run, status
-        can_be_run = not (guid in self.preconditions["excluded_tests"])
+        can_be_run = not (guid in preconditions["excluded_tests"])
         if not can_be_run:
             status = "Test is excluded by config"
             return can_be_run, status
-        can_be_run = executor["name"] in self.preconditions["supported_executors"]
+        can_be_run = executor["name"] in preconditions["supported_executors"]
         if dependent_executor != []:
-            can_be_run = dependent_executor in self.preconditions["supported_executors"]
-        if not can_be_run: status = "Required executor is not present"
+            can_be_run = can_be_run and \
+                dependent_executor in preconditions["supported_executors"]
+        if not can_be_run:
+            status = "Required executor is not present"
+            return can_be_run, status
+        can_be_run = preconditions["elevation"] or \
+            not executor.get("elevation_required", False)
+        if not can_be_run: status = "Required elevation is not present"
         return can_be_run, status
 
 
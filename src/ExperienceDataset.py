@@ -0,0 +1,223 @@
+import json
+import os
+import threading
+import time
+import numpy as np
+
+
+class ExperienceWriter(object):
+
+    # Bump whenever the layout of a dataset changes
+    dataset_version = 1
+
+    def __init__(self, path, technique="", flush_every=256):
+        # A dataset is a directory with one raw binary file per column and
+        # a JSON header describing dtype and shape of every column. Rows
+        # are buffered and appended to the column files in batches
+        self.path = path
+        self.flush_every = flush_every
+        os.makedirs(path, exist_ok=True)
+        self.header = ExperienceWriter.load_header(path)
+        if self.header is None:
+            self.header = {
+                "version": ExperienceWriter.dataset_version,
+                "length": 0,
+                "techniques": [],
+                "columns": {}
+            }
+        self.technique_index = self.register_technique(technique)
+        self.rows = []
+        # Delayed rewards may be credited from other threads
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def load_header(path):
+        try:
+            with open(os.path.join(path, "header.json")) as header_file:
+                header = json.load(header_file)
+        except (OSError, ValueError):
+            return None
+        if header.get("version") != ExperienceWriter.dataset_version:
+            raise ValueError("Unsupported experience dataset version: " +
+                             str(header.get("version")))
+        return header
+
+    def register_technique(self, technique) -> int:
+        if technique not in self.header["techniques"]:
+            self.header["techniques"].append(technique)
+        return self.header["techniques"].index(technique)
+
+    @staticmethod
+    def flatten(prefix, values) -> dict:
+        # Dict states and actions are stored as one column per name
+        if isinstance(values, dict):
+            return {prefix + "/" + name: value for name, value in values.items()}
+        return {prefix: values}
+
+    def append(self, states, actions, reward, terminal, duration) -> int:
+        # Appends a transition and returns its index in the dataset
+        with self.lock:
+            return self.append_row(states, actions, reward, terminal, duration)
+
+    def append_row(self, states, actions, reward, terminal, duration) -> int:
+        row = {}
+        row.update(ExperienceWriter.flatten("states", states))
+        row.update(ExperienceWriter.flatten("actions", actions))
+        row["reward"] = reward
+        row["terminal"] = int(terminal)
+        row["technique"] = self.technique_index
+        row["duration"] = duration
+        row["timestamp"] = time.time()
+        # Rows not matching the columns are rejected before they are
+        # buffered, so they never block later flushes
+        names = self.header["columns"] or (self.rows[0] if self.rows else row)
+        ExperienceWriter.check_row(row, names)
+        self.rows.append(row)
+        index = self.header["length"] + len(self.rows) - 1
+        if len(self.rows) >= self.flush_every:
+            self.flush()
+        return index
+
+    def create_column(self, name, value) -> dict:
+        value = np.asarray(value)
+        if name == "reward" or name == "duration":
+            dtype = np.dtype(np.float32)
+        elif name == "terminal":
+            dtype = np.dtype(np.int8)
+        elif name == "technique":
+            dtype = np.dtype(np.int16)
+        elif name == "timestamp":
+            dtype = np.dtype(np.float64)
+        elif value.dtype.kind in "iu":
+            dtype = np.dtype(np.int32)
+        elif value.dtype.kind == "b":
+            dtype = np.dtype(np.bool_)
+        else:
+            dtype = np.dtype(np.float32)
+        return {"dtype": dtype.str, "shape": list(value.shape)}
+
+    def flush(self) -> None:
+        with self.lock:
+            self.flush_rows()
+
+    @staticmethod
+    def check_row(row, names) -> None:
+        # Every row has to hold exactly the columns of the dataset
+        missing = sorted(set(names) - set(row))
+        if missing:
+            raise ValueError("Row lacks columns of the dataset: " + ", ".join(missing))
+        unknown = sorted(set(row) - set(names))
+        if unknown:
+            raise ValueError("Column missing from existing dataset: " + ", ".join(unknown))
+
+    def flush_rows(self) -> None:
+        if not self.rows:
+            return
+        columns = self.header["columns"]
+        if not columns:
+            columns = {name: self.create_column(name, value)
+                       for name, value in self.rows[0].items()}
+        # All rows are checked before any column file is written, so the
+        # columns never get out of step
+        for row in self.rows:
+            ExperienceWriter.check_row(row, columns)
+        self.header["columns"] = columns
+        for name, column in columns.items():
+            data = np.asarray([row[name] for row in self.rows],
+                              dtype=np.dtype(column["dtype"]))
+            with open(os.path.join(self.path, name.replace("/", ".") + ".bin"), "ab") as f:
+                f.write(np.ascontiguousarray(data).tobytes())
+        self.header["length"] += len(self.rows)
+        self.rows = []
+        self.save_header()
+
+    def update(self, index, name, value) -> None:
+        # Overwrites a single value of a transition that has already been
+        # appended, e.g. a reward which is only known later
+        with self.lock:
+            self.update_row(index, name, value)
+
+    def update_row(self, index, name, value) -> None:
+        offset = index - self.header["length"]
+        if offset >= 0:
+            self.rows[offset][name] = value
+            return
+        column = self.header["columns"][name]
+        dtype = np.dtype(column["dtype"])
+        data = np.asarray(value, dtype=dtype)
+        row_size = dtype.itemsize * int(np.prod(column["shape"], dtype=np.int64))
+        with open(os.path.join(self.path, name.replace("/", ".") + ".bin"), "r+b") as f:
+            f.seek(index * row_size)
+            f.write(np.ascontiguousarray(data).tobytes())
+
+    def save_header(self) -> None:
+        temp_file = os.path.join(self.path, "header.json.tmp")
+        with open(temp_file, "w") as header_file:
+            json.dump(self.header, header_file, indent=1)
+        os.replace(temp_file, os.path.join(self.path, "header.json"))
+
+    def close(self) -> None:
+        self.flush()
+
+
+class ExperienceReader(object):
+
+    def __init__(self, path):
+        # Memory maps all columns, nothing is read until it is accessed
+        self.path = path
+        self.header = ExperienceWriter.load_header(path)
+        if self.header is None:
+            raise ValueError("No experience dataset found: " + path)
+        self.length = self.header["length"]
+        self.columns = {}
+        for name, column in self.header["columns"].items():
+            filename = os.path.join(path, name.replace("/", ".") + ".bin")
+            if self.length == 0:
+                continue
+            self.columns[name] = np.memmap(filename, mode="r",
+                                           dtype=np.dtype(column["dtype"]),
+                                           shape=tuple([self.length] + column["shape"]))
+
+    def __len__(self):
+        return self.length
+
+    @staticmethod
+    def unflatten(prefix, batch):
+        # Restores dict states and actions from their columns
+        if prefix in batch:
+            return batch[prefix]
+        return {name[len(prefix) + 1:]: value for name, value in batch.items()
+                if name.startswith(prefix + "/")}
+
+    def get(self, indices) -> dict:
+        # Reads the rows at indices, which is a slice or an index array
+        batch = {name: np.asarray(column[indices]) for name, column in self.columns.items()}
+        return {
+            "states": ExperienceReader.unflatten("states", batch),
+            "actions": ExperienceReader.unflatten("actions", batch),
+            "reward": batch["reward"],
+            "terminal": batch["terminal"],
+            "technique": batch["technique"],
+            "duration": batch["duration"],
+            "timestamp": batch["timestamp"]
+        }
+
+    def batches(self, batch_size, shuffle=False, seed=None):
+        # Streams mini-batches, only the rows of a batch are read
+        if shuffle:
+            order = np.random.default_rng(seed).permutation(self.length)
+            for start in range(0, self.length, batch_size):
+                yield self.get(np.sort(order[start:start + batch_size]))
+        else:
+            for start in range(0, self.length, batch_size):
+                yield self.get(slice(start, start + batch_size))
+
+    def episodes(self):
+        # Streams complete episodes, as required by Agent.experience
+        if self.length == 0:
+            return
+        ends = np.flatnonzero(self.columns["terminal"]) + 1
+        start = 0
+        for end in ends:
+            yield self.get(slice(start, int(end)))
+            start = int(end)
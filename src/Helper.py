@@ -1,14 +1,12 @@
 import platform 
-import ctypes
 import re
 import csv
 import os
 import typing
-from io import BytesIO
-from urllib.request import urlopen
-from zipfile import ZipFile
 import shutil
-import yaml
+
+# yaml, ctypes, urllib and zipfile are imported by the helpers using them,
+# so commands that never touch them start quickly
 
 class Helper(object):
 
@@ -61,6 +59,37 @@ class Helper(object):
                 return []
         return split_list
 
+    @staticmethod
+    def load_technique_ids_from_csv(filename) -> list:
+        # Loads all technique IDs from the first column of a CSV file
+        technique_ids = []
+        with open(filename, newline="") as csv_file:
+            for row in csv.reader(csv_file):
+                if row and Helper.check_technique_convention(row[0].strip()):
+                    technique_ids.append(row[0].strip())
+        return technique_ids
+
+    @staticmethod
+    def load_guids_from_csv(filename) -> list:
+        # Loads all GUIDs from the first column of a CSV file
+        guids = []
+        with open(filename, newline="") as csv_file:
+            for row in csv.reader(csv_file):
+                if row and Helper.check_guid_convention(row[0].strip()):
+                    guids.append(row[0].strip())
+        return guids
+
+    @staticmethod
+    def load_affinity_groups_from_csv(filename) -> dict:
+        # Loads "technique ID or GUID,group" rows into a dict
+        affinity = {}
+        with open(filename, newline="") as csv_file:
+            for row in csv.reader(csv_file):
+                if len(row) < 2 or row[0].strip().startswith("#"):
+                    continue
+                affinity[row[0].strip()] = row[1].strip()
+        return affinity
+
     @staticmethod
     def delete_directory(path) -> typing.Tuple[str, bool]:
         if os.path.isdir(path):
@@ -98,6 +127,9 @@ class Helper(object):
             return message, is_error
 
         # Download and exstract zip to path
+        from io import BytesIO
+        from urllib.request import urlopen
+        from zipfile import ZipFile
         try:
             with urlopen(url) as zipresp:
                 with ZipFile(BytesIO(zipresp.read())) as zfile:
@@ -139,10 +171,14 @@ class Helper(object):
 
     @staticmethod
     def load_yaml_technique(filename) -> dict:
+        import yaml
+        # Prefer the libyaml based loader, which is magnitudes faster than
+        # the pure Python implementation
+        loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
         test = {}
         try:
             with open(filename) as yaml_test:
-                test = yaml.load(yaml_test, Loader=yaml.FullLoader)
+                test = yaml.load(yaml_test, Loader=loader)
         except Exception as e:
             message = "Loading test from YAML file went wrong: " + filename + \
                     "\n" + str(e)
@@ -152,10 +188,11 @@ class Helper(object):
 
     @staticmethod
     def determine_privilege() -> bool:
-        system = Helper.determine_os()
-        if (system == "linux" or system == "mac"):
+        # Every POSIX system, e.g. Linux and macOS, has user IDs
+        if hasattr(os, "getuid"):
             return os.getuid() == 0
         else:
+            import ctypes
             return ctypes.windll.shell32.IsUserAnAdmin()
             
 
@@ -0,0 +1,239 @@
+from src.Helper import Helper
+import hashlib
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import threading
+import time
+import typing
+
+
+class HostFacts(object):
+
+    # Interpreters started by CommandRunner for every executor
+    executor_binaries = {
+        "sh": "sh",
+        "bash": "bash",
+        "powershell": "powershell",
+        "command_prompt": "cmd.exe"
+    }
+
+    # Arguments making an interpreter print its version
+    version_arguments = {
+        "bash": ["--version"],
+        "powershell": ["-NoProfile", "-NonInteractive", "-Command",
+                       "$PSVersionTable.PSVersion.ToString()"],
+        "command_prompt": ["/c", "ver"]
+    }
+
+    # Names of operating systems in the supported_platforms of atomics
+    platform_names = {
+        "darwin": "macos"
+    }
+
+    # Prerequisite checks which only test whether a tool is installed,
+    # whitespace is normalized before matching
+    tool_checks = {
+        "sh": [
+            re.compile(r'^(?:command -v|which|type|hash) ([\w.+-]+)(?: ?>\s?/dev/null)?(?: 2>&1)?;?$'),
+            re.compile(r'^if \[ -x "\$\(command -v ([\w.+-]+)\)" \]; ?then exit 0; ?else exit 1; ?fi;?$')
+        ],
+        "powershell": [
+            re.compile(r'^if ?\(Get-Command ([\w.+-]+) -ErrorAction (?:Ignore|SilentlyContinue)\) ?'
+                       r'\{ ?exit 0 ?\} ?else ?\{ ?exit 1 ?\}$', re.IGNORECASE)
+        ]
+    }
+
+    # Bump whenever the layout of the cache file changes
+    cache_version = 2
+
+    def __init__(self, cache_file=None, ttl=86400, probe_versions=False) -> None:
+        """ Facts about the host atomics are checked against, probed once
+
+        Parameters
+        ----------
+        cache_file :
+            optional file the facts are persisted in, they are probed again
+            once older than ttl or when PATH or privilege changed. Installed
+            tools are only remembered for the current run, prerequisites
+            and cleanups install and remove them
+        ttl :
+            seconds cached facts stay valid
+        probe_versions :
+            starts every installed interpreter once to record its version,
+            otherwise interpreters are only looked up on the PATH
+        """
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.probe_versions = probe_versions
+        self.lock = threading.Lock()
+        self.changed = False
+        self.facts = None
+        if self.cache_file is not None:
+            self.facts = self.load()
+        if self.facts is None:
+            self.facts = self.probe()
+            self.changed = True
+
+    @staticmethod
+    def determine_platform() -> str:
+        # Operating system as named by the supported_platforms of atomics
+        system = Helper.determine_os()
+        return HostFacts.platform_names.get(system, system)
+
+    @staticmethod
+    def determine_fingerprint() -> str:
+        # Cached facts only hold for the same host, privilege and PATH
+        path = os.environ.get("PATH", "")
+        return "|".join([HostFacts.determine_platform(), platform.node(),
+                         str(bool(Helper.determine_privilege())),
+                         hashlib.sha1(path.encode("utf-8")).hexdigest()])
+
+    @staticmethod
+    def determine_distro() -> dict:
+        # Name and version of Linux distributions, from os-release
+        if Helper.determine_os() != "linux":
+            return {"name": platform.system(), "version": platform.release()}
+        release = {}
+        for filename in ["/etc/os-release", "/usr/lib/os-release"]:
+            try:
+                with open(filename) as release_file:
+                    for line in release_file:
+                        key, _, value = line.strip().partition("=")
+                        if key:
+                            release[key] = value.strip("\"'")
+                break
+            except OSError:
+                continue
+        return {"name": release.get("ID", "linux"),
+                "version": release.get("VERSION_ID", "")}
+
+    @staticmethod
+    def probe_version(executor, path) -> str:
+        # Returns the first line an interpreter prints as its version
+        arguments = HostFacts.version_arguments.get(executor)
+        if arguments is None:
+            return ""
+        try:
+            output = subprocess.run([path] + arguments, stdout=subprocess.PIPE,
+                                    stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL,
+                                    universal_newlines=True, timeout=10).stdout
+        except (OSError, subprocess.SubprocessError):
+            return ""
+        lines = [line.strip() for line in output.splitlines() if line.strip()]
+        return lines[0] if lines else ""
+
+    def probe(self) -> dict:
+        executors = {}
+        for executor, binary in HostFacts.executor_binaries.items():
+            path = shutil.which(binary)
+            if path is None:
+                continue
+            executors[executor] = {"path": path, "version": ""}
+            if self.probe_versions:
+                executors[executor]["version"] = HostFacts.probe_version(executor, path)
+        return {
+            "os": HostFacts.determine_platform(),
+            "distro": HostFacts.determine_distro(),
+            "elevation": bool(Helper.determine_privilege()),
+            "executors": executors,
+            "tools": {},
+            "versions_probed": self.probe_versions,
+            "fingerprint": HostFacts.determine_fingerprint(),
+            "probed_at": time.time()
+        }
+
+    @property
+    def os(self) -> str:
+        return self.facts["os"]
+
+    @property
+    def elevation(self) -> bool:
+        return self.facts["elevation"]
+
+    @property
+    def supported_executors(self) -> list:
+        return list(self.facts["executors"])
+
+    def has_tool(self, name) -> bool:
+        # Tools are looked up on the PATH once per run
+        with self.lock:
+            path = self.facts["tools"].get(name, False)
+        if path is False:
+            path = shutil.which(name)
+            with self.lock:
+                self.facts["tools"][name] = path
+        return path is not None
+
+    def forget_tool(self, name) -> None:
+        # Tools may have been installed by a prerequisite get command or
+        # removed by a cleanup
+        with self.lock:
+            self.facts["tools"].pop(name, None)
+
+    @staticmethod
+    def find_checked_tool(executor, command) -> str:
+        """ Returns the tool a prerequisite check tests for, or None if the
+        check does anything else than testing whether a tool is installed
+        """
+        patterns = HostFacts.tool_checks.get("sh" if executor == "bash" else executor, [])
+        command = " ".join(command.split())
+        for pattern in patterns:
+            match = pattern.match(command)
+            if match is not None:
+                return match.group(1)
+        return None
+
+    def check_prereq(self, executor, command) -> typing.Optional[bool]:
+        # Answers tool checks from the facts, None if the check has to run
+        tool = HostFacts.find_checked_tool(executor, command)
+        if tool is None:
+            return None
+        return self.has_tool(tool)
+
+    def load(self) -> dict:
+        # Returns the cached facts if they are still valid for this host
+        try:
+            with open(self.cache_file) as cache_file:
+                cached = json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+        if cached.get("version") != HostFacts.cache_version:
+            return None
+        facts = cached.get("facts", {})
+        if time.time() - facts.get("probed_at", 0) > self.ttl or \
+                facts.get("fingerprint") != HostFacts.determine_fingerprint():
+            return None
+        if self.probe_versions and not facts.get("versions_probed"):
+            return None
+        facts["tools"] = {}
+        return facts
+
+    def save(self) -> typing.Tuple[str, bool]:
+        if self.cache_file is None:
+            return "Host facts are not persisted", False
+        with self.lock:
+            if not self.changed:
+                return "Host facts are up to date", False
+            facts = dict(self.facts)
+            facts.pop("tools")
+            cached = {"version": HostFacts.cache_version, "facts": facts}
+            self.changed = False
+        temp_file = self.cache_file + ".tmp"
+        try:
+            with open(temp_file, "w") as cache_file:
+                json.dump(cached, cache_file)
+            os.replace(temp_file, self.cache_file)
+        except OSError as e:
+            return "Saving host facts went wrong: " + str(e), True
+        return "Saved host facts", False
+
+    def invalidate(self) -> None:
+        # Probes the host again, e.g. after installing interpreters
+        facts = self.probe()
+        with self.lock:
+            self.facts = facts
+            self.changed = True
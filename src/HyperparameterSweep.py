@@ -0,0 +1,412 @@
+from src.RunJournal import RunJournal
+import hashlib
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import queue
+import random
+import statistics
+import time
+
+
+class HyperparameterSweep(object):
+
+    # Grid search trains every combination, random search samples a fixed
+    # number of combinations per technique
+    modes = ["grid", "random"]
+
+    # Runs a rolling reward is compared against before a run may be
+    # stopped early
+    min_peers = 2
+
+    def __init__(self, atomic_envs_path, space, store_file, create_agent_spec,
+                 mode="grid", samples=10, workers=None, episodes=100,
+                 max_timesteps=20, window=10, grace_episodes=20, seed=0,
+                 outcomes=None) -> None:
+        """ Trains agent configurations in parallel worker processes
+
+        Parameters
+        ----------
+        atomic_envs_path :
+            folder holding the JSON specifications of the techniques
+        space :
+            search space with "techniques", "agents" and "hyperparameters",
+            which maps names to lists of values or, for random search, to
+            ranges like {"min": 1e-4, "max": 1e-2, "log": true}
+        store_file :
+            JSONL file all runs and episode rewards are recorded in, runs
+            already finished in it are not trained again
+        create_agent_spec :
+            callable receiving agent, max_timesteps and hyperparameters and
+            returning a Tensorforce agent specification
+        mode :
+            one of HyperparameterSweep.modes
+        samples :
+            configurations per technique drawn by random search
+        workers :
+            number of worker processes, defaults to the available CPUs
+        episodes :
+            training episodes per configuration
+        max_timesteps :
+            maximum length of an episode
+        window :
+            episodes the rolling reward is averaged over
+        grace_episodes :
+            episodes every run is trained before it may be stopped early
+        seed :
+            seed of the simulated backend and of random search
+        outcomes :
+            optional outcomes replayed by the simulated backend
+        """
+        if mode not in HyperparameterSweep.modes:
+            raise ValueError("Unknown sweep mode: " + str(mode))
+        self.atomic_envs_path = atomic_envs_path
+        self.store_file = store_file
+        self.create_agent_spec = create_agent_spec
+        self.episodes = episodes
+        self.max_timesteps = max_timesteps
+        self.window = window
+        self.grace_episodes = max(grace_episodes, window)
+        self.seed = seed
+        self.outcomes = outcomes
+        # Workers are pinned to the CPUs this process may run on
+        if hasattr(os, "sched_getaffinity"):
+            self.cpus = sorted(os.sched_getaffinity(0))
+        else:
+            self.cpus = [None] * (os.cpu_count() or 1)
+        self.workers = workers if workers else len(self.cpus)
+        self.configs = []
+        known = set()
+        for config in HyperparameterSweep.create_configs(space, mode, samples,
+                                                         random.Random(seed)):
+            # Hyperparameters an agent does not use, e.g. those of the
+            # random agent, would only train the same agent repeatedly
+            if create_agent_spec(config["agent"], max_timesteps,
+                                 config["hyperparameters"]) == \
+                    create_agent_spec(config["agent"], max_timesteps, None):
+                config["hyperparameters"] = {}
+            run_id = self.create_run_id(config)
+            if run_id not in known:
+                known.add(run_id)
+                self.configs.append(config)
+        # Runs by ID, with their configuration, episode rewards and status
+        self.runs = {}
+
+    @staticmethod
+    def load_space(filename) -> dict:
+        with open(filename) as space_file:
+            space = json.load(space_file)
+        if not isinstance(space, dict):
+            raise ValueError("Search space has to be a JSON object: " + filename)
+        return space
+
+    @staticmethod
+    def create_configs(space, mode, samples, rng) -> list:
+        # Expands the search space into one configuration per run
+        techniques = space.get("techniques") or []
+        agents = space.get("agents") or ["dql"]
+        hyperparameters = space.get("hyperparameters") or {}
+        if not techniques:
+            raise ValueError("Search space has no techniques")
+        names = sorted(hyperparameters)
+        configs = []
+        for technique in techniques:
+            if mode == "grid":
+                for name in names:
+                    if not isinstance(hyperparameters[name], list):
+                        raise ValueError("Grid search needs a list of values: " + name)
+                for agent in agents:
+                    for values in itertools.product(*[hyperparameters[name]
+                                                      for name in names]):
+                        configs.append({"technique": technique, "agent": agent,
+                                        "hyperparameters": dict(zip(names, values))})
+            else:
+                for _ in range(samples):
+                    configs.append({
+                        "technique": technique,
+                        "agent": rng.choice(agents),
+                        "hyperparameters": {
+                            name: HyperparameterSweep.sample(name, hyperparameters[name], rng)
+                            for name in names}
+                    })
+        return configs
+
+    @staticmethod
+    def sample(name, values, rng):
+        if isinstance(values, list):
+            return rng.choice(values)
+        if not isinstance(values, dict) or "min" not in values or "max" not in values:
+            raise ValueError("Hyperparameter needs a list of values or a range: " + name)
+        low, high = values["min"], values["max"]
+        if values.get("log"):
+            return math.exp(rng.uniform(math.log(low), math.log(high)))
+        if isinstance(low, int) and isinstance(high, int):
+            return rng.randint(low, high)
+        return rng.uniform(low, high)
+
+    def create_run_id(self, config) -> str:
+        # Identical configurations trained with the same options share
+        # their ID, so a resumed sweep finds the runs it has already
+        # finished, while changed options train them again
+        key = json.dumps([config, self.create_training_key()], sort_keys=True)
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+    def create_training_key(self) -> dict:
+        # Training options deciding the rewards of a run, recorded outcomes
+        # are represented by their digest
+        outcomes = None
+        if self.outcomes is not None:
+            recorded = sorted([list(key), records] for key, records in self.outcomes.items())
+            outcomes = hashlib.sha1(json.dumps(recorded, sort_keys=True)
+                                    .encode("utf-8")).hexdigest()
+        return {
+            "episodes": self.episodes,
+            "max_timesteps": self.max_timesteps,
+            "seed": self.seed,
+            "outcomes": outcomes
+        }
+
+    def load_store(self) -> None:
+        # Replays the store, a run started again discards its old rewards
+        self.runs = {}
+        try:
+            store_file = open(self.store_file, "rb")
+        except OSError:
+            return
+        with store_file:
+            for line in store_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                run = self.runs.get(record.get("run"))
+                if "config" in record:
+                    self.runs[record["run"]] = {"config": record["config"],
+                                                "rewards": [], "status": "started",
+                                                "error": None}
+                elif run is None:
+                    continue
+                elif "reward" in record:
+                    run["rewards"].append(record["reward"])
+                elif "status" in record:
+                    run["status"] = record["status"]
+                    run["error"] = record.get("error")
+
+    def rolling_reward(self, rewards, episodes=None) -> float:
+        # Mean reward of the window ending after the given episode
+        episodes = len(rewards) if episodes is None else episodes
+        window = rewards[max(0, episodes - self.window):episodes]
+        return sum(window) / len(window) if window else float("-inf")
+
+    def is_dominated(self, run_id) -> bool:
+        """ Median stopping rule: a run is stopped once its rolling reward
+        is below the median of the rolling rewards other runs of the same
+        technique had after the same number of episodes
+        """
+        run = self.runs[run_id]
+        episodes = len(run["rewards"])
+        if episodes < self.grace_episodes:
+            return False
+        peers = [self.rolling_reward(other["rewards"], episodes)
+                 for other_id, other in self.runs.items()
+                 if other_id != run_id and
+                 other["config"]["technique"] == run["config"]["technique"] and
+                 len(other["rewards"]) >= episodes]
+        if len(peers) < HyperparameterSweep.min_peers:
+            return False
+        return self.rolling_reward(run["rewards"]) < statistics.median(peers)
+
+    def run(self) -> list:
+        """ Trains all configurations not finished in the store yet
+
+        Returns
+        ----------
+        rows :
+            comparison of all runs of the sweep, see summarize
+        """
+        self.load_store()
+        pending = [config for config in self.configs
+                   if self.runs.get(self.create_run_id(config), {})
+                   .get("status") not in ["done", "stopped"]]
+        directory = os.path.dirname(self.store_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        store = RunJournal(self.store_file)
+        tasks = multiprocessing.Queue()
+        results = multiprocessing.Queue()
+        # Every worker slot holds the number of the task to be stopped, so
+        # a late stop never hits the next run of the worker
+        stops = multiprocessing.Array("l", [-1] * self.workers)
+        numbers = {}
+        slots = {}
+        for number, config in enumerate(pending):
+            run_id = self.create_run_id(config)
+            numbers[run_id] = number
+            tasks.put((number, run_id, config,
+                       self.create_agent_spec(config["agent"], self.max_timesteps,
+                                              config["hyperparameters"])))
+        processes = []
+        for slot in range(min(self.workers, len(pending))):
+            tasks.put(None)
+            process = multiprocessing.Process(
+                target=HyperparameterSweep.work,
+                args=(slot, self.cpus[slot % len(self.cpus)], tasks, results, stops,
+                      self.create_training_options()),
+                daemon=True)
+            process.start()
+            processes.append(process)
+        outstanding = len(pending)
+        try:
+            while outstanding > 0:
+                try:
+                    message = results.get(timeout=1.0)
+                except queue.Empty:
+                    if not any(process.is_alive() for process in processes):
+                        break
+                    continue
+                kind, run_id = message[0], message[1]
+                if kind == "start":
+                    slots[run_id] = message[2]
+                    config = pending[numbers[run_id]]
+                    self.runs[run_id] = {"config": config, "rewards": [],
+                                         "status": "started", "error": None}
+                    store.write({"run": run_id, "config": config, "start": time.time()})
+                elif kind == "episode":
+                    self.runs[run_id]["rewards"].append(message[2])
+                    store.write({"run": run_id, "reward": message[2]})
+                    if self.is_dominated(run_id):
+                        stops[slots[run_id]] = numbers[run_id]
+                else:
+                    self.runs[run_id]["status"] = message[2]
+                    self.runs[run_id]["error"] = message[3]
+                    record = {"run": run_id, "status": message[2]}
+                    if message[3] is not None:
+                        record["error"] = message[3]
+                    store.write(record, force_sync=True)
+                    outstanding -= 1
+        finally:
+            for process in processes:
+                process.join(5.0)
+                if process.is_alive():
+                    process.terminate()
+            store.close()
+        return self.summarize()
+
+    def create_training_options(self) -> dict:
+        # Everything a worker needs besides its tasks, has to be picklable
+        return {
+            "atomic_envs_path": self.atomic_envs_path,
+            "episodes": self.episodes,
+            "max_timesteps": self.max_timesteps,
+            "seed": self.seed,
+            "outcomes": self.outcomes
+        }
+
+    @staticmethod
+    def work(slot, cpu, tasks, results, stops, options) -> None:
+        # Entry point of a worker process, trains one configuration after
+        # the other until it receives None
+        if cpu is not None and hasattr(os, "sched_setaffinity"):
+            try:
+                os.sched_setaffinity(0, {cpu})
+            except OSError:
+                pass
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            number, run_id, config, agent_spec = task
+            results.put(("start", run_id, slot))
+            try:
+                status = HyperparameterSweep.train(
+                    config, agent_spec, options,
+                    lambda reward: results.put(("episode", run_id, reward)),
+                    lambda: stops[slot] == number)
+            except Exception as e:
+                results.put(("finish", run_id, "failed", str(e)))
+                continue
+            results.put(("finish", run_id, status, None))
+
+    @staticmethod
+    def train(config, agent_spec, options, report, stopped) -> str:
+        # Trains against the simulated backend, real commands of parallel
+        # runs would interfere with each other on the same host
+        from tensorforce import Agent, Environment
+        from src.EnvironmentFactory import EnvironmentFactory
+        from src.SimulatedBackend import SimulatedBackend
+        backend = SimulatedBackend(options["seed"], options["outcomes"])
+        environment = Environment.create(
+            environment=EnvironmentFactory.create(options["atomic_envs_path"],
+                                                  config["technique"],
+                                                  runner=backend),
+            max_episode_timesteps=options["max_timesteps"])
+        agent = Agent.create(agent=agent_spec, environment=environment)
+        status = "done"
+        try:
+            for _ in range(options["episodes"]):
+                states = environment.reset()
+                terminal = False
+                episode_reward = 0.0
+                while not terminal:
+                    actions = agent.act(states=states)
+                    states, terminal, reward = environment.execute(actions=actions)
+                    agent.observe(terminal=terminal, reward=reward)
+                    episode_reward += float(reward)
+                report(episode_reward)
+                if stopped():
+                    status = "stopped"
+                    break
+        finally:
+            agent.close()
+            environment.close()
+            backend.close()
+        return status
+
+    def summarize(self) -> list:
+        # One row per configuration of the sweep, the best rolling reward
+        # of every technique first
+        rows = []
+        for config in self.configs:
+            run = self.runs.get(self.create_run_id(config))
+            rewards = run["rewards"] if run is not None else []
+            rows.append({
+                "run": self.create_run_id(config),
+                "technique": config["technique"],
+                "agent": config["agent"],
+                "hyperparameters": config["hyperparameters"],
+                "status": run["status"] if run is not None else "pending",
+                "episodes": len(rewards),
+                "reward": self.rolling_reward(rewards) if rewards else None,
+                "best": max(self.rolling_reward(rewards, episodes)
+                            for episodes in range(1, len(rewards) + 1))
+                if rewards else None,
+                "error": run["error"] if run is not None else None
+            })
+        rows.sort(key=lambda row: (row["technique"],
+                                   -row["reward"] if row["reward"] is not None
+                                   else float("inf")))
+        return rows
+
+    @staticmethod
+    def format_table(rows) -> list:
+        # Formats the rows of summarize as aligned text lines
+        header = ["technique", "run", "agent", "status", "episodes", "reward",
+                  "best", "hyperparameters"]
+        lines = [header]
+        for row in rows:
+            lines.append([
+                row["technique"], row["run"], row["agent"],
+                row["status"] + (": " + row["error"] if row["error"] else ""),
+                str(row["episodes"]),
+                "-" if row["reward"] is None else "{:.3f}".format(row["reward"]),
+                "-" if row["best"] is None else "{:.3f}".format(row["best"]),
+                ", ".join(name + "=" + "{:g}".format(value)
+                          if isinstance(value, float) else name + "=" + str(value)
+                          for name, value in sorted(row["hyperparameters"].items()))
+            ])
+        widths = [max(len(line[column]) for line in lines)
+                  for column in range(len(header) - 1)]
+        return ["  ".join(cell.ljust(width) for cell, width in zip(line, widths)) +
+                "  " + line[-1] for line in lines]
@@ -0,0 +1,109 @@
+from src.Helper import Helper
+import hashlib
+import json
+import os
+import platform
+import threading
+import time
+import typing
+
+
+class PrereqCache(object):
+
+    def __init__(self, cache_file=None, ttl=86400, host_fingerprint=None) -> None:
+        # Satisfied prerequisites are persisted in the cache file and stay
+        # valid for ttl seconds, without a cache file they are only
+        # remembered for the current run
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.host_fingerprint = host_fingerprint
+        if self.host_fingerprint is None:
+            self.host_fingerprint = PrereqCache.determine_host_fingerprint()
+        self.satisfied = {}
+        self.failed = set()
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        if self.cache_file is not None:
+            self.load()
+
+    @staticmethod
+    def determine_host_fingerprint() -> str:
+        # Prerequisites depend on the machine and the privilege they were
+        # checked with
+        return "|".join([Helper.determine_os(), platform.node(),
+                         str(bool(Helper.determine_privilege()))])
+
+    def create_key(self, executor, command) -> str:
+        key = "\0".join([executor, command, self.host_fingerprint])
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def lock_for(self, executor, command) -> threading.Lock:
+        # Returns a lock per prerequisite, so atomics running concurrently
+        # do not fetch the same prerequisite twice
+        key = self.create_key(executor, command)
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    def is_satisfied(self, executor, command) -> bool:
+        key = self.create_key(executor, command)
+        with self.lock:
+            checked_at = self.satisfied.get(key)
+            if checked_at is None:
+                return False
+            if time.time() - checked_at > self.ttl:
+                del self.satisfied[key]
+                return False
+            return True
+
+    def has_failed(self, executor, command) -> bool:
+        # Failed prerequisites are only remembered for the current run
+        with self.lock:
+            return self.create_key(executor, command) in self.failed
+
+    def mark_satisfied(self, executor, command) -> None:
+        key = self.create_key(executor, command)
+        with self.lock:
+            self.satisfied[key] = time.time()
+            self.failed.discard(key)
+
+    def mark_failed(self, executor, command) -> None:
+        key = self.create_key(executor, command)
+        with self.lock:
+            self.satisfied.pop(key, None)
+            self.failed.add(key)
+
+    def invalidate(self, executor=None, command=None) -> None:
+        # Forgets a single prerequisite, or all of them if none is given
+        with self.lock:
+            if executor is None or command is None:
+                self.satisfied = {}
+                self.failed = set()
+            else:
+                key = self.create_key(executor, command)
+                self.satisfied.pop(key, None)
+                self.failed.discard(key)
+
+    def load(self) -> None:
+        try:
+            with open(self.cache_file) as cache_file:
+                satisfied = json.load(cache_file)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        with self.lock:
+            self.satisfied = {key: checked_at for key, checked_at
+                              in satisfied.items() if now - checked_at <= self.ttl}
+
+    def save(self) -> typing.Tuple[str, bool]:
+        if self.cache_file is None:
+            return "Prerequisite cache is not persisted", False
+        with self.lock:
+            satisfied = dict(self.satisfied)
+        temp_file = self.cache_file + ".tmp"
+        try:
+            with open(temp_file, "w") as cache_file:
+                json.dump(satisfied, cache_file)
+            os.replace(temp_file, self.cache_file)
+        except OSError as e:
+            return "Saving prerequisite cache went wrong: " + str(e), True
+        return "Saved prerequisite cache", False
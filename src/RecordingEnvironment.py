@@ -0,0 +1,76 @@
+from src.AbstractEnvironment import AbstractEnvironment
+import threading
+import time
+
+
+class RecordingEnvironment(AbstractEnvironment):
+
+    def __init__(self, environment, writer):
+        """ Records every transition of a wrapped environment
+
+        Parameters
+        ----------
+        environment :
+            environment whose transitions are recorded
+        writer :
+            ExperienceWriter the transitions are appended to
+        """
+        super().__init__()
+        self.environment = environment
+        self.writer = writer
+        # Rewards evaluated asynchronously are credited to the transition
+        # they belong to
+        self.transition_indices = {}
+        self.transition_lock = threading.Lock()
+        if hasattr(environment, "add_reward_listener"):
+            environment.add_reward_listener(self.credit_reward)
+        self.last_states = None
+        self.last_index = None
+        self.last_terminal = False
+
+    def states(self):
+        return self.environment.states()
+
+    def actions(self):
+        return self.environment.actions()
+
+    def reset(self):
+        # An episode aborted from outside, e.g. by max_episode_timesteps,
+        # ends with the last recorded transition
+        if self.last_index is not None and not self.last_terminal:
+            self.writer.update(self.last_index, "terminal", 2)
+        self.last_index = None
+        self.last_states = self.environment.reset()
+        return self.last_states
+
+    def execute(self, actions):
+        start = time.monotonic()
+        next_states, terminal, reward = self.environment.execute(actions)
+        # The transition holds the states the actions were chosen in
+        with self.transition_lock:
+            self.last_index = self.writer.append(self.last_states, actions, reward,
+                                                 terminal, time.monotonic() - start)
+            transition_id = getattr(self.environment, "last_transition_id", None)
+            if getattr(self.environment, "reward_pipeline", None) is not None:
+                self.transition_indices[transition_id] = self.last_index
+        self.last_states = next_states
+        self.last_terminal = terminal
+        return next_states, terminal, reward
+
+    def credit_reward(self, transition_id, status, reward):
+        with self.transition_lock:
+            index = self.transition_indices.pop(transition_id, None)
+        if index is not None:
+            self.writer.update(index, "reward", reward)
+
+    def calc_reward(self, status):
+        return self.environment.calc_reward(status)
+
+    def max_episode_timesteps(self):
+        return self.environment.max_episode_timesteps()
+
+    def close(self):
+        if self.last_index is not None and not self.last_terminal:
+            self.writer.update(self.last_index, "terminal", 2)
+        self.writer.close()
+        self.environment.close()
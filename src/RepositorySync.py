@@ -0,0 +1,253 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import typing
+import zlib
+
+
+class RepositorySync(object):
+
+    def __init__(self, target_path, archive_file=None, member_prefix="atomics/",
+                 chunk_size=1 << 20) -> None:
+        """ Incrementally updates a folder from the atomics of a repository
+
+        Parameters
+        ----------
+        target_path :
+            folder holding the synced files, e.g. tests/official/
+        archive_file :
+            optional file downloaded archives are kept in, its ETag allows
+            to skip unchanged downloads
+        member_prefix :
+            only files below this folder of the repository are synced
+        chunk_size :
+            bytes read and written at once while streaming
+        """
+        self.target_path = os.path.normpath(target_path)
+        self.archive_file = archive_file
+        self.member_prefix = member_prefix
+        self.chunk_size = chunk_size
+        self.stats = {"written": 0, "unchanged": 0, "removed": 0}
+        # Relative paths of all files in the staged folder
+        self.synced_paths = set()
+
+    def sync(self, source) -> typing.Tuple[str, bool]:
+        """ Syncs the target folder with a source
+
+        Parameters
+        ----------
+        source :
+            URL of a zip archive, path of a local zip archive or path of a
+            local mirror, i.e. a checkout containing the member prefix
+        """
+        self.stats = {"written": 0, "unchanged": 0, "removed": 0}
+        self.synced_paths = set()
+        try:
+            self.recover()
+            if os.path.isdir(source):
+                self.sync_directory(source)
+            elif os.path.isfile(source):
+                self.sync_archive(source)
+            else:
+                archive_file, changed = self.download(source)
+                if not changed and os.path.isdir(self.target_path):
+                    return "Atomic tests are up to date", False
+                self.sync_archive(archive_file)
+                if self.archive_file is None:
+                    os.remove(archive_file)
+        except Exception as e:
+            return "Syncing atomic tests went wrong: " + str(e), True
+        return "Synced atomic tests: " + str(self.stats["written"]) + \
+            " written, " + str(self.stats["unchanged"]) + " unchanged, " + \
+            str(self.stats["removed"]) + " removed", False
+
+    def download(self, url) -> typing.Tuple[str, bool]:
+        # Streams the archive to disk instead of keeping it in memory and
+        # returns its file and whether it changed since the last download
+        from urllib.error import HTTPError
+        from urllib.request import Request, urlopen
+        archive_file = self.archive_file
+        if archive_file is None:
+            descriptor, archive_file = tempfile.mkstemp(suffix=".zip")
+            os.close(descriptor)
+        etag_file = archive_file + ".etag"
+        headers = {}
+        if self.archive_file is not None and os.path.isfile(archive_file) and \
+                os.path.isfile(etag_file):
+            with open(etag_file) as f:
+                headers["If-None-Match"] = f.read().strip()
+        try:
+            with urlopen(Request(url, headers=headers)) as response:
+                temp_file = archive_file + ".tmp"
+                with open(temp_file, "wb") as f:
+                    shutil.copyfileobj(response, f, self.chunk_size)
+                etag = response.headers.get("ETag")
+        except HTTPError as e:
+            if e.code == 304:
+                return archive_file, False
+            raise
+        os.replace(temp_file, archive_file)
+        if etag is not None and self.archive_file is not None:
+            with open(etag_file, "w") as f:
+                f.write(etag)
+        return archive_file, True
+
+    def recover(self) -> None:
+        # A sync interrupted between the two renames of swap leaves the
+        # old tree in the backup folder, it is moved back before syncing
+        backup_path = self.target_path + ".old"
+        if not os.path.isdir(backup_path):
+            return
+        if os.path.isdir(self.target_path):
+            shutil.rmtree(backup_path, ignore_errors=True)
+        else:
+            os.rename(backup_path, self.target_path)
+
+    def create_staging_path(self) -> str:
+        # The staging folder is a sibling of the target, so both are on
+        # the same file system and can be swapped by renaming
+        staging_path = self.target_path + ".sync"
+        shutil.rmtree(staging_path, ignore_errors=True)
+        os.makedirs(staging_path)
+        return staging_path
+
+    def find_member_root(self, names) -> str:
+        # GitHub archives put the repository into a top level folder, e.g.
+        # atomic-red-team-master/atomics/
+        for name in names:
+            index = name.find(self.member_prefix)
+            if index == 0 or (index > 0 and name[index - 1] == "/"):
+                return name[:index + len(self.member_prefix)]
+        raise ValueError("No " + self.member_prefix + " folder found in source")
+
+    @staticmethod
+    def check_relative_path(relative_path) -> None:
+        # Members must not escape the target folder
+        normalized = os.path.normpath(relative_path)
+        if os.path.isabs(normalized) or normalized.startswith(".."):
+            raise ValueError("Illegal path in source: " + relative_path)
+
+    def sync_archive(self, archive_file) -> None:
+        from zipfile import ZipFile
+        staging_path = self.create_staging_path()
+        try:
+            with ZipFile(archive_file) as archive:
+                members = archive.infolist()
+                root = self.find_member_root([member.filename for member in members])
+                for member in members:
+                    if not member.filename.startswith(root) or member.is_dir():
+                        continue
+                    relative_path = member.filename[len(root):]
+                    RepositorySync.check_relative_path(relative_path)
+                    # Zip archives store the CRC32 of every member, so unchanged
+                    # files are found without decompressing them
+                    existing = os.path.join(self.target_path, relative_path)
+                    if RepositorySync.file_matches(existing, member.file_size,
+                                                   member.CRC, RepositorySync.crc32_file):
+                        self.keep(existing, staging_path, relative_path)
+                        continue
+                    with archive.open(member) as source:
+                        self.write(source, staging_path, relative_path)
+            self.swap(staging_path)
+        finally:
+            shutil.rmtree(staging_path, ignore_errors=True)
+
+    def sync_directory(self, mirror_path) -> None:
+        if os.path.isdir(os.path.join(mirror_path, self.member_prefix)):
+            mirror_path = os.path.join(mirror_path, self.member_prefix)
+        staging_path = self.create_staging_path()
+        try:
+            for root, dirs, files in os.walk(mirror_path):
+                dirs[:] = [d for d in dirs if d != ".git"]
+                for f in files:
+                    filename = os.path.join(root, f)
+                    relative_path = os.path.relpath(filename, mirror_path)
+                    existing = os.path.join(self.target_path, relative_path)
+                    if RepositorySync.file_matches(existing, os.path.getsize(filename),
+                                                   lambda: RepositorySync.sha1_file(filename),
+                                                   RepositorySync.sha1_file):
+                        self.keep(existing, staging_path, relative_path)
+                        continue
+                    with open(filename, "rb") as source:
+                        self.write(source, staging_path, relative_path)
+            self.swap(staging_path)
+        finally:
+            shutil.rmtree(staging_path, ignore_errors=True)
+
+    @staticmethod
+    def file_matches(filename, size, checksum, hash_function) -> bool:
+        # Compares sizes first, hashes are only computed for equal sizes.
+        # The checksum of the source may be a callable computing it
+        try:
+            if os.path.getsize(filename) != size:
+                return False
+        except OSError:
+            return False
+        if callable(checksum):
+            checksum = checksum()
+        return hash_function(filename) == checksum
+
+    @staticmethod
+    def crc32_file(filename) -> int:
+        crc = 0
+        with open(filename, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                crc = zlib.crc32(chunk, crc)
+        return crc
+
+    @staticmethod
+    def sha1_file(filename) -> str:
+        sha1 = hashlib.sha1()
+        with open(filename, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                sha1.update(chunk)
+        return sha1.hexdigest()
+
+    def keep(self, existing, staging_path, relative_path) -> None:
+        # Unchanged files are hard linked, they keep their modification
+        # time and therefore their entries in the test index
+        destination = os.path.join(staging_path, relative_path)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        try:
+            os.link(existing, destination)
+        except OSError:
+            shutil.copy2(existing, destination)
+        self.synced_paths.add(os.path.normpath(relative_path))
+        self.stats["unchanged"] += 1
+
+    def write(self, source, staging_path, relative_path) -> None:
+        destination = os.path.join(staging_path, relative_path)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        with open(destination, "wb") as f:
+            shutil.copyfileobj(source, f, self.chunk_size)
+        self.synced_paths.add(os.path.normpath(relative_path))
+        self.stats["written"] += 1
+
+    def swap(self, staging_path) -> None:
+        # Replaces the target by the staged folder with two renames, so
+        # readers see either the old or the new tree but never a mix
+        if os.path.isdir(self.target_path):
+            self.stats["removed"] = self.count_removed_files()
+            backup_path = self.target_path + ".old"
+            shutil.rmtree(backup_path, ignore_errors=True)
+            os.rename(self.target_path, backup_path)
+            try:
+                os.rename(staging_path, self.target_path)
+            except OSError:
+                os.rename(backup_path, self.target_path)
+                raise
+            shutil.rmtree(backup_path, ignore_errors=True)
+        else:
+            os.makedirs(os.path.dirname(self.target_path) or ".", exist_ok=True)
+            os.rename(staging_path, self.target_path)
+
+    def count_removed_files(self) -> int:
+        # Counts the files of the target missing from the staged folder
+        removed = 0
+        for root, _, files in os.walk(self.target_path):
+            for f in files:
+                relative_path = os.path.relpath(os.path.join(root, f), self.target_path)
+                if relative_path not in self.synced_paths:
+                    removed += 1
+        return removed
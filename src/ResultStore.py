@@ -0,0 +1,311 @@
+import platform
+import sqlite3
+import threading
+import time
+import typing
+
+
+class ResultStore(object):
+
+    # Bump whenever the schema changes, stores of other versions are
+    # rejected
+    schema_version = 1
+
+    # Results keep the last outcome of every atomic per run. Coverage holds
+    # the counts per run and technique and is maintained by triggers while
+    # results are written, so reports never aggregate the results table
+    schema = [
+        """CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            host TEXT NOT NULL,
+            plan TEXT,
+            started REAL NOT NULL,
+            finished REAL)""",
+        """CREATE TABLE IF NOT EXISTS results (
+            run INTEGER NOT NULL,
+            guid TEXT NOT NULL,
+            technique TEXT NOT NULL,
+            host TEXT NOT NULL,
+            executed INTEGER NOT NULL,
+            success INTEGER NOT NULL,
+            exit_code INTEGER,
+            duration REAL,
+            status TEXT,
+            recorded REAL NOT NULL,
+            PRIMARY KEY (run, guid)) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS coverage (
+            run INTEGER NOT NULL,
+            technique TEXT NOT NULL,
+            atomics INTEGER NOT NULL,
+            executed INTEGER NOT NULL,
+            succeeded INTEGER NOT NULL,
+            PRIMARY KEY (run, technique)) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS tactics (
+            technique TEXT NOT NULL,
+            tactic TEXT NOT NULL,
+            PRIMARY KEY (technique, tactic)) WITHOUT ROWID""",
+        """CREATE TRIGGER IF NOT EXISTS results_insert AFTER INSERT ON results
+        BEGIN
+            INSERT INTO coverage (run, technique, atomics, executed, succeeded)
+            VALUES (NEW.run, NEW.technique, 1, NEW.executed, NEW.success)
+            ON CONFLICT (run, technique) DO UPDATE SET
+                atomics = atomics + 1,
+                executed = executed + NEW.executed,
+                succeeded = succeeded + NEW.success;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS results_update AFTER UPDATE ON results
+        BEGIN
+            UPDATE coverage SET
+                executed = executed - OLD.executed + NEW.executed,
+                succeeded = succeeded - OLD.success + NEW.success
+            WHERE run = NEW.run AND technique = NEW.technique;
+        END"""
+    ]
+
+    # Later results of an atomic replace earlier ones, except skips of
+    # atomics that were executed before, e.g. when a run is resumed
+    upsert = """INSERT INTO results (run, guid, technique, host, executed, success,
+            exit_code, duration, status, recorded)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (run, guid) DO UPDATE SET
+            host = excluded.host, executed = excluded.executed,
+            success = excluded.success, exit_code = excluded.exit_code,
+            duration = excluded.duration, status = excluded.status,
+            recorded = excluded.recorded
+        WHERE excluded.executed OR NOT results.executed"""
+
+    def __init__(self, filename, batch_size=256) -> None:
+        """ Stores the results of runs in an SQLite database and aggregates
+        them into coverage per technique and tactic
+
+        Parameters
+        ----------
+        filename :
+            database file, created if it does not exist
+        batch_size :
+            results buffered before they are written in one transaction
+        """
+        self.filename = filename
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.pending = []
+        self.run = None
+        self.run_host = None
+        # Results arrive from the threads of the executor, all access is
+        # serialized by the lock
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version not in [0, ResultStore.schema_version]:
+            raise ValueError("Unsupported result store version " + str(version) +
+                             ": " + filename)
+        with self.connection:
+            for statement in ResultStore.schema:
+                self.connection.execute(statement)
+            self.connection.execute("PRAGMA user_version=" +
+                                    str(ResultStore.schema_version))
+
+    def start_run(self, name=None, plan=None, host=None) -> int:
+        """ Starts recording a run, results of a run with the same name
+        are continued, e.g. when it is resumed
+
+        Parameters
+        ----------
+        name :
+            optional name of the run, defaults to the start time and host
+        plan :
+            optional digest of the execution plan, see RunJournal
+        host :
+            host or campaign the run belongs to, defaults to this host
+        """
+        host = host or platform.node()
+        started = time.time()
+        if name is None:
+            name = time.strftime("%Y%m%d-%H%M%S", time.localtime(started)) + "-" + host
+        with self.lock, self.connection:
+            row = self.connection.execute("SELECT id FROM runs WHERE name = ?",
+                                          (name,)).fetchone()
+            if row is not None:
+                self.run = row[0]
+                self.connection.execute("UPDATE runs SET finished = NULL WHERE id = ?",
+                                        (self.run,))
+            else:
+                self.run = self.connection.execute(
+                    "INSERT INTO runs (name, host, plan, started) VALUES (?, ?, ?, ?)",
+                    (name, host, plan, started)).lastrowid
+            self.run_host = host
+        return self.run
+
+    def record(self, entry, result) -> None:
+        # Result listener of Executor and CampaignCoordinator
+        row = (self.run, result["guid"], entry["technique"],
+               result.get("worker") or self.run_host,
+               int(bool(result["executed"])), int(bool(result["success"])),
+               result.get("exit_code"), result.get("duration"),
+               result.get("status", ""), time.time())
+        with self.lock:
+            self.pending.append(row)
+            if len(self.pending) >= self.batch_size:
+                self.write_pending()
+
+    def write_pending(self) -> None:
+        # Has to be called with the lock held
+        if not self.pending:
+            return
+        with self.connection:
+            self.connection.executemany(ResultStore.upsert, self.pending)
+        self.pending = []
+
+    def flush(self) -> None:
+        with self.lock:
+            self.write_pending()
+
+    def finish_run(self) -> None:
+        with self.lock:
+            self.write_pending()
+            if self.run is not None:
+                with self.connection:
+                    self.connection.execute("UPDATE runs SET finished = ? WHERE id = ?",
+                                            (time.time(), self.run))
+
+    def close(self) -> None:
+        with self.lock:
+            if self.connection is None:
+                return
+            self.write_pending()
+            self.connection.close()
+            self.connection = None
+
+    def set_tactics(self, tactics) -> None:
+        """ Replaces the technique to tactic mapping the coverage matrices
+        are keyed to, as loaded by SelectionEngine.load_tactics_from_csv
+        """
+        rows = [(technique, tactic) for technique, technique_tactics in tactics.items()
+                for tactic in technique_tactics]
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM tactics")
+            self.connection.executemany("INSERT OR IGNORE INTO tactics VALUES (?, ?)",
+                                        rows)
+
+    def list_runs(self) -> list:
+        with self.lock:
+            rows = self.connection.execute(
+                """SELECT runs.id, runs.name, runs.host, runs.started, runs.finished,
+                    COALESCE(SUM(coverage.atomics), 0),
+                    COALESCE(SUM(coverage.succeeded), 0), runs.plan
+                FROM runs LEFT JOIN coverage ON coverage.run = runs.id
+                GROUP BY runs.id ORDER BY runs.id""").fetchall()
+        return [{"id": row[0], "name": row[1], "host": row[2], "started": row[3],
+                 "finished": row[4], "atomics": row[5], "succeeded": row[6],
+                 "plan": row[7]}
+                for row in rows]
+
+    def find_latest_run(self, host=None) -> dict:
+        # Returns the last run of a host or campaign, None without runs
+        host = host or platform.node()
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT name, plan FROM runs WHERE host = ? ORDER BY id DESC LIMIT 1",
+                (host,)).fetchone()
+        if row is None:
+            return None
+        return {"name": row[0], "plan": row[1]}
+
+    def find_run(self, reference) -> dict:
+        """ Returns the run with a name or ID, "latest" and "previous" refer
+        to the last two runs, raises a ValueError for unknown runs
+        """
+        runs = self.list_runs()
+        if reference in ["latest", "previous"]:
+            position = -1 if reference == "latest" else -2
+            if len(runs) < -position:
+                raise ValueError("Not enough runs in the result store for " + reference)
+            return runs[position]
+        for run in runs:
+            if run["name"] == reference or str(run["id"]) == reference:
+                return run
+        raise ValueError("Unknown run: " + reference)
+
+    def get_technique_coverage(self, run_id) -> dict:
+        # Maps technique IDs to (atomics, executed, succeeded)
+        with self.lock:
+            rows = self.connection.execute(
+                """SELECT technique, atomics, executed, succeeded FROM coverage
+                WHERE run = ?""", (run_id,)).fetchall()
+        return {row[0]: tuple(row[1:]) for row in rows}
+
+    def get_tactic_coverage(self, run_id) -> dict:
+        """ Maps every tactic of the mapping to the number of its
+        techniques, of those with an executed atomic and of those with a
+        succeeded atomic
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                """SELECT tactics.tactic, COUNT(*),
+                    COALESCE(SUM(coverage.executed > 0), 0),
+                    COALESCE(SUM(coverage.succeeded > 0), 0)
+                FROM tactics LEFT JOIN coverage
+                    ON coverage.run = ? AND coverage.technique = tactics.technique
+                GROUP BY tactics.tactic ORDER BY tactics.tactic""",
+                (run_id,)).fetchall()
+        return {row[0]: tuple(row[1:]) for row in rows}
+
+    def get_uncovered_techniques(self, run_id) -> list:
+        # Techniques of the mapping without a succeeded atomic in the run
+        with self.lock:
+            rows = self.connection.execute(
+                """SELECT DISTINCT tactics.technique FROM tactics LEFT JOIN coverage
+                    ON coverage.run = ? AND coverage.technique = tactics.technique
+                WHERE COALESCE(coverage.succeeded, 0) = 0
+                ORDER BY tactics.technique""", (run_id,)).fetchall()
+        return [row[0] for row in rows]
+
+    def diff_techniques(self, run_id, other_run_id) -> list:
+        """ Returns (technique, coverage, other coverage) for every technique
+        whose counts differ between two runs, coverage is None for
+        techniques without results in a run
+        """
+        coverage = self.get_technique_coverage(run_id)
+        other_coverage = self.get_technique_coverage(other_run_id)
+        differences = []
+        for technique in sorted(set(coverage) | set(other_coverage)):
+            counts = coverage.get(technique)
+            other_counts = other_coverage.get(technique)
+            if counts != other_counts:
+                differences.append((technique, counts, other_counts))
+        return differences
+
+    def diff_atomics(self, run_id, other_run_id) -> typing.Dict[str, list]:
+        """ Returns the GUIDs of atomics which failed, succeeded, appeared
+        or disappeared in the other run, compared to the first run
+
+        Both sides are joined on the primary key, so runs with millions of
+        results are compared without sorting them
+        """
+        changes = {"regressed": [], "fixed": [], "added": [], "removed": []}
+        with self.lock:
+            rows = self.connection.execute(
+                """SELECT other.guid, other.technique, results.success, other.success
+                FROM results AS other LEFT JOIN results
+                    ON results.run = ? AND results.guid = other.guid
+                WHERE other.run = ? AND (results.guid IS NULL
+                    OR results.success != other.success)
+                ORDER BY other.technique, other.guid""",
+                (run_id, other_run_id)).fetchall()
+            removed = self.connection.execute(
+                """SELECT results.guid, results.technique FROM results
+                WHERE results.run = ? AND NOT EXISTS (SELECT 1 FROM results AS other
+                    WHERE other.run = ? AND other.guid = results.guid)
+                ORDER BY results.technique, results.guid""",
+                (run_id, other_run_id)).fetchall()
+        for guid, technique, success, other_success in rows:
+            if success is None:
+                changes["added"].append((technique, guid))
+            elif other_success:
+                changes["fixed"].append((technique, guid))
+            else:
+                changes["regressed"].append((technique, guid))
+        changes["removed"] = [(technique, guid) for guid, technique in removed]
+        return changes
@@ -0,0 +1,200 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+import os
+import re
+import threading
+import time
+
+
+class LogDetectionChecker(object):
+
+    def __init__(self, log_file, pattern, poll_interval=0.5) -> None:
+        # Local stand-in for a detection source, an action counts as
+        # detected once a line matching pattern is appended to log_file
+        self.log_file = log_file
+        self.pattern = re.compile(pattern.encode("utf-8"))
+        self.poll_interval = poll_interval
+        self.offset = 0
+
+    def mark(self) -> int:
+        # Remembers the current end of the log, only lines written
+        # afterwards are attributed to the next action
+        try:
+            self.offset = os.path.getsize(self.log_file)
+        except OSError:
+            self.offset = 0
+        return self.offset
+
+    def check(self, offset, timeout=0.0) -> bool:
+        # Polls the log from offset until a line matches or timeout expires
+        deadline = time.monotonic() + timeout
+        remainder = b""
+        while True:
+            try:
+                with open(self.log_file, "rb") as log:
+                    log.seek(offset)
+                    data = log.read()
+            except OSError:
+                data = b""
+            if data:
+                offset += len(data)
+                lines = (remainder + data).split(b"\n")
+                remainder = lines.pop()
+                for line in lines:
+                    if self.pattern.search(line):
+                        return True
+            if time.monotonic() >= deadline:
+                return bool(remainder) and bool(self.pattern.search(remainder))
+            time.sleep(self.poll_interval)
+
+    def __call__(self) -> bool:
+        return self.check(self.offset)
+
+
+class RewardPipeline(object):
+
+    def __init__(self, max_pending=32, max_checks=32, timeout=60.0) -> None:
+        # Evaluates reward conditions of transitions in the background.
+        # At most max_pending transitions are queued or waiting for their
+        # delay at once, submit blocks until one of them is evaluated. Their
+        # checks run on a separate pool so waiting cannot block checking
+        self.transitions = ThreadPoolExecutor(max_workers=max_pending)
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.checks = ThreadPoolExecutor(max_workers=max_checks)
+        # Upper bound in seconds for the checks of a single transition
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.completed = []
+
+    def submit(self, transition_id, checks, default, delay=0.0, credit=None,
+               waiter=time.sleep) -> None:
+        """ Schedules the reward evaluation of a transition, blocks while
+        max_pending transitions are pending
+
+        Parameters
+        ----------
+        transition_id :
+            identifier the reward is credited to
+        checks :
+            list of (status, reward, check) in priority order, check is a
+            callable returning whether the condition is met
+        default :
+            (status, reward) if none of the conditions is met
+        delay :
+            seconds to wait before the checks are started
+        credit :
+            optional callable receiving transition_id, status and reward
+        waiter :
+            callable waiting for the delay, e.g. of a simulated backend
+        """
+        self.slots.acquire()
+        try:
+            future = self.transitions.submit(self.evaluate, transition_id, checks,
+                                             default, delay, credit, waiter)
+        except RuntimeError:
+            # The pipeline has been closed
+            self.slots.release()
+            raise
+        with self.lock:
+            self.pending.add(future)
+        future.add_done_callback(self.remove_pending)
+
+    def remove_pending(self, future) -> None:
+        with self.lock:
+            self.pending.discard(future)
+        self.slots.release()
+
+    def evaluate(self, transition_id, checks, default, delay, credit, waiter) -> None:
+        if delay > 0:
+            waiter(delay)
+        futures = [self.checks.submit(check) for _, _, check in checks]
+        wait(futures, timeout=self.timeout)
+        status, reward = default
+        for (check_status, check_reward, _), future in zip(checks, futures):
+            # Checks that did not finish in time count as not met
+            if future.done() and future.exception() is None and future.result():
+                status, reward = check_status, check_reward
+                break
+        with self.lock:
+            self.completed.append((transition_id, status, reward))
+        if credit is not None:
+            credit(transition_id, status, reward)
+
+    def collect(self) -> list:
+        # Returns and forgets the (transition_id, status, reward) of all
+        # transitions evaluated since the last call
+        with self.lock:
+            completed, self.completed = self.completed, []
+        return completed
+
+    def drain(self, timeout=None) -> list:
+        # Waits for all pending transitions and collects them
+        with self.lock:
+            pending = list(self.pending)
+        wait(pending, timeout=timeout)
+        return self.collect()
+
+    def close(self) -> None:
+        self.transitions.shutdown(wait=True)
+        self.checks.shutdown(wait=True)
+
+
+class DelayedExperience(object):
+
+    def __init__(self, environment) -> None:
+        # Buffers the transitions of an episode of an AtomicEnvironment with
+        # a reward pipeline until all their rewards have been evaluated, so
+        # the agent learns from the real rewards instead of the provisional
+        # ones returned by execute
+        self.default_status = environment.default_status
+        self.changed = threading.Condition()
+        self.transitions = []
+        self.rewards = {}
+        environment.add_reward_listener(self.credit)
+
+    def add(self, transition_id, states, actions) -> None:
+        with self.changed:
+            self.transitions.append((transition_id, states, actions))
+
+    def credit(self, transition_id, status, reward) -> None:
+        with self.changed:
+            self.rewards[transition_id] = (status, reward)
+            self.changed.notify_all()
+
+    def complete(self, timeout=None) -> dict:
+        """ Waits for the rewards of all buffered transitions and returns
+        them as episode for Agent.experience
+
+        The episode ends with the first transition whose evaluation met a
+        reward condition, later transitions only happened because the
+        condition was not known yet when they were chosen. Transitions
+        whose reward did not arrive in time are dropped with all following
+        ones
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.changed:
+            while not all(transition_id in self.rewards
+                          for transition_id, _, _ in self.transitions):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.changed.wait(remaining)
+            transitions, self.transitions = self.transitions, []
+            rewards = {transition_id: self.rewards.pop(transition_id)
+                       for transition_id, _, _ in transitions
+                       if transition_id in self.rewards}
+        episode = {"states": [], "actions": [], "terminal": [], "reward": []}
+        for transition_id, states, actions in transitions:
+            if transition_id not in rewards:
+                break
+            status, reward = rewards[transition_id]
+            episode["states"].append(states)
+            episode["actions"].append(actions)
+            episode["reward"].append(reward)
+            episode["terminal"].append(0)
+            if status != self.default_status:
+                break
+        if episode["terminal"]:
+            # Episodes cut short by the step limit count as aborted
+            episode["terminal"][-1] = 1 if status != self.default_status else 2
+        return episode
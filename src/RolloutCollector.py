@@ -0,0 +1,385 @@
+from tensorforce.environments import Environment
+from multiprocessing import shared_memory
+import multiprocessing
+import os
+import time
+import numpy as np
+
+
+class RolloutCollector(object):
+
+    # Commands of the learner, workers poll the generation counter and
+    # execute the command once it changes
+    command_reset = 1
+    command_step = 2
+    command_close = 3
+
+    # Layout of the control block: generation, command and row, followed
+    # by the last generation every worker has completed
+    control_generation = 0
+    control_command = 1
+    control_row = 2
+    control_done = 3
+
+    # Spins before waiting processes yield the CPU, keeps latency low on
+    # idle cores without starving busy ones. Spinning only pays off while
+    # learner and workers have a core each
+    spins = 200
+
+    # Yields before waiting processes sleep, so workers idling between
+    # collects, e.g. while the agent updates, do not keep cores busy
+    yields = 1000
+    sleep = 0.001
+
+    dtypes = {
+        "int": np.int64,
+        "float": np.float32,
+        "bool": np.bool_
+    }
+
+    def __init__(self, environment, num_environments, num_steps=1, num_workers=None,
+                 max_episode_timesteps=None, **kwargs):
+        """ Steps environments in worker processes, which write states,
+        rewards and terminals into shared memory the learner reads without
+        copying
+
+        Parameters
+        ----------
+        environment :
+            environment class or specification as accepted by
+            Environment.create, has to be picklable
+        num_environments :
+            number of environment instances
+        num_steps :
+            steps of all instances kept per collect, the buffers hold
+            num_steps rows of actions, rewards and terminals and
+            num_steps + 1 rows of states
+        num_workers :
+            processes the instances are distributed to, defaults to the
+            number of CPUs
+        max_episode_timesteps :
+            optional episode length after which an instance is aborted
+        """
+        self.num_environments = num_environments
+        self.num_steps = num_steps
+        self.num_workers = min(num_workers or os.cpu_count() or 1, num_environments)
+        self.spins = RolloutCollector.spins if self.num_workers < (os.cpu_count() or 1) else 0
+        # The specification is read from a local instance, as for
+        # VectorizedEnvironment all instances share it
+        instance = Environment.create(environment=environment, **kwargs)
+        self.states_spec = instance.states()
+        self.actions_spec = instance.actions()
+        instance.close()
+        self.layout, size = RolloutCollector.create_layout(
+            self.states_spec, self.actions_spec, num_environments, num_steps,
+            self.num_workers)
+        self.memory = shared_memory.SharedMemory(create=True, size=size)
+        self.buffers = RolloutCollector.create_buffers(self.layout, self.memory)
+        self.control = self.buffers["control"]
+        self.control[:] = 0
+        self.row = 0
+        self.errors = multiprocessing.Queue()
+        # Generations and completions are published under the lock, see
+        # publish and fence
+        self.lock = multiprocessing.Lock()
+        # Every worker owns a contiguous slice of the instances
+        bounds = np.linspace(0, num_environments, self.num_workers + 1).astype(int)
+        self.processes = []
+        for worker in range(self.num_workers):
+            process = multiprocessing.Process(
+                target=RolloutCollector.work,
+                args=(worker, self.memory.name, self.layout, environment, kwargs,
+                      int(bounds[worker]), int(bounds[worker + 1]),
+                      max_episode_timesteps, self.spins, self.errors, self.lock),
+                daemon=True)
+            process.start()
+            self.processes.append(process)
+
+    @staticmethod
+    def normalize_spec(spec) -> dict:
+        # Single specifications are stored under the name None
+        if "type" in spec:
+            return {None: spec}
+        return dict(spec)
+
+    @staticmethod
+    def create_layout(states_spec, actions_spec, num_environments, num_steps,
+                      num_workers):
+        # Returns name, shape, dtype and offset of every buffer, all
+        # buffers live in one shared memory block aligned to cache lines
+        arrays = [("control", (RolloutCollector.control_done + num_workers,), np.int64)]
+        for name, spec in RolloutCollector.normalize_spec(states_spec).items():
+            arrays.append((("states", name), (num_steps + 1, num_environments) +
+                           RolloutCollector.get_shape(spec),
+                           RolloutCollector.dtypes[spec["type"]]))
+        for name, spec in RolloutCollector.normalize_spec(actions_spec).items():
+            arrays.append((("actions", name), (num_steps, num_environments) +
+                           RolloutCollector.get_shape(spec),
+                           RolloutCollector.dtypes[spec["type"]]))
+        arrays.append(("terminals", (num_steps, num_environments), np.int64))
+        arrays.append(("rewards", (num_steps, num_environments), np.float32))
+        layout = []
+        offset = 0
+        for key, shape, dtype in arrays:
+            layout.append((key, shape, np.dtype(dtype).str, offset))
+            size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            offset += (size + 63) // 64 * 64
+        return layout, max(offset, 1)
+
+    @staticmethod
+    def get_shape(spec) -> tuple:
+        shape = spec.get("shape", ())
+        return (shape,) if isinstance(shape, int) else tuple(shape)
+
+    @staticmethod
+    def create_buffers(layout, memory) -> dict:
+        # NumPy views of the shared memory, nothing is copied
+        return {key: np.ndarray(shape, dtype=np.dtype(dtype), buffer=memory.buf,
+                                offset=offset)
+                for key, shape, dtype, offset in layout}
+
+    def states(self):
+        """ Returns the state space of a single instance
+        """
+        return self.states_spec
+
+    def actions(self):
+        """ Returns the action space of a single instance
+        """
+        return self.actions_spec
+
+    def view(self, kind, row):
+        # States or actions of all instances in a row, as dict for dict
+        # specifications
+        views = {name: buffer[row] for (key, buffer) in self.buffers.items()
+                 if isinstance(key, tuple) and key[0] == kind
+                 for name in [key[1]]}
+        return views[None] if None in views else views
+
+    @staticmethod
+    def wait(predicate, spins, check=None) -> None:
+        # Spins on shared memory instead of blocking on a lock, waiting
+        # processes yield once the spin budget is used up and sleep once
+        # the yield budget is used up
+        count = 0
+        while not predicate():
+            count += 1
+            if count < spins:
+                continue
+            if check is not None and count % 1000 == 0:
+                check()
+            if count >= spins + RolloutCollector.yields:
+                time.sleep(RolloutCollector.sleep)
+            elif hasattr(os, "sched_yield"):
+                os.sched_yield()
+            else:
+                time.sleep(0)
+
+    @staticmethod
+    def publish(lock, control, index, value) -> None:
+        # Releasing the lock orders all earlier writes to the shared memory
+        # before the published value, NumPy stores alone are not ordered
+        # on weakly ordered CPUs like ARM
+        with lock:
+            control[index] = value
+
+    @staticmethod
+    def fence(lock) -> None:
+        # Called after a published value was seen while polling without
+        # the lock, acquiring it orders all later reads after the writes
+        # preceding the publication
+        with lock:
+            pass
+
+    def command(self, command, row) -> None:
+        # Publishes a command to all workers and waits until every worker
+        # has completed it. The generation is published last, so workers
+        # see command, row and actions once they see the new generation
+        self.control[RolloutCollector.control_command] = command
+        self.control[RolloutCollector.control_row] = row
+        generation = int(self.control[RolloutCollector.control_generation]) + 1
+        RolloutCollector.publish(self.lock, self.control,
+                                 RolloutCollector.control_generation, generation)
+        if command == RolloutCollector.command_close:
+            return
+        done = self.control[RolloutCollector.control_done:]
+        RolloutCollector.wait(lambda: done.min() >= generation or done.min() < 0,
+                              self.spins, self.check_workers)
+        RolloutCollector.fence(self.lock)
+        if done.min() < 0:
+            self.raise_error()
+
+    def check_workers(self) -> None:
+        if not all(process.is_alive() for process in self.processes):
+            self.raise_error()
+
+    def raise_error(self):
+        try:
+            message = self.errors.get(timeout=1.0)
+        except Exception:
+            message = "worker process terminated"
+        raise RuntimeError("Rollout worker failed: " + message)
+
+    def reset(self):
+        """ Resets all instances
+
+        Returns
+        ----------
+        states :
+            view of the initial states of all instances
+        """
+        self.row = 0
+        self.command(RolloutCollector.command_reset, 0)
+        return self.view("states", 0)
+
+    def step(self, actions):
+        """ Executes one action in every instance
+
+        Parameters
+        ----------
+        actions :
+            actions of all instances along the first axis, or a dict of
+            such arrays
+
+        Returns
+        ----------
+        next_states :
+            view of the next states, terminated instances are reset and
+            return the initial state of their next episode
+        terminals :
+            view of 0 for running, 1 for terminal and 2 for aborted episodes
+        rewards :
+            view of the rewards
+        """
+        if self.row == self.num_steps:
+            self.wrap()
+        self.write_actions(actions, self.row)
+        self.command(RolloutCollector.command_step, self.row)
+        self.row += 1
+        return (self.view("states", self.row), self.buffers["terminals"][self.row - 1],
+                self.buffers["rewards"][self.row - 1])
+
+    def write_actions(self, actions, row) -> None:
+        for key, buffer in self.buffers.items():
+            if isinstance(key, tuple) and key[0] == "actions":
+                buffer[row] = actions if key[1] is None else actions[key[1]]
+
+    def wrap(self) -> None:
+        # The last states become the first row of the next rollout
+        for key, buffer in self.buffers.items():
+            if isinstance(key, tuple) and key[0] == "states":
+                buffer[0] = buffer[self.row]
+        self.row = 0
+
+    def collect(self, act) -> dict:
+        """ Collects num_steps steps of all instances
+
+        Parameters
+        ----------
+        act :
+            callable receiving the view of the current states and returning
+            the actions of all instances
+
+        Returns
+        ----------
+        rollout :
+            views of states with num_steps + 1 rows and of actions,
+            terminals and rewards with num_steps rows, valid until the next
+            call of step, collect or reset
+        """
+        if self.row != 0:
+            self.wrap()
+        for _ in range(self.num_steps):
+            self.step(act(self.view("states", self.row)))
+        return {
+            "states": self.view("states", slice(None)),
+            "actions": self.view("actions", slice(None)),
+            "terminals": self.buffers["terminals"],
+            "rewards": self.buffers["rewards"]
+        }
+
+    def close(self):
+        """ Stops all workers and releases the shared memory
+        """
+        if self.memory is None:
+            return
+        self.command(RolloutCollector.command_close, 0)
+        for process in self.processes:
+            process.join(5.0)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+        self.buffers = {}
+        self.control = None
+        self.memory.close()
+        self.memory.unlink()
+        self.memory = None
+
+    @staticmethod
+    def work(worker, memory_name, layout, environment, kwargs, start, stop,
+             max_episode_timesteps, spins, errors, lock):
+        # Entry point of a worker process, steps the instances start to
+        # stop every time the generation changes
+        memory = shared_memory.SharedMemory(name=memory_name)
+        buffers = RolloutCollector.create_buffers(layout, memory)
+        control = buffers["control"]
+        done = RolloutCollector.control_done + worker
+        states = {key[1]: buffer for key, buffer in buffers.items()
+                  if isinstance(key, tuple) and key[0] == "states"}
+        actions = {key[1]: buffer for key, buffer in buffers.items()
+                   if isinstance(key, tuple) and key[0] == "actions"}
+        environments = []
+        seen = 0
+        try:
+            environments = [Environment.create(environment=environment, **kwargs)
+                            for _ in range(start, stop)]
+            timesteps = [0] * len(environments)
+            while True:
+                RolloutCollector.wait(
+                    lambda: control[RolloutCollector.control_generation] != seen, spins)
+                RolloutCollector.fence(lock)
+                seen = int(control[RolloutCollector.control_generation])
+                command = control[RolloutCollector.control_command]
+                row = int(control[RolloutCollector.control_row])
+                if command == RolloutCollector.command_close:
+                    break
+                for offset, instance in enumerate(environments):
+                    index = start + offset
+                    if command == RolloutCollector.command_reset:
+                        RolloutCollector.write_state(states, row, index, instance.reset())
+                        timesteps[offset] = 0
+                        continue
+                    if None in actions:
+                        action = actions[None][row, index]
+                    else:
+                        action = {name: buffer[row, index]
+                                  for name, buffer in actions.items()}
+                    state, terminal, reward = instance.execute(action)
+                    terminal = int(terminal)
+                    timesteps[offset] += 1
+                    if terminal == 0 and max_episode_timesteps is not None and \
+                            timesteps[offset] >= max_episode_timesteps:
+                        terminal = 2
+                    if terminal:
+                        state = instance.reset()
+                        timesteps[offset] = 0
+                    RolloutCollector.write_state(states, row + 1, index, state)
+                    buffers["terminals"][row, index] = terminal
+                    buffers["rewards"][row, index] = reward
+                RolloutCollector.publish(lock, control, done, seen)
+        except Exception as e:
+            errors.put(type(e).__name__ + ": " + str(e))
+            RolloutCollector.publish(lock, control, done, -1)
+        finally:
+            for instance in environments:
+                instance.close()
+            del buffers, control, states, actions
+            memory.close()
+
+    @staticmethod
+    def write_state(states, row, index, state) -> None:
+        if None in states:
+            states[None][row, index] = state
+        else:
+            for name, buffer in states.items():
+                buffer[row, index] = state[name]
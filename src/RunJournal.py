@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class RunJournal(object):
+
+    def __init__(self, filename, sync_every=32, sync_interval=1.0) -> None:
+        # Append-only journal with one compact JSON record per atomic,
+        # records are forced to disk in batches of sync_every records or
+        # at least every sync_interval seconds
+        self.filename = filename
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.last_sync = time.monotonic()
+        self.journal_file = open(filename, "ab")
+        # Terminate a record cut off by a crash, so it does not swallow
+        # the first record appended now
+        if self.journal_file.tell() > 0:
+            with open(filename, "rb") as journal_file:
+                journal_file.seek(-1, os.SEEK_END)
+                if journal_file.read(1) != b"\n":
+                    self.journal_file.write(b"\n")
+
+    @staticmethod
+    def create_plan_digest(plan) -> str:
+        # Identifies the atomics of a plan independent of the host
+        guids = "\n".join(entry["guid"] for entry in plan.entries)
+        return hashlib.sha1(guids.encode("utf-8")).hexdigest()
+
+    def start(self, plan, resumed=False) -> None:
+        # Marks the start of a run of a plan, a resumed run continues the
+        # records of the previous start
+        record = {"start": time.time(), "plan": RunJournal.create_plan_digest(plan)}
+        if resumed:
+            record["resumed"] = True
+        self.write(record, force_sync=True)
+
+    def record(self, entry, result) -> None:
+        self.write({
+            "g": result["guid"],
+            "t": entry["technique"],
+            "x": result["executed"],
+            "ok": result["success"],
+            "rc": result["exit_code"],
+            "d": round(result["duration"], 3),
+            "ts": round(time.time(), 3)
+        })
+
+    def write(self, record, force_sync=False) -> None:
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self.lock:
+            self.journal_file.write(line.encode("utf-8"))
+            self.pending += 1
+            if force_sync or self.pending >= self.sync_every or \
+                    time.monotonic() - self.last_sync >= self.sync_interval:
+                self.sync()
+
+    def sync(self) -> None:
+        # Has to be called with the lock held
+        self.journal_file.flush()
+        os.fsync(self.journal_file.fileno())
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    def close(self) -> None:
+        with self.lock:
+            if self.journal_file.closed:
+                return
+            self.sync()
+            self.journal_file.close()
+
+    @staticmethod
+    def replay(filename) -> dict:
+        # Returns the plan digest of the last start record and the last
+        # record of every GUID since the last run that was not resumed,
+        # preferring records of executed atomics over later skips. A
+        # partially written last line is ignored
+        replayed = {"plan": None, "records": {}}
+        try:
+            journal_file = open(filename, "rb")
+        except OSError:
+            return replayed
+        with journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if "start" in record:
+                    replayed["plan"] = record["plan"]
+                    if not record.get("resumed"):
+                        replayed["records"] = {}
+                elif "g" in record:
+                    if record["x"] or record["g"] not in replayed["records"]:
+                        replayed["records"][record["g"]] = record
+        return replayed
@@ -0,0 +1,198 @@
+from src.Helper import Helper
+import csv
+import typing
+
+
+class SelectionEngine(object):
+
+    # Attributes of an atomic a rule can refer to with "name:value"
+    fields = ["technique", "guid", "platform", "executor", "tactic"]
+
+    def __init__(self, tactics=None) -> None:
+        """ Decides which atomics are run, based on include and exclude rules
+
+        Parameters
+        ----------
+        tactics :
+            optional dict mapping technique IDs to lists of tactics
+        """
+        self.tactics = tactics if tactics is not None else {}
+        # Rules are hashed by (field, value), wildcard rules by their
+        # prefix. The values are (order, rule) so the earliest rule wins
+        self.rules = {"include": {}, "exclude": {}}
+        self.prefixes = {"include": {}, "exclude": {}}
+        self.longest_prefix = 0
+        self.count = 0
+
+    @staticmethod
+    def load_tactics_from_csv(filename) -> dict:
+        # Reads technique to tactic mappings. Files with a header use its
+        # technique and tactic columns, otherwise every row holds a
+        # technique ID and its tactics in any order
+        tactics = {}
+        with open(filename, newline="") as csv_file:
+            rows = list(csv.reader(csv_file))
+        if not rows:
+            return tactics
+        header = [cell.strip().lower() for cell in rows[0]]
+        technique_column = next((i for i, name in enumerate(header)
+                                 if name in ["technique", "technique_id", "id"]), None)
+        tactic_column = next((i for i, name in enumerate(header)
+                              if name in ["tactic", "tactics"]), None)
+        if technique_column is not None and tactic_column is not None:
+            for row in rows[1:]:
+                if len(row) > max(technique_column, tactic_column):
+                    SelectionEngine.add_tactics(tactics, row[technique_column],
+                                                [row[tactic_column]])
+            return tactics
+        for row in rows:
+            cells = [cell.strip() for cell in row]
+            technique_ids = [cell for cell in cells
+                             if Helper.check_technique_convention(cell)]
+            if technique_ids:
+                SelectionEngine.add_tactics(tactics, technique_ids[0],
+                                            [cell for cell in cells
+                                             if cell and cell not in technique_ids])
+        return tactics
+
+    @staticmethod
+    def add_tactics(tactics, technique_id, cells) -> None:
+        for cell in cells:
+            for tactic in cell.replace(";", ",").split(","):
+                tactic = SelectionEngine.normalize_tactic(tactic)
+                if tactic:
+                    tactics.setdefault(technique_id.strip(), set()).add(tactic)
+
+    @staticmethod
+    def normalize_tactic(tactic) -> str:
+        # "Defense Evasion" and "defense-evasion" refer to the same tactic
+        return "-".join(tactic.strip().lower().replace("_", " ").split())
+
+    @staticmethod
+    def parse_rule(token) -> typing.Tuple[str, str]:
+        """ Parses a single rule
+
+        Rules are technique IDs (T1059.001), wildcards (T1059.*, T10*),
+        GUIDs or "field:value" with field one of SelectionEngine.fields
+        """
+        token = token.strip()
+        if ":" in token:
+            field, value = token.split(":", 1)
+            field = field.strip().lower()
+            if field not in SelectionEngine.fields:
+                raise ValueError("Unknown selection field: " + field)
+            value = value.strip()
+            if field == "tactic":
+                value = SelectionEngine.normalize_tactic(value)
+            elif field == "platform" or field == "executor":
+                value = value.lower()
+            if field == "technique" and value.endswith("*"):
+                return "prefix", value[:-1]
+            return field, value
+        if token.endswith("*") and token[:1] == "T":
+            return "prefix", token[:-1]
+        if Helper.check_guid_convention(token):
+            return "guid", token.lower()
+        if Helper.check_technique_convention(token):
+            return "technique", token
+        raise ValueError("Could not parse selection rule: " + token)
+
+    @staticmethod
+    def parse_rules(argument) -> list:
+        # Rules are "," delimited, or the first column of a CSV file
+        if Helper.check_string_is_csv(argument):
+            if not Helper.check_file_existing(argument):
+                raise ValueError("supplied CSV file does not exist: " + argument)
+            tokens = []
+            with open(argument, newline="") as csv_file:
+                for row in csv.reader(csv_file):
+                    if row and row[0].strip() and not row[0].strip().startswith("#"):
+                        tokens.append(row[0].strip())
+            return tokens
+        return [token for token in argument.split(",") if token.strip()]
+
+    def add(self, kind, token) -> None:
+        """ Adds an include or exclude rule, earlier rules take precedence
+        when several rules match an atomic
+        """
+        field, value = SelectionEngine.parse_rule(token)
+        rule = (self.count, kind + " " + token.strip())
+        self.count += 1
+        if field == "prefix":
+            self.prefixes[kind].setdefault(value, rule)
+            self.longest_prefix = max(self.longest_prefix, len(value))
+        else:
+            self.rules[kind].setdefault((field, value), rule)
+
+    def add_all(self, kind, argument) -> None:
+        for token in SelectionEngine.parse_rules(argument):
+            self.add(kind, token)
+
+    def has_includes(self) -> bool:
+        return bool(self.rules["include"]) or bool(self.prefixes["include"])
+
+    def match(self, kind, technique_id, guid, platforms, executors) -> tuple:
+        # Returns the earliest matching rule of a kind, or None. Every
+        # lookup is a hash lookup, prefixes are looked up for every length
+        # of the bounded technique ID
+        rules = self.rules[kind]
+        keys = [("technique", technique_id)]
+        if guid is not None:
+            keys.append(("guid", guid.lower()))
+        keys += [("platform", platform.lower()) for platform in platforms]
+        keys += [("executor", executor.lower()) for executor in executors]
+        keys += [("tactic", tactic) for tactic in self.tactics.get(technique_id, ())]
+        best = None
+        for key in keys:
+            rule = rules.get(key)
+            if rule is not None and (best is None or rule < best):
+                best = rule
+        prefixes = self.prefixes[kind]
+        if prefixes:
+            for length in range(min(len(technique_id), self.longest_prefix) + 1):
+                rule = prefixes.get(technique_id[:length])
+                if rule is not None and (best is None or rule < best):
+                    best = rule
+        return best
+
+    def evaluate(self, technique_id, atomic) -> typing.Tuple[bool, str]:
+        """ Decides whether an atomic is selected
+
+        Returns
+        ----------
+        decision :
+            whether the atomic is selected and the rule deciding it
+        """
+        guid = atomic.get("auto_generated_guid")
+        platforms = atomic.get("supported_platforms") or []
+        executors = [(atomic.get("executor") or {}).get("name") or ""]
+        return self.decide(technique_id, guid, platforms, executors)
+
+    def decide(self, technique_id, guid, platforms, executors) -> typing.Tuple[bool, str]:
+        excluded = self.match("exclude", technique_id, guid, platforms, executors)
+        if excluded is not None:
+            return False, excluded[1]
+        if not self.has_includes():
+            return True, "default"
+        included = self.match("include", technique_id, guid, platforms, executors)
+        if included is not None:
+            return True, included[1]
+        return False, "not included by any rule"
+
+    def could_select(self, technique_id, index_entry) -> bool:
+        """ Decides from the test index whether any atomic of a technique
+        might be selected, so unselected techniques are never loaded
+        """
+        platforms = index_entry.get("platforms", [])
+        executors = index_entry.get("executors", [])
+        # Rules on GUIDs, platforms and executors only exclude single
+        # atomics, a technique is only dropped by technique level rules
+        excluded = self.match("exclude", technique_id, None, [], [])
+        if excluded is not None:
+            return False
+        if not self.has_includes():
+            return True
+        for guid in index_entry.get("guids", []) or [None]:
+            if self.match("include", technique_id, guid, platforms, executors) is not None:
+                return True
+        return False
@@ -0,0 +1,254 @@
+from src.CommandRunner import CommandRunner, ExecutionResult
+from src.ExecutionBackend import ExecutionBackend
+from collections import deque
+import base64
+import os
+import queue
+import signal
+import subprocess
+import threading
+import time
+import uuid
+
+
+class ShellWorker(object):
+
+    # Defines a helper in every PowerShell worker that runs a base64
+    # encoded command in a child scope and restores the working directory
+    # and environment variables afterwards
+    powershell_preamble = (
+        "$__AtomicLocation = Get-Location; "
+        "$__AtomicEnvironment = [Environment]::GetEnvironmentVariables(); "
+        "function __AtomicRun($Encoded, $Sentinel) { "
+        "$global:LASTEXITCODE = 0; $__rc = 0; "
+        "try { "
+        "$__block = [scriptblock]::Create([Text.Encoding]::UTF8.GetString("
+        "[Convert]::FromBase64String($Encoded))); "
+        "& $__block | Out-String -Stream | ForEach-Object { [Console]::Out.WriteLine($_) }; "
+        "if (-not $?) { $__rc = 1 } "
+        "if ($global:LASTEXITCODE) { $__rc = $global:LASTEXITCODE } "
+        "} catch { [Console]::Error.WriteLine($_); $__rc = 1 } "
+        "Set-Location $__AtomicLocation; "
+        "foreach ($__name in [Environment]::GetEnvironmentVariables().Keys) { "
+        "if (-not $__AtomicEnvironment.Contains($__name)) { "
+        "[Environment]::SetEnvironmentVariable($__name, $null) } } "
+        "foreach ($__name in $__AtomicEnvironment.Keys) { "
+        "[Environment]::SetEnvironmentVariable($__name, $__AtomicEnvironment[$__name]) } "
+        "[Console]::Out.WriteLine($Sentinel + ' ' + $__rc); "
+        "[Console]::Error.WriteLine($Sentinel); "
+        "[Console]::Out.Flush(); [Console]::Error.Flush() }\n")
+
+    def __init__(self, executor) -> None:
+        # Long-lived interpreter process commands are fed to over stdin
+        self.executor = executor
+        if executor == "powershell":
+            args = ["powershell", "-NoProfile", "-NoLogo", "-NonInteractive",
+                    "-Command", "-"]
+        else:
+            args = [executor]
+        popen_kwargs = {}
+        if os.name == "posix":
+            popen_kwargs["start_new_session"] = True
+        else:
+            popen_kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+        self.process = subprocess.Popen(args, stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE, **popen_kwargs)
+        self.lines = [queue.Queue(), queue.Queue()]
+        self.readers = [
+            threading.Thread(target=ShellWorker.read_stream,
+                             args=(self.process.stdout, self.lines[0]), daemon=True),
+            threading.Thread(target=ShellWorker.read_stream,
+                             args=(self.process.stderr, self.lines[1]), daemon=True)
+        ]
+        for reader in self.readers:
+            reader.start()
+        if executor == "powershell":
+            self.send(ShellWorker.powershell_preamble)
+
+    @staticmethod
+    def read_stream(stream, lines) -> None:
+        for line in iter(lambda: stream.readline(CommandRunner.max_line_bytes), b""):
+            lines.put(line)
+        # None marks the end of the stream
+        lines.put(None)
+
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
+
+    def send(self, script) -> None:
+        self.process.stdin.write(script.encode("utf-8"))
+        self.process.stdin.flush()
+
+    def create_script(self, command, sentinel) -> str:
+        # Wraps the command so that it cannot change the state of the
+        # worker and is followed by sentinels on stdout and stderr
+        if self.executor == "powershell":
+            encoded = base64.b64encode(command.encode("utf-8")).decode("ascii")
+            return "__AtomicRun '" + encoded + "' '" + sentinel + "'\n"
+        quoted = "'" + command.replace("'", "'\\''") + "'"
+        return "( eval " + quoted + " ) </dev/null\n" + \
+            "printf '%s %d\\n' '" + sentinel + "' \"$?\"\n" + \
+            "printf '%s\\n' '" + sentinel + "' >&2\n"
+
+    def run(self, command, timeout, max_output_bytes, buffer_lines) -> ExecutionResult:
+        # Runs a command and collects its output up to the sentinels, the
+        # worker is killed on timeout or when the output limit is exceeded
+        sentinel = "__ATOMIC_" + uuid.uuid4().hex
+        marker = sentinel.encode("ascii")
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        buffers = [deque(maxlen=buffer_lines), deque(maxlen=buffer_lines)]
+        finished = [False, False]
+        exit_code = None
+        bytes_out = 0
+        dropped = False
+        timed_out = False
+        try:
+            self.send(self.create_script(command, sentinel))
+        except OSError as e:
+            return ExecutionResult(stderr=str(e))
+
+        stream = 0
+        while not (finished[0] and finished[1]):
+            # Checked before every line, a command flooding its output
+            # never leaves the queues empty
+            if deadline is not None and time.monotonic() >= deadline:
+                timed_out = True
+                break
+            if finished[stream]:
+                stream = 1 - stream
+            try:
+                line = self.lines[stream].get(timeout=0.01)
+            except queue.Empty:
+                stream = 1 - stream
+                continue
+            if line is None:
+                # The interpreter died while running the command
+                finished = [True, True]
+                break
+            position = line.find(marker)
+            if position >= 0:
+                finished[stream] = True
+                if stream == 0:
+                    try:
+                        exit_code = int(line[position + len(marker):].strip())
+                    except ValueError:
+                        exit_code = None
+                line = line[:position]
+                if not line:
+                    continue
+            if len(buffers[stream]) == buffer_lines:
+                dropped = True
+            buffers[stream].append(line)
+            bytes_out += len(line)
+            if bytes_out > max_output_bytes:
+                dropped = True
+                break
+
+        if not (finished[0] and finished[1]):
+            self.kill()
+            if timed_out:
+                exit_code = -signal.SIGKILL if os.name == "posix" else 1
+        return ExecutionResult(exit_code=exit_code,
+                               duration=time.monotonic() - start,
+                               bytes_out=bytes_out, truncated=dropped,
+                               timed_out=timed_out,
+                               stdout=b"".join(buffers[0]).decode("utf-8", errors="replace"),
+                               stderr=b"".join(buffers[1]).decode("utf-8", errors="replace"))
+
+    def kill(self) -> None:
+        CommandRunner.kill(self.process)
+        self.process.wait()
+
+    def close(self) -> None:
+        if not self.is_alive():
+            return
+        try:
+            self.process.stdin.close()
+            self.process.wait(1.0)
+        except (OSError, subprocess.TimeoutExpired):
+            self.kill()
+
+
+class ShellPool(ExecutionBackend):
+
+    # Executors whose interpreters can be kept alive between commands
+    pooled_executors = ["sh", "bash", "powershell"]
+
+    def __init__(self, size=2, timeout=None, max_output_bytes=64 << 20,
+                 buffer_lines=200, fallback=None) -> None:
+        # Number of workers kept per executor
+        self.size = size
+        self.timeout = timeout
+        self.max_output_bytes = max_output_bytes
+        self.buffer_lines = buffer_lines
+        # Runs commands needing isolation and executors that are not pooled
+        self.fallback = fallback
+        if self.fallback is None:
+            self.fallback = CommandRunner(timeout, max_output_bytes, buffer_lines)
+        self.idle = {}
+        self.created = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, executor) -> ShellWorker:
+        # Returns an idle worker, starts a new one if the pool is not full
+        # yet or waits for a worker to become idle otherwise
+        with self.lock:
+            idle = self.idle.setdefault(executor, queue.Queue())
+            create = idle.empty() and self.created.get(executor, 0) < self.size
+            if create:
+                self.created[executor] = self.created.get(executor, 0) + 1
+        if create:
+            try:
+                return ShellWorker(executor)
+            except OSError:
+                self.discard(executor)
+                raise
+        return idle.get()
+
+    def release(self, worker) -> None:
+        if worker.is_alive():
+            self.idle[worker.executor].put(worker)
+        else:
+            self.discard(worker.executor)
+
+    def discard(self, executor) -> None:
+        with self.lock:
+            self.created[executor] -= 1
+        # Wake up a caller waiting for a worker, it will start a new one
+        self.idle[executor].put(None)
+
+    def run(self, command, executor, timeout=None, isolated=False) -> ExecutionResult:
+        if timeout is None:
+            timeout = self.timeout
+        if isolated or executor not in ShellPool.pooled_executors:
+            return self.fallback.run(command, executor, timeout)
+        while True:
+            try:
+                worker = self.acquire(executor)
+            except OSError as e:
+                return ExecutionResult(stderr=str(e))
+            if worker is None:
+                continue
+            if worker.is_alive():
+                break
+            self.discard(executor)
+        try:
+            return worker.run(command, timeout, self.max_output_bytes,
+                              self.buffer_lines)
+        finally:
+            self.release(worker)
+
+    def close(self) -> None:
+        # Stops all idle workers
+        with self.lock:
+            executors = list(self.idle.keys())
+        for executor in executors:
+            idle = self.idle[executor]
+            while not idle.empty():
+                worker = idle.get()
+                if worker is not None:
+                    worker.close()
+            with self.lock:
+                self.created[executor] = 0
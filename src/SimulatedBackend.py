@@ -0,0 +1,182 @@
+from src.CommandRunner import ExecutionResult
+from src.ExecutionBackend import ExecutionBackend
+import hashlib
+import json
+import os
+import random
+import threading
+
+
+class DetectionModel(object):
+
+    def __init__(self, base_probability=0.05, probability_per_second=0.01,
+                 command_probabilities=None) -> None:
+        # Probability that an action is detected right away, increased by
+        # every second waited afterwards. Commands can be given their own
+        # base probability
+        self.base_probability = base_probability
+        self.probability_per_second = probability_per_second
+        self.command_probabilities = command_probabilities or {}
+
+    def probability(self, command, waited) -> float:
+        base = self.command_probabilities.get(command, self.base_probability)
+        undetected = (1.0 - base) * (1.0 - self.probability_per_second) ** waited
+        return 1.0 - undetected
+
+
+class ConditionModel(object):
+
+    def __init__(self, command_probabilities=None) -> None:
+        # Probability that a check script passes after a command. Commands
+        # without a given probability get a fixed one derived from script
+        # and command, so every action has its own, learnable chance
+        self.command_probabilities = command_probabilities or {}
+
+    def probability(self, script, command) -> float:
+        if command in self.command_probabilities:
+            return self.command_probabilities[command]
+        digest = hashlib.sha1((script + "\0" + command).encode("utf-8")).digest()
+        return int.from_bytes(digest[:4], "big") / 2.0 ** 32
+
+
+class SimulatedBackend(ExecutionBackend):
+
+    def __init__(self, seed=0, outcomes=None, success_probability=1.0,
+                 detection_model=None, condition_model=None) -> None:
+        # Deterministic backend for training without executing anything.
+        # Recorded outcomes are replayed in order, everything without a
+        # recording is decided by the seeded random models
+        self.random = random.Random(seed)
+        self.outcomes = outcomes if outcomes is not None else {}
+        self.replayed = {}
+        self.success_probability = success_probability
+        self.detection_model = detection_model
+        if self.detection_model is None:
+            self.detection_model = DetectionModel()
+        self.condition_model = condition_model
+        if self.condition_model is None:
+            self.condition_model = ConditionModel()
+        # Check scripts never pass after a command that failed
+        self.failed_commands = set()
+        # Virtual clock advanced by commands and waits instead of sleeping
+        self.clock = 0.0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def load_outcomes(filename) -> dict:
+        # Loads the records of a RecordingBackend, keyed by ("run",
+        # executor, command), ("passes", script, command) and ("detected",
+        # command)
+        outcomes = {}
+        with open(filename) as outcomes_file:
+            for line in outcomes_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if "executor" in record:
+                    key = ("run", record["executor"], record["command"])
+                elif "script" in record:
+                    key = ("passes", record["script"], record["command"])
+                else:
+                    key = ("detected", record["command"])
+                outcomes.setdefault(key, []).append(record)
+        return outcomes
+
+    def replay(self, key) -> dict:
+        # Cycles through the recordings of a key, has to be called with the
+        # lock held
+        recorded = self.outcomes.get(key)
+        if not recorded:
+            return None
+        index = self.replayed.get(key, 0)
+        self.replayed[key] = index + 1
+        return recorded[index % len(recorded)]
+
+    def run(self, command, executor, timeout=None, isolated=False) -> ExecutionResult:
+        with self.lock:
+            record = self.replay(("run", executor, command))
+            if record is not None:
+                result = ExecutionResult(exit_code=record.get("exit_code"),
+                                         duration=record.get("duration", 0.0),
+                                         stdout=record.get("stdout", ""),
+                                         stderr=record.get("stderr", ""))
+            else:
+                success = self.random.random() < self.success_probability
+                result = ExecutionResult(exit_code=0 if success else 1)
+            if result.success:
+                self.failed_commands.discard(command)
+            else:
+                self.failed_commands.add(command)
+            self.clock += result.duration
+            return result
+
+    def passes(self, script, command, waited) -> bool:
+        # Check scripts are keyed by their file name, recordings do not
+        # depend on where the specification is located
+        script = os.path.basename(script)
+        with self.lock:
+            record = self.replay(("passes", script, command))
+            if record is not None:
+                return bool(record["passed"])
+            if command in self.failed_commands:
+                return False
+            probability = self.condition_model.probability(script, command)
+            return self.random.random() < probability
+
+    def wait(self, seconds) -> None:
+        with self.lock:
+            self.clock += seconds
+
+    def detected(self, command, waited) -> bool:
+        with self.lock:
+            record = self.replay(("detected", command))
+            if record is not None:
+                return bool(record["detected"])
+            probability = self.detection_model.probability(command, waited)
+            return self.random.random() < probability
+
+
+class RecordingBackend(ExecutionBackend):
+
+    def __init__(self, backend, filename, detector=None) -> None:
+        # Wraps a real backend and records the outcome of every command and
+        # detection check, so they can be replayed by a SimulatedBackend
+        self.backend = backend
+        self.detector = detector
+        self.records = open(filename, "a")
+        self.lock = threading.Lock()
+
+    def write(self, record) -> None:
+        with self.lock:
+            self.records.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self.records.flush()
+
+    def run(self, command, executor, timeout=None, isolated=False) -> ExecutionResult:
+        result = self.backend.run(command, executor, timeout, isolated)
+        record = {"executor": executor, "command": command}
+        record.update(result.to_dict())
+        self.write(record)
+        return result
+
+    def wait(self, seconds) -> None:
+        self.backend.wait(seconds)
+
+    def passes(self, script, command, waited) -> bool:
+        passed = bool(self.backend.passes(script, command, waited))
+        self.write({"script": os.path.basename(script), "command": command,
+                    "waited": waited, "passed": passed})
+        return passed
+
+    def detected(self, command, waited):
+        if self.detector is not None:
+            detected = bool(self.detector())
+        else:
+            detected = self.backend.detected(command, waited)
+        if detected is not None:
+            self.write({"command": command, "waited": waited, "detected": detected})
+        return detected
+
+    def close(self) -> None:
+        self.records.close()
+        self.backend.close()
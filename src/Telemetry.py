@@ -0,0 +1,277 @@
+import json
+import threading
+import time
+
+
+class NullSpan(object):
+    # Shared by all spans and contexts while telemetry is disabled, so that
+    # instrumented code only pays for a method call
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set(self, **attributes) -> None:
+        return
+
+
+class Span(object):
+
+    def __init__(self, telemetry, name, attributes) -> None:
+        self.telemetry = telemetry
+        self.name = name
+        self.attributes = attributes
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self.start
+        event = self.telemetry.create_event("span", self.name, self.attributes)
+        event["duration"] = duration
+        if exc_type is not None:
+            event["error"] = exc_type.__name__
+        self.telemetry.emit(event)
+        return False
+
+    def set(self, **attributes) -> None:
+        # Adds attributes only known at the end of the span, e.g. exit codes
+        self.attributes.update(attributes)
+
+
+class Context(object):
+
+    def __init__(self, telemetry, attributes) -> None:
+        self.telemetry = telemetry
+        self.attributes = attributes
+        self.previous = None
+
+    def __enter__(self):
+        local = self.telemetry.local
+        self.previous = getattr(local, "attributes", {})
+        local.attributes = dict(self.previous, **self.attributes)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.telemetry.local.attributes = self.previous
+        return False
+
+    def set(self, **attributes) -> None:
+        self.telemetry.local.attributes.update(attributes)
+
+
+class Telemetry(object):
+
+    # Phases of an atomic whose durations are recorded as spans
+    phases = ["plan", "prereq_check", "prereq_get", "command", "cleanup"]
+
+    def __init__(self, sinks=None, batch_size=256, flush_interval=1.0,
+                 max_buffered=None) -> None:
+        # Without sinks telemetry is disabled and spans, contexts and
+        # counters do nothing
+        self.sinks = list(sinks) if sinks is not None else []
+        self.enabled = len(self.sinks) > 0
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Events buffered while the sinks are slow, further events are
+        # dropped and counted instead of stalling the atomics
+        self.max_buffered = max_buffered if max_buffered is not None else 16 * batch_size
+        self.buffer = []
+        self.dropped = 0
+        # Counters are aggregated per (name, technique, guid) and emitted
+        # as a single event each when the buffer is flushed
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.due = threading.Condition(self.lock)
+        # Sinks are written by one thread at a time
+        self.write_lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        # Attributes of the atomic the current thread is working on
+        self.local = threading.local()
+        # Sinks are written by a background thread, so atomics never wait
+        # for them
+        self.stopped = False
+        self.flusher = None
+        if self.enabled:
+            self.flusher = threading.Thread(target=self.run_flusher, daemon=True)
+            self.flusher.start()
+
+    def context(self, **attributes):
+        """ Attaches attributes, e.g. technique and guid, to all spans and
+        counters of the current thread within a with statement
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return Context(self, attributes)
+
+    def span(self, name, **attributes):
+        """ Measures the duration of a with statement
+
+        Parameters
+        ----------
+        name :
+            name of the span, usually one of Telemetry.phases
+        attributes :
+            additional attributes of the span
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, attributes)
+
+    def count(self, name, value=1) -> None:
+        """ Increments a counter of the atomic the current thread works on
+        """
+        if not self.enabled:
+            return
+        attributes = getattr(self.local, "attributes", {})
+        key = (name, attributes.get("technique"), attributes.get("guid"))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def create_event(self, kind, name, attributes) -> dict:
+        event = {"type": kind, "name": name, "ts": time.time()}
+        event.update(getattr(self.local, "attributes", {}))
+        event.update(attributes)
+        return event
+
+    def emit(self, event) -> None:
+        with self.lock:
+            if len(self.buffer) >= self.max_buffered:
+                self.dropped += 1
+                return
+            self.buffer.append(event)
+            if len(self.buffer) >= self.batch_size:
+                self.due.notify()
+
+    def run_flusher(self) -> None:
+        # Flushes once a batch is full or the flush interval has passed
+        while True:
+            with self.lock:
+                if not self.stopped and len(self.buffer) < self.batch_size:
+                    self.due.wait(max(0.0, self.last_flush + self.flush_interval -
+                                      time.monotonic()))
+                if self.stopped:
+                    return
+                due = len(self.buffer) >= self.batch_size or \
+                    time.monotonic() - self.last_flush >= self.flush_interval
+            if due:
+                self.flush()
+
+    def flush(self) -> None:
+        # Hands the buffered events to all sinks in one batch
+        with self.write_lock:
+            with self.lock:
+                events, self.buffer = self.buffer, []
+                counters, self.counters = self.counters, {}
+                dropped, self.dropped = self.dropped, 0
+                self.last_flush = time.monotonic()
+            timestamp = time.time()
+            for (name, technique, guid), value in counters.items():
+                events.append({"type": "counter", "name": name, "ts": timestamp,
+                               "technique": technique, "guid": guid, "value": value})
+            if dropped:
+                events.append({"type": "counter", "name": "telemetry.dropped",
+                               "ts": timestamp, "value": dropped})
+            if not events:
+                return
+            for sink in self.sinks:
+                try:
+                    sink.write(events)
+                except Exception as e:
+                    # Telemetry must never abort a run
+                    print("Writing telemetry went wrong: " + type(sink).__name__ +
+                          "\n" + str(e))
+
+    def close(self) -> None:
+        if not self.enabled:
+            return
+        with self.lock:
+            self.stopped = True
+            self.due.notify()
+        self.flusher.join()
+        self.flush()
+        for sink in self.sinks:
+            sink.close()
+
+    @staticmethod
+    def summarize(filename, top=20) -> list:
+        """ Aggregates the spans of a JSONL telemetry file per atomic
+
+        Returns
+        ----------
+        summary :
+            up to top dicts with guid, technique, total and per phase
+            seconds, ordered by descending total
+        """
+        atomics = {}
+        with open(filename) as telemetry_file:
+            for line in telemetry_file:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if event.get("type") != "span" or event.get("guid") is None:
+                    continue
+                atomic = atomics.setdefault(event["guid"], {
+                    "guid": event["guid"],
+                    "technique": event.get("technique"),
+                    "total": 0.0
+                })
+                if event["name"] == "atomic":
+                    atomic["total"] += event["duration"]
+                else:
+                    atomic[event["name"]] = atomic.get(event["name"], 0.0) + \
+                        event["duration"]
+        summary = sorted(atomics.values(), key=lambda atomic: atomic["total"],
+                         reverse=True)
+        return summary[:top]
+
+
+NULL_SPAN = NullSpan()
+
+
+class JsonlSink(object):
+
+    def __init__(self, filename) -> None:
+        # Appends one JSON object per line
+        self.telemetry_file = open(filename, "a")
+
+    def write(self, events) -> None:
+        self.telemetry_file.write("".join(json.dumps(event, separators=(",", ":")) + "\n"
+                                          for event in events))
+        self.telemetry_file.flush()
+
+    def close(self) -> None:
+        self.telemetry_file.close()
+
+
+class HttpSink(object):
+
+    def __init__(self, url, token=None, sourcetype="atomic:telemetry",
+                 timeout=5.0) -> None:
+        # Posts batches in the format of the Splunk HTTP Event Collector,
+        # any collector accepting newline separated JSON works as well
+        self.url = url
+        self.token = token
+        self.sourcetype = sourcetype
+        self.timeout = timeout
+
+    def write(self, events) -> None:
+        from urllib.request import Request, urlopen
+        body = "\n".join(json.dumps({"time": event["ts"], "sourcetype": self.sourcetype,
+                                     "event": event}, separators=(",", ":"))
+                         for event in events)
+        headers = {"Content-Type": "application/json"}
+        if self.token is not None:
+            headers["Authorization"] = "Splunk " + self.token
+        request = Request(self.url, data=body.encode("utf-8"), headers=headers,
+                          method="POST")
+        with urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    def close(self) -> None:
+        return
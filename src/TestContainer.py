@@ -0,0 +1,204 @@
+from src.Helper import Helper
+from src.AtomicStore import AtomicStore
+import hashlib
+import json
+import os
+import typing
+
+
+class TestContainer(object):
+
+    # Bump whenever the layout of an index entry changes
+    index_version = 2
+
+    def __init__(self, official_tests_path, custom_tests_path,
+                 exclude_tests_file, technique_ids=None,
+                 index_file=None) -> None:
+        # Paths of the atomic test definitions
+        self.tests_paths = [official_tests_path, custom_tests_path]
+        self.index_file = index_file
+        if self.index_file is None:
+            self.index_file = os.path.join(
+                os.path.dirname(os.path.normpath(official_tests_path)),
+                ".index.json")
+        self.exclude_guids_list = []
+        if Helper.check_file_existing(exclude_tests_file):
+            self.exclude_guids_list = Helper.load_guids_from_csv(exclude_tests_file)
+
+        # The index maps every YAML file to the metadata of its technique,
+        # techniques are only parsed completely once they are requested
+        self.index = {}
+        # Files of every technique ID in index order, official first
+        self.technique_files = {}
+        self.techniques = {}
+        self.selected_ids = technique_ids
+        # Message and error flag of persisting the index, for the caller
+        self.index_status = self.update_index()
+
+    def update_index(self) -> typing.Tuple[str, bool]:
+        # Loads the persisted index and refreshes only changed files
+        cached_files = self.load_index()
+        files = {}
+        changed = False
+        for filename in self.find_technique_files():
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            entry = cached_files.get(filename)
+            if entry is not None and entry["mtime_ns"] == stat.st_mtime_ns \
+                    and entry["size"] == stat.st_size:
+                files[filename] = entry
+                continue
+            # Size or modification time changed, compare the content hash
+            # before paying for parsing the YAML file
+            sha1 = TestContainer.hash_file(filename)
+            if entry is None or entry["sha1"] != sha1:
+                entry = TestContainer.create_index_entry(filename)
+                if entry is None:
+                    continue
+            entry["mtime_ns"] = stat.st_mtime_ns
+            entry["size"] = stat.st_size
+            entry["sha1"] = sha1
+            files[filename] = entry
+            changed = True
+        status = ("Test index is up to date", False)
+        if changed or len(files) != len(cached_files):
+            status = self.save_index(files)
+            self.techniques = {}
+        self.index = files
+        self.technique_files = {}
+        for filename, entry in files.items():
+            self.technique_files.setdefault(entry["technique"], []).append(filename)
+        return status
+
+    def load_index(self) -> dict:
+        # Returns the file entries of the persisted index, if still valid
+        try:
+            with open(self.index_file) as index_file:
+                index = json.load(index_file)
+        except (OSError, ValueError):
+            return {}
+        if index.get("version") != TestContainer.index_version:
+            return {}
+        return index.get("files", {})
+
+    def save_index(self, files) -> typing.Tuple[str, bool]:
+        # Writes the index to a temporary file first and replaces the old
+        # index afterwards, so an interrupted run never leaves it broken
+        index = {"version": TestContainer.index_version, "files": files}
+        temp_file = self.index_file + ".tmp"
+        try:
+            with open(temp_file, "w") as index_file:
+                json.dump(index, index_file, separators=(",", ":"))
+            os.replace(temp_file, self.index_file)
+        except OSError as e:
+            return "Saving the test index went wrong: " + self.index_file + \
+                "\n" + str(e), True
+        return "Saved test index", False
+
+    def find_technique_files(self) -> list:
+        # Collects all technique YAML files, official tests come first
+        technique_files = []
+        for path in self.tests_paths:
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for f in sorted(files):
+                    name, extension = os.path.splitext(f)
+                    if extension in [".yaml", ".yml"] and \
+                            Helper.check_technique_convention(name):
+                        technique_files.append(os.path.join(root, f))
+        return technique_files
+
+    @staticmethod
+    def hash_file(filename) -> str:
+        sha1 = hashlib.sha1()
+        with open(filename, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                sha1.update(chunk)
+        return sha1.hexdigest()
+
+    @staticmethod
+    def create_index_entry(filename) -> dict:
+        # Parses a technique once and keeps the metadata needed for selection
+        technique = Helper.load_yaml_technique(filename)
+        if not technique or "attack_technique" not in technique:
+            return None
+        entry = {
+            "technique": technique["attack_technique"],
+            "guids": [],
+            "platforms": [],
+            "executors": [],
+            # Compact metadata of every atomic for the AtomicStore: GUID,
+            # name, platforms, executor, elevation and dependencies
+            "atomics": []
+        }
+        for atomic in technique.get("atomic_tests") or []:
+            entry["guids"].append(atomic.get("auto_generated_guid", ""))
+            atomic_executor = atomic.get("executor") or {}
+            entry["atomics"].append([
+                atomic.get("auto_generated_guid", ""),
+                atomic.get("name", ""),
+                list(atomic.get("supported_platforms") or []),
+                atomic_executor.get("name") or "",
+                bool(atomic_executor.get("elevation_required", False)),
+                bool(atomic.get("dependencies"))
+            ])
+            for platform in atomic.get("supported_platforms") or []:
+                if platform not in entry["platforms"]:
+                    entry["platforms"].append(platform)
+            executor = atomic_executor.get("name")
+            if executor is not None and executor not in entry["executors"]:
+                entry["executors"].append(executor)
+        return entry
+
+    def get_technique_ids(self, predicate=None) -> list:
+        # Returns all technique IDs known to the index, in file order. An
+        # optional predicate receives technique ID and index entry and
+        # decides which techniques are returned
+        technique_ids = []
+        known = set()
+        for entry in self.index.values():
+            if entry["technique"] in known:
+                continue
+            if predicate is None or predicate(entry["technique"], entry):
+                technique_ids.append(entry["technique"])
+                known.add(entry["technique"])
+        return technique_ids
+
+    def create_atomic_store(self, tactics=None) -> AtomicStore:
+        # Builds the queryable store of all indexed atomics without
+        # loading any YAML file
+        return AtomicStore.from_index(self.index, tactics)
+
+    def get_technique(self, technique_id) -> dict:
+        # Lazily loads a technique, merging custom atomics into the
+        # official definition when both exist
+        if technique_id in self.techniques:
+            return self.techniques[technique_id]
+        technique = None
+        for filename in self.technique_files.get(technique_id, []):
+            loaded = Helper.load_yaml_technique(filename)
+            if not loaded:
+                continue
+            if technique is None:
+                technique = loaded
+            else:
+                technique["atomic_tests"] = (technique.get("atomic_tests") or []) + \
+                    (loaded.get("atomic_tests") or [])
+        if technique is not None:
+            self.techniques[technique_id] = technique
+        return technique
+
+    def get_techniques(self) -> dict:
+        # Returns the selected techniques, or all techniques if no selection
+        # has been supplied
+        technique_ids = self.selected_ids
+        if technique_ids is None:
+            technique_ids = self.get_technique_ids()
+        techniques = {}
+        for technique_id in technique_ids:
+            technique = self.get_technique(technique_id)
+            if technique is not None:
+                techniques[technique_id] = technique
+        return techniques
@@ -0,0 +1,202 @@
+from tensorforce.environments import Environment
+import multiprocessing
+import numpy as np
+
+
+class VectorizedEnvironment(object):
+
+    def __init__(self, environment, num_environments, backend="local",
+                 max_episode_timesteps=None, auto_reset=True, **kwargs):
+        """ Steps a batch of environment instances with a single call
+
+        Parameters
+        ----------
+        environment :
+            environment class or specification as accepted by
+            Environment.create, has to be picklable for the
+            multiprocessing backend
+        num_environments :
+            number of environment instances
+        backend :
+            'local' steps all instances in this process, 'multiprocessing'
+            steps every instance in its own process
+        max_episode_timesteps :
+            optional episode length after which an instance is aborted
+        auto_reset :
+            resets terminated instances within execute, the returned states
+            of these instances are the initial states of the next episode
+        """
+        if backend not in ["local", "multiprocessing"]:
+            raise ValueError("Unknown backend for vectorized environment: " +
+                             str(backend))
+        self.num_environments = num_environments
+        self.max_episode_timesteps = max_episode_timesteps
+        self.auto_reset = auto_reset
+        self.timesteps = np.zeros(num_environments, dtype=np.int64)
+        if backend == "local":
+            self.environments = [LocalEnvironment(environment, kwargs)
+                                 for _ in range(num_environments)]
+        else:
+            self.environments = [ProcessEnvironment(environment, kwargs)
+                                 for _ in range(num_environments)]
+        # Specifications are equal for all instances
+        self.states_spec = self.environments[0].call("states")
+        self.actions_spec = self.environments[0].call("actions")
+
+    def states(self):
+        """ Returns the state space of a single instance
+        """
+        return self.states_spec
+
+    def actions(self):
+        """ Returns the action space of a single instance
+        """
+        return self.actions_spec
+
+    def reset(self):
+        """ Resets all instances
+
+        Returns
+        ----------
+        states :
+            initial states stacked along the first axis
+        """
+        for environment in self.environments:
+            environment.start("reset")
+        states = [environment.receive() for environment in self.environments]
+        self.timesteps[:] = 0
+        return VectorizedEnvironment.stack(states)
+
+    def execute(self, actions):
+        """ Executes one action in every instance
+
+        Parameters
+        ----------
+        actions :
+            actions stacked along the first axis, or a dict of such arrays
+
+        Returns
+        ----------
+        next_states :
+            next states stacked along the first axis
+        terminals :
+            integer array with 0 for running, 1 for terminal and 2 for
+            aborted episodes
+        rewards :
+            float array of rewards
+        """
+        for i, environment in enumerate(self.environments):
+            environment.start("execute", VectorizedEnvironment.unstack(actions, i))
+        outputs = [environment.receive() for environment in self.environments]
+        states = [output[0] for output in outputs]
+        terminals = np.array([int(output[1]) for output in outputs], dtype=np.int64)
+        rewards = np.array([output[2] for output in outputs], dtype=np.float32)
+
+        self.timesteps += 1
+        if self.max_episode_timesteps is not None:
+            aborted = (terminals == 0) & (self.timesteps >= self.max_episode_timesteps)
+            terminals[aborted] = 2
+        if self.auto_reset:
+            finished = np.flatnonzero(terminals)
+            for i in finished:
+                self.environments[i].start("reset")
+            for i in finished:
+                states[i] = self.environments[i].receive()
+                self.timesteps[i] = 0
+        return VectorizedEnvironment.stack(states), terminals, rewards
+
+    def close(self):
+        """ Closes all instances
+        """
+        for environment in self.environments:
+            environment.close()
+        self.environments = []
+
+    @staticmethod
+    def stack(states):
+        # Stacks states of all instances, dict states are stacked per name
+        if isinstance(states[0], dict):
+            return {name: np.stack([state[name] for state in states])
+                    for name in states[0]}
+        return np.stack(states)
+
+    @staticmethod
+    def unstack(actions, index):
+        # Selects the actions of a single instance
+        if isinstance(actions, dict):
+            return {name: value[index] for name, value in actions.items()}
+        return actions[index]
+
+
+class LocalEnvironment(object):
+
+    def __init__(self, environment, kwargs):
+        # Instance living in this process, start computes the result eagerly
+        self.environment = Environment.create(environment=environment, **kwargs)
+        self.result = None
+
+    def call(self, method, *args):
+        return getattr(self.environment, method)(*args)
+
+    def start(self, method, *args):
+        self.result = self.call(method, *args)
+
+    def receive(self):
+        result, self.result = self.result, None
+        return result
+
+    def close(self):
+        self.environment.close()
+
+
+class ProcessEnvironment(object):
+
+    def __init__(self, environment, kwargs):
+        # Instance living in its own process, start sends the request and
+        # receive blocks until the process has answered
+        self.connection, worker_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=ProcessEnvironment.serve,
+            args=(worker_connection, environment, kwargs),
+            daemon=True)
+        self.process.start()
+        worker_connection.close()
+
+    @staticmethod
+    def serve(connection, environment, kwargs):
+        environment = Environment.create(environment=environment, **kwargs)
+        try:
+            while True:
+                method, args = connection.recv()
+                if method == "close":
+                    break
+                try:
+                    connection.send((True, getattr(environment, method)(*args)))
+                except Exception as e:
+                    connection.send((False, e))
+        finally:
+            environment.close()
+            connection.close()
+
+    def call(self, method, *args):
+        self.start(method, *args)
+        return self.receive()
+
+    def start(self, method, *args):
+        self.connection.send((method, args))
+
+    def receive(self):
+        success, result = self.connection.recv()
+        if not success:
+            raise result
+        return result
+
+    def close(self):
+        try:
+            self.connection.send(("close", ()))
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(5.0)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.connection.close()
@@ -0,0 +1,33 @@
+import pytest
+import sys
+import types
+
+
+class RecordedEvent(object):
+
+    def __init__(self, message="", is_error=False, is_success=False, exit=False) -> None:
+        # Stand-in for src.Event, which is not part of every checkout
+        self.message = message
+        self.is_error = is_error
+        self.is_success = is_success
+        events.append(self)
+        if exit:
+            raise SystemExit(1)
+
+
+events = []
+event_module = types.ModuleType("src.Event")
+event_module.Event = RecordedEvent
+
+
+@pytest.fixture
+def recorded_events(monkeypatch):
+    """ Makes modules importing src.Event importable and returns the events
+    they emit, modules that already imported the real one record them too
+    """
+    del events[:]
+    monkeypatch.setitem(sys.modules, "src.Event", event_module)
+    for name, module in list(sys.modules.items()):
+        if name.startswith("src.") and getattr(module, "Event", None) not in (None, RecordedEvent):
+            monkeypatch.setattr(module, "Event", RecordedEvent)
+    return events
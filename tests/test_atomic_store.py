@@ -0,0 +1,50 @@
+from src.AtomicStore import AtomicStore
+import pytest
+
+
+index = {
+    "official/T1001.yaml": {"technique": "T1001", "atomics": [
+        ["g1", "one", ["linux", "macos"], "sh", False, True],
+        ["g2", "two", ["windows"], "powershell", True, False]]},
+    "official/T1001.001.yaml": {"technique": "T1001.001", "atomics": [
+        ["g3", "three", ["linux"], "bash", False, False]]},
+    "custom/T1001.yaml": {"technique": "T1001", "atomics": [
+        ["g4", "four", ["Linux"], "sh", True, False]]}
+}
+
+
+@pytest.fixture
+def store():
+    return AtomicStore.from_index(index, {"T1001": {"command-and-control"}})
+
+
+def guids(records):
+    return [record.guid for record in records]
+
+
+def test_custom_atomics_are_numbered_after_official_ones(store):
+    assert len(store) == 4
+    assert store.get("G4").index == 2
+    assert store.get("missing") is None
+
+
+def test_queries_intersect_the_indexes(store):
+    assert guids(store.query(platform="LINUX", executor="sh")) == ["g1", "g4"]
+    assert guids(store.query(AtomicStore.parse_query("technique=T1001*,has_dependencies=no"))) \
+        == ["g2", "g3", "g4"]
+    assert guids(store.query(tactic="Command and Control", elevation_required="true")) == \
+        ["g2", "g4"]
+    assert guids(store.query(technique="T1001", platform="macos", executor="bash")) == []
+    assert len(store.query()) == 4
+
+
+@pytest.mark.parametrize("argument", ["platform", "color=red", "elevation_required=maybe"])
+def test_invalid_queries_are_rejected(store, argument):
+    with pytest.raises(ValueError):
+        store.query(AtomicStore.parse_query(argument))
+
+
+def test_records_are_counted_per_value(store):
+    assert store.count_by("platform") == {"linux": 3, "macos": 1, "windows": 1}
+    assert store.count_by("executor", store.query(technique="T1001")) == \
+        {"sh": 2, "powershell": 1}
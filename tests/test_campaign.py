@@ -0,0 +1,116 @@
+import pytest
+import time
+
+
+def create_atomic(guid, platforms=("linux",), executor="sh"):
+    return {"auto_generated_guid": guid, "name": guid, "supported_platforms": list(platforms),
+            "executor": {"name": executor, "command": "echo " + guid}}
+
+
+facts = {"os": "linux", "elevation": False, "supported_executors": ["sh"]}
+
+
+@pytest.fixture
+def coordinator(recorded_events):
+    from src.CampaignCoordinator import CampaignCoordinator
+    technique = {"attack_technique": "T1001", "atomic_tests": [
+        create_atomic("a"), create_atomic("b"), create_atomic("c", ["windows"])]}
+    coordinator = CampaignCoordinator([technique], lease_timeout=60.0)
+    coordinator.start()
+    yield coordinator
+    coordinator.close()
+
+
+def lease(coordinator, worker, max_atomics=1):
+    response = coordinator.lease({"worker": worker, "max_atomics": max_atomics})
+    return [leased["entry"]["guid"] for leased in response["atomics"]], response
+
+
+def test_atomics_are_only_leased_to_capable_workers(coordinator):
+    worker = coordinator.register({"name": "w", "facts": facts})["worker"]
+    guids, _ = lease(coordinator, worker, max_atomics=5)
+    assert guids == ["a", "b"]
+    assert lease(coordinator, "unknown")[1]["unknown"]
+
+
+def test_idle_workers_steal_leases_not_started_yet(coordinator):
+    first = coordinator.register({"name": "first", "facts": facts})["worker"]
+    second = coordinator.register({"name": "second", "facts": facts})["worker"]
+    _, response = lease(coordinator, first, max_atomics=2)
+    started = response["atomics"][0]["lease"]
+    assert coordinator.start_atomic({"worker": first, "lease": started})["ok"]
+    assert lease(coordinator, second, max_atomics=2)[0] == ["b"]
+    stolen = response["atomics"][1]["lease"]
+    assert not coordinator.start_atomic({"worker": first, "lease": stolen})["ok"]
+
+
+def test_expired_leases_are_handed_out_again(coordinator):
+    first = coordinator.register({"name": "first", "facts": facts})["worker"]
+    second = coordinator.register({"name": "second", "facts": facts})["worker"]
+    _, response = lease(coordinator, first)
+    coordinator.start_atomic({"worker": first, "lease": response["atomics"][0]["lease"]})
+    for leased in coordinator.leases.values():
+        leased["expires"] = time.monotonic() - 1
+    assert lease(coordinator, second)[0] == ["a"]
+
+
+def test_atomics_no_worker_can_run_are_skipped(coordinator):
+    worker = coordinator.register({"name": "w", "facts": facts})["worker"]
+    _, response = lease(coordinator, worker, max_atomics=5)
+    result = {"guid": "", "executed": True, "success": True}
+    for leased in response["atomics"]:
+        assert coordinator.complete({"worker": worker, "lease": leased["lease"],
+                                     "result": result})["ok"]
+    assert lease(coordinator, worker)[0] == []
+    results = coordinator.wait(timeout=5.0)
+    assert [result["worker"] for result in results] == ["w", "w", None]
+    assert coordinator.summary() == {"w": 2}
+
+
+def create_worker(failures):
+    from src.CampaignWorker import CampaignWorker
+
+    class FlakyWorker(CampaignWorker):
+
+        def __init__(self):
+            super().__init__("http://coordinator", RecordingExecutor(), poll_interval=0.0)
+            self.failures = dict(failures)
+            self.requests = []
+
+        def request(self, path, body):
+            self.requests.append(path)
+            if self.failures.get(path, 0) > 0:
+                self.failures[path] -= 1
+                raise ConnectionRefusedError("refused")
+            return {"ok": True}
+
+    return FlakyWorker()
+
+
+class RecordingExecutor(object):
+
+    def __init__(self):
+        self.atomics = []
+
+    def run_atomic(self, atomic, technique=""):
+        self.atomics.append(atomic)
+        return {"guid": atomic["auto_generated_guid"]}
+
+
+leased = {"lease": "l", "entry": {"guid": "a", "technique": "T1001"},
+          "atomic": create_atomic("a")}
+
+
+def test_unreachable_coordinators_do_not_start_atomics(recorded_events):
+    worker = create_worker({"/start": 1})
+    assert worker.run_leased(leased) is False
+    assert worker.executor.atomics == []
+    assert [event.is_error for event in recorded_events] == [True]
+
+
+@pytest.mark.parametrize("failures, requests", [(2, 3), (5, 3)])
+def test_results_are_reported_again_after_failures(recorded_events, failures, requests):
+    worker = create_worker({"/result": failures})
+    assert worker.run_leased(leased) is True
+    assert worker.requests.count("/result") == requests
+    assert len(recorded_events) == (1 if failures >= requests else 0)
@@ -0,0 +1,66 @@
+from src.CleanupManager import CleanupManager
+from src.CommandRunner import ExecutionResult
+from src.PrereqCache import PrereqCache
+
+
+class RecordingRunner(object):
+
+    def __init__(self, exit_code=0):
+        self.exit_code = exit_code
+        self.commands = []
+
+    def run(self, command, executor, timeout=None, isolated=False):
+        self.commands.append(command)
+        return ExecutionResult(exit_code=self.exit_code)
+
+
+def test_deferred_cleanups_run_newest_first_per_technique():
+    runner = RecordingRunner()
+    manager = CleanupManager(runner, "deferred")
+    for technique, command in [("T1", "a"), ("T2", "b"), ("T1", "c")]:
+        manager.schedule(manager.register(technique, "guid", command, "sh"))
+    manager.flush("T1")
+    assert runner.commands == ["c", "a"]
+    manager.close()
+    assert runner.commands == ["c", "a", "b"]
+
+
+def test_cleanups_are_recovered_from_the_journal(tmp_path):
+    journal_file = str(tmp_path / "cleanup")
+    manager = CleanupManager(RecordingRunner(), "none", journal_file)
+    manager.register("T1", "guid", "a", "sh")
+    manager.schedule(manager.register("T1", "guid", "b", "sh"))
+    manager.run_cleanup(manager.register("T1", "guid", "c", "sh"))
+    manager.close()
+    runner = RecordingRunner()
+    assert CleanupManager.recover(journal_file, runner) == (2, 0)
+    assert runner.commands == ["b", "a"]
+    assert CleanupManager.replay(journal_file) == []
+
+
+def test_listeners_receive_the_prerequisites_of_cleaned_up_atomics(tmp_path):
+    cache = PrereqCache(str(tmp_path / "cache"), host_fingerprint="host")
+    cache.mark_satisfied("sh", "test -f payload")
+    cache.mark_satisfied("sh", "test -f other")
+    manager = CleanupManager(RecordingRunner(exit_code=1))
+    manager.add_cleanup_listener(
+        lambda cleanup, result: [cache.invalidate(*prereq) for prereq in cleanup["p"]])
+    manager.schedule(manager.register("T1", "guid", "rm payload", "sh",
+                                      [("sh", "test -f payload")]))
+    assert not cache.is_satisfied("sh", "test -f payload")
+    assert cache.is_satisfied("sh", "test -f other")
+
+
+def test_executor_checks_prerequisites_again_after_cleanups(recorded_events):
+    from src.Executor import Executor
+    cache = PrereqCache(host_fingerprint="host")
+    executor = Executor([], prereq_cache=cache, runner=RecordingRunner())
+    dependencies = {"executor": "sh",
+                    "dependencies": [{"prereq_command": "test -f #{file}"}]}
+    prereqs = executor.list_prereq_checks(dependencies, {"file": {"default": "x"}})
+    assert prereqs == [("sh", "test -f x")]
+    cache.mark_satisfied("sh", "test -f x")
+    cleanup_id = executor.register_cleanup("T1", "guid", {"name": "sh",
+                                           "cleanup_command": "rm x"}, {}, prereqs)
+    executor.cleanup_manager.schedule(cleanup_id)
+    assert not cache.is_satisfied("sh", "test -f x")
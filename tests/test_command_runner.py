@@ -0,0 +1,68 @@
+from src.CommandRunner import CommandRunner
+import os
+import pytest
+import time
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="requires sh")
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    # Killed orphans stay zombies until their new parent reaps them
+    try:
+        with open("/proc/" + str(pid) + "/stat") as stat_file:
+            return stat_file.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except OSError:
+        return True
+
+
+def test_timeouts_kill_the_whole_process_group(tmp_path):
+    pid_file = str(tmp_path / "pid")
+    command = "sleep 30 & echo $! > " + pid_file + "; echo started; wait"
+    start = time.monotonic()
+    result = CommandRunner(timeout=0.5).run(command, "sh")
+    assert time.monotonic() - start < 5.0
+    assert result.timed_out and not result.success
+    assert result.exit_code == -9
+    assert result.stdout == "started\n"
+    with open(pid_file) as f:
+        grandchild = int(f.read())
+    deadline = time.monotonic() + 5.0
+    while is_running(grandchild) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not is_running(grandchild)
+
+
+def test_output_beyond_the_limit_stops_the_process():
+    start = time.monotonic()
+    result = CommandRunner(timeout=30, max_output_bytes=1 << 16).run("yes", "sh")
+    assert time.monotonic() - start < 10.0
+    assert result.truncated and not result.timed_out
+    assert result.exit_code == -9
+    assert result.bytes_out > 1 << 16
+
+
+def test_only_the_last_lines_are_kept():
+    result = CommandRunner(buffer_lines=3).run(
+        "for i in 1 2 3 4 5; do echo $i; echo err$i >&2; done", "sh")
+    assert result.stdout == "3\n4\n5\n"
+    assert result.stderr == "err3\nerr4\nerr5\n"
+    assert result.truncated
+    assert result.bytes_out == 5 * 2 + 5 * 5
+
+
+def test_results_report_exit_code_output_and_memory():
+    result = CommandRunner().run("printf abc; exit 3", "sh")
+    assert (result.exit_code, result.success, result.timed_out) == (3, False, False)
+    assert (result.stdout, result.bytes_out, result.truncated) == ("abc", 3, False)
+    if hasattr(os, "wait4"):
+        assert result.peak_rss > 0
+    assert result.to_dict()["exit_code"] == 3
+
+
+def test_unsupported_executors_are_not_run():
+    result = CommandRunner().run("echo", "manual")
+    assert result.exit_code is None and "Unsupported executor" in result.stderr
@@ -0,0 +1,28 @@
+from src.CommandTemplate import CommandTemplate
+
+
+def test_placeholders_are_rendered_in_one_pass():
+    template = CommandTemplate.compile("cp #{source} #{target} && cat #{source}")
+    assert template.placeholders == {"source", "target"}
+    # Values containing placeholders are not rendered again
+    command, unresolved = template.render({"source": "#{target}", "target": "/tmp/b"})
+    assert command == "cp #{target} /tmp/b && cat #{target}"
+    assert unresolved == []
+
+
+def test_missing_values_are_kept_and_reported_once():
+    command, unresolved = CommandTemplate.compile("#{a} #{b} #{a}").render({"b": "x"})
+    assert command == "#{a} x #{a}"
+    assert unresolved == ["a"]
+
+
+def test_overrides_replace_input_argument_defaults():
+    input_args = {"file": {"default": "payload"}, "port": {"default": 8080},
+                  "empty": {"description": "no default"}}
+    values = CommandTemplate.create_values(input_args, {"file": "other"})
+    assert values == {"file": "other", "port": "8080"}
+
+
+def test_templates_are_compiled_once():
+    assert CommandTemplate.compile("echo #{a}") is CommandTemplate.compile("echo #{a}")
+    assert CommandTemplate.compile("echo").render({}) == ("echo", [])
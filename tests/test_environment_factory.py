@@ -0,0 +1,82 @@
+from src.EnvironmentFactory import EnvironmentFactory
+import copy
+import json
+import os
+import pytest
+
+
+atomic_envs_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                "atomic_envs")
+
+valid_spec = {
+    "mitre_mapping": "T1486",
+    "action": {"file_end": "enc,gg", "wait_time": {"low": "0", "high": "2"}},
+    "executor": {"name": "bash", "command": "encrypt_new_file #{file_end}"},
+    "reward": {"1": "passes test_files_encrypt.py", "-1": "detected", "-0.5": "else"}
+}
+
+
+def test_the_specification_of_t1486_is_compiled():
+    spec = EnvironmentFactory.load_spec(atomic_envs_path, "T1486")
+    assert spec.technique == "T1486"
+    assert spec.action_names == ("file_end", "wait_time")
+    # Actions are integer encoded, their indices decode to these values
+    assert spec.action_values[0] == ("enc", "gg")
+    assert spec.action_values[1] == tuple(range(0, 31))
+    assert spec.executor_name == "bash"
+    assert spec.command_template.placeholders == {"file_end"}
+    assert spec.command_template.render({"file_end": "gg"}) == ("encrypt_new_file gg", [])
+    assert spec.rewards == ((("passes", "test_files_encrypt.py"), 1.0),
+                            (("detected", None), -1.0))
+    assert spec.default_reward == -0.5
+    assert spec.spec_path == os.path.join(atomic_envs_path, "T1486.json")
+
+
+def break_spec(change):
+    spec = copy.deepcopy(valid_spec)
+    change(spec)
+    return spec
+
+
+@pytest.mark.parametrize("spec, message", [
+    (break_spec(lambda spec: spec.pop("reward")), "misses 'reward'"),
+    (break_spec(lambda spec: spec.update(mitre_mapping="1486")), "Invalid technique ID"),
+    (break_spec(lambda spec: spec["action"].update(file_end=" , ")), "has no values"),
+    (break_spec(lambda spec: spec["action"].update(wait_time={"low": "a", "high": "2"})),
+     "is not numeric"),
+    (break_spec(lambda spec: spec["action"].update(wait_time=3)), "Unsupported definition"),
+    (break_spec(lambda spec: spec["executor"].pop("command")), "needs a 'name' and a 'command'"),
+    (break_spec(lambda spec: spec["executor"].update(command="run #{unknown}")),
+     "placeholders without action: unknown"),
+    (break_spec(lambda spec: spec["reward"].update(high="detected")), "Reward is not numeric"),
+    (break_spec(lambda spec: spec["reward"].update({"2": "succeeds"})),
+     "Unsupported reward condition"),
+    (break_spec(lambda spec: spec["reward"].pop("-0.5")), "needs an 'else' condition")
+])
+def test_malformed_specifications_are_rejected(spec, message):
+    with pytest.raises(ValueError, match=message):
+        EnvironmentFactory.compile_spec(spec)
+
+
+def test_missing_and_unparsable_files_are_rejected(tmp_path):
+    with pytest.raises(ValueError, match="No environment specification found"):
+        EnvironmentFactory.load_spec(str(tmp_path), "T1486")
+    (tmp_path / "T1486.json").write_text("{")
+    with pytest.raises(ValueError, match="Loading environment specification went wrong"):
+        EnvironmentFactory.load_spec(str(tmp_path), "T1486")
+
+
+def test_compiled_specifications_are_cached_until_the_file_changes(tmp_path):
+    spec_file = tmp_path / "T1486.json"
+    spec_file.write_text(json.dumps(valid_spec))
+    spec = EnvironmentFactory.load_spec(str(tmp_path), "T1486")
+    assert EnvironmentFactory.load_spec(str(tmp_path), "T1486") is spec
+
+    changed = break_spec(lambda spec: spec["action"].update(file_end="enc"))
+    spec_file.write_text(json.dumps(changed))
+    mtime_ns = os.stat(str(spec_file)).st_mtime_ns + 1000000
+    os.utime(str(spec_file), ns=(mtime_ns, mtime_ns))
+    reloaded = EnvironmentFactory.load_spec(str(tmp_path), "T1486")
+    assert reloaded is not spec
+    assert reloaded.action_values[0] == ("enc",)
+    assert EnvironmentFactory.load_spec(str(tmp_path), "T1486") is reloaded
@@ -0,0 +1,57 @@
+from src.ExecutionPlan import ExecutionPlan
+from src.SelectionEngine import SelectionEngine
+import pytest
+
+
+class PreconditionExecutor(object):
+
+    preconditions = {"os": "linux", "elevation": False, "supported_executors": ["sh"]}
+
+    def check_atomic_preconditions(self, atomic):
+        if "linux" not in atomic["supported_platforms"]:
+            return False, "Required operating system not present"
+        return True, ""
+
+
+def create_atomic(guid, platform="linux"):
+    return {"auto_generated_guid": guid, "name": "atomic " + guid,
+            "supported_platforms": [platform], "executor": {"name": "sh"}}
+
+
+techniques = [
+    {"attack_technique": "T1001", "atomic_tests": [create_atomic("a"),
+                                                   create_atomic("b", "windows")]},
+    {"attack_technique": "T1002", "atomic_tests": [create_atomic("c")]}
+]
+
+
+def test_plans_record_why_atomics_are_skipped():
+    selection = SelectionEngine()
+    selection.add("exclude", "T1002")
+    plan = ExecutionPlan.compile(techniques, PreconditionExecutor(), selection)
+    assert [(entry["guid"], entry["run"], entry["reason"]) for entry in plan.entries] == [
+        ("a", True, ""), ("b", False, "Required operating system not present"),
+        ("c", False, "Not selected: exclude T1002")]
+    assert plan.summary() == "Execution plan for linux: 1 atomics to run, 2 skipped"
+
+
+def test_plans_resolve_only_unchanged_atomics():
+    plan = ExecutionPlan.compile(techniques, PreconditionExecutor())
+    changed = [techniques[0], {"attack_technique": "T1002",
+                               "atomic_tests": [create_atomic("d")]}]
+    assert [atomic is not None for _, atomic in plan.resolve(changed)] == \
+        [True, True, False]
+
+
+def test_saved_plans_are_loaded_and_compared(tmp_path):
+    plan = ExecutionPlan.compile(techniques, PreconditionExecutor())
+    filename = str(tmp_path / "plan.json")
+    assert plan.save(filename)[1] is False
+    loaded = ExecutionPlan.load(filename)
+    assert loaded.entries == plan.entries and loaded.diff(plan) == []
+    other = ExecutionPlan.compile(techniques[:1], PreconditionExecutor())
+    other.entries[0] = dict(other.entries[0], run=False, reason="excluded")
+    assert [(guid, own is None, theirs is None) for guid, own, theirs in plan.diff(other)] == \
+        [("a", False, False), ("c", False, True)]
+    with pytest.raises(ValueError):
+        ExecutionPlan.from_dict({"version": 0})
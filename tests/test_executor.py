@@ -0,0 +1,73 @@
+from src.CommandRunner import ExecutionResult
+import pytest
+import random
+import threading
+import time
+
+
+def create_atomic(guid, command=None):
+    return {"auto_generated_guid": guid, "name": "atomic " + guid, "description": "",
+            "supported_platforms": ["linux"],
+            "executor": {"name": "sh", "command": command or "run " + guid}}
+
+
+class SleepingRunner(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = {}
+        self.overlaps = []
+        self.commands = []
+
+    def run(self, command, executor, timeout=None, isolated=False):
+        technique = command.split()[1][:5]
+        with self.lock:
+            if self.running.get(technique):
+                self.overlaps.append(command)
+            self.running[technique] = True
+            self.commands.append(command)
+        time.sleep(random.uniform(0.0, 0.02))
+        with self.lock:
+            self.running[technique] = False
+        return ExecutionResult(exit_code=0 if "fail" not in command else 1)
+
+
+@pytest.fixture
+def executor(recorded_events):
+    from src.Executor import Executor
+    from src.HostFacts import HostFacts
+    host_facts = HostFacts()
+    host_facts.facts.update(os="linux", executors={"sh": {"path": "/bin/sh", "version": ""}})
+    return Executor([], runner=SleepingRunner(), host_facts=host_facts)
+
+
+@pytest.mark.parametrize("affinity, groups", [
+    ("technique", [[0, 2], [1], [3]]),
+    ("none", [[0], [1], [2], [3]]),
+    ({"T1001": "shared", "g2": "shared"}, [[0, 1, 2], [3]])
+])
+def test_atomics_are_grouped_by_affinity(recorded_events, affinity, groups):
+    from src.Executor import Executor
+    atomics = [("T1001", create_atomic("g1")), ("T1002", create_atomic("g2")),
+               ("T1001", create_atomic("g3")), ("T1003", create_atomic("g4"))]
+    assert Executor.group_by_affinity(atomics, affinity) == groups
+
+
+def test_results_are_returned_in_plan_order_with_several_workers(executor):
+    techniques = [{"attack_technique": "T100" + str(technique), "atomic_tests": [
+        create_atomic(guid, "run T100" + str(technique) + "-" + guid +
+                      (" fail" if guid.endswith("3") else ""))
+        for guid in ["a" + str(technique) + str(index) for index in range(4)]]}
+        for technique in range(1, 5)]
+    techniques[1]["atomic_tests"][0]["supported_platforms"] = ["windows"]
+    plan = executor.compile_plan(techniques)
+    listened = []
+    executor.add_result_listener(lambda entry, result: listened.append(result["guid"]))
+    results = executor.run_plan(plan, techniques, workers=4)
+    assert [result["guid"] for result in results] == [entry["guid"] for entry in plan.entries]
+    assert sorted(listened) == sorted(entry["guid"] for entry in plan.entries)
+    assert [result["success"] for result in results[4:8]] == [False, True, True, False]
+    assert results[4]["executed"] is False
+    # Atomics of a technique never run concurrently
+    assert executor.runner.overlaps == []
+    assert len(executor.runner.commands) == 15
@@ -0,0 +1,79 @@
+from src.ExperienceDataset import ExperienceWriter, ExperienceReader
+import numpy as np
+import os
+import pytest
+
+
+def write_episodes(path, episodes, flush_every=2):
+    writer = ExperienceWriter(str(path), "T1486", flush_every=flush_every)
+    indices = []
+    for length in episodes:
+        for step in range(length):
+            indices.append(writer.append({"a": step, "b": [step, 0.5]}, {"action": 1},
+                                         float(step), step == length - 1, 0.1))
+    return writer, indices
+
+
+def test_rows_are_read_back_in_batches_and_episodes(tmp_path):
+    writer, indices = write_episodes(tmp_path, [3, 2])
+    writer.close()
+    assert indices == list(range(5))
+    reader = ExperienceReader(str(tmp_path))
+    assert len(reader) == 5
+    batch = reader.get(slice(0, 3))
+    assert batch["states"]["a"].tolist() == [0, 1, 2]
+    assert batch["states"]["b"].shape == (3, 2)
+    assert batch["actions"]["action"].tolist() == [1, 1, 1]
+    assert [len(b["reward"]) for b in reader.batches(2)] == [2, 2, 1]
+    shuffled = np.concatenate([b["reward"] for b in reader.batches(2, shuffle=True, seed=0)])
+    assert sorted(shuffled.tolist()) == [0.0, 0.0, 1.0, 1.0, 2.0]
+    assert [episode["terminal"].tolist() for episode in reader.episodes()] == \
+        [[0, 0, 1], [0, 1]]
+
+
+def test_datasets_are_continued_and_updated(tmp_path):
+    writer, _ = write_episodes(tmp_path, [2])
+    writer.close()
+    writer, indices = write_episodes(tmp_path, [3], flush_every=10)
+    assert indices == [2, 3, 4]
+    # Flushed and still buffered rows are updated alike
+    writer.update(0, "reward", -1.0)
+    writer.update(4, "terminal", 2)
+    writer.close()
+    reader = ExperienceReader(str(tmp_path))
+    assert reader.get(slice(None))["reward"].tolist() == [-1.0, 1.0, 0.0, 1.0, 2.0]
+    assert reader.get(slice(None))["terminal"].tolist() == [0, 1, 0, 0, 2]
+    assert reader.header["techniques"] == ["T1486"]
+
+
+@pytest.mark.parametrize("states", [{"a": 1}, {"a": 1, "b": 2.0, "c": 3}])
+def test_rows_with_other_columns_are_rejected(tmp_path, states):
+    writer = ExperienceWriter(str(tmp_path), flush_every=1)
+    writer.append({"a": 1, "b": 2.0}, 0, 0.0, False, 0.0)
+    with pytest.raises(ValueError):
+        writer.append(states, 0, 0.0, False, 0.0)
+    writer.append({"a": 2, "b": 3.0}, 0, 0.0, True, 0.0)
+    writer.close()
+    sizes = {name: os.path.getsize(str(tmp_path / name)) for name in os.listdir(str(tmp_path))
+             if name.endswith(".bin")}
+    assert sizes["states.a.bin"] == 2 * 4 and sizes["terminal.bin"] == 2
+    assert len(ExperienceReader(str(tmp_path))) == 2
+
+
+def test_buffered_rows_are_checked_before_writing(tmp_path):
+    writer = ExperienceWriter(str(tmp_path), flush_every=10)
+    writer.append({"a": 1, "b": 2.0}, 0, 0.0, False, 0.0)
+    writer.append({"a": 2, "b": 3.0}, 0, 0.0, False, 0.0)
+    del writer.rows[1]["states/b"]
+    with pytest.raises(ValueError):
+        writer.flush()
+    assert [name for name in os.listdir(str(tmp_path)) if name.endswith(".bin")] == []
+    assert writer.header["columns"] == {}
+
+
+def test_unknown_datasets_are_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        ExperienceReader(str(tmp_path))
+    (tmp_path / "header.json").write_text('{"version": 0}')
+    with pytest.raises(ValueError):
+        ExperienceWriter(str(tmp_path))
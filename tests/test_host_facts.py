@@ -0,0 +1,38 @@
+from src.HostFacts import HostFacts
+import json
+import pytest
+
+
+@pytest.mark.parametrize("executor, command, tool", [
+    ("sh", "command -v curl >/dev/null", "curl"),
+    ("bash", "which  jq", "jq"),
+    ("powershell", "if (Get-Command nmap -ErrorAction Ignore) {exit 0} else {exit 1}", "nmap"),
+    ("sh", "test -f /tmp/payload", None),
+    ("command_prompt", "where curl", None)
+])
+def test_tool_checks_are_recognized(executor, command, tool):
+    assert HostFacts.find_checked_tool(executor, command) == tool
+
+
+def test_tools_are_not_persisted_across_runs(tmp_path, monkeypatch):
+    cache_file = str(tmp_path / "facts.json")
+    monkeypatch.setattr("shutil.which", lambda name: "/usr/bin/" + name)
+    facts = HostFacts(cache_file)
+    assert facts.check_prereq("sh", "which curl") is True
+    facts.save()
+    with open(cache_file) as f:
+        assert "tools" not in json.load(f)["facts"]
+    monkeypatch.setattr("shutil.which", lambda name: None)
+    reloaded = HostFacts(cache_file)
+    assert not reloaded.changed
+    assert reloaded.check_prereq("sh", "which curl") is False
+
+
+def test_forgotten_tools_are_looked_up_again(monkeypatch):
+    monkeypatch.setattr("shutil.which", lambda name: None)
+    facts = HostFacts()
+    assert not facts.has_tool("curl")
+    monkeypatch.setattr("shutil.which", lambda name: "/usr/bin/" + name)
+    assert not facts.has_tool("curl")
+    facts.forget_tool("curl")
+    assert facts.has_tool("curl")
@@ -0,0 +1,65 @@
+from src.HyperparameterSweep import HyperparameterSweep
+import json
+import pytest
+
+
+space = {
+    "techniques": ["T1486"],
+    "agents": ["ppo", "random"],
+    "hyperparameters": {"learning_rate": [0.001, 0.01]}
+}
+
+
+def create_agent_spec(agent, max_timesteps, hyperparameters=None):
+    if agent == "random":
+        return {"agent": agent}
+    return dict({"agent": agent}, **(hyperparameters or {}))
+
+
+def create_sweep(store_file, **kwargs):
+    return HyperparameterSweep("atomic_envs/", space, str(store_file), create_agent_spec,
+                               window=2, grace_episodes=2, **kwargs)
+
+
+def test_configurations_ignoring_hyperparameters_are_trained_once(tmp_path):
+    sweep = create_sweep(tmp_path / "sweep")
+    agents = [config["agent"] for config in sweep.configs]
+    assert agents == ["ppo", "ppo", "random"]
+
+
+def test_run_ids_depend_on_training_options(tmp_path):
+    config = create_sweep(tmp_path / "sweep").configs[0]
+    run_ids = {create_sweep(tmp_path / "sweep", **options).create_run_id(config)
+               for options in [{}, {"episodes": 5}, {"max_timesteps": 5}, {"seed": 1},
+                               {"outcomes": {("run", "sh", "true"): [{"exit_code": 0}]}}]}
+    assert len(run_ids) == 5
+    assert create_sweep(tmp_path / "sweep").create_run_id(config) in run_ids
+
+
+def test_finished_runs_of_other_options_are_not_reused(tmp_path):
+    store_file = tmp_path / "sweep"
+    sweep = create_sweep(store_file)
+    with open(store_file, "w") as f:
+        for config in sweep.configs:
+            run_id = sweep.create_run_id(config)
+            f.write(json.dumps({"run": run_id, "config": config}) + "\n")
+            f.write(json.dumps({"run": run_id, "status": "done"}) + "\n")
+    for options, finished in [({}, 3), ({"episodes": 5}, 0)]:
+        other = create_sweep(store_file, **options)
+        other.load_store()
+        assert sum(1 for config in other.configs
+                   if other.runs.get(other.create_run_id(config))) == finished
+
+
+@pytest.mark.parametrize("rewards, dominated", [([-1.0, -1.0], True), ([1.0, 1.0], False),
+                                                ([-1.0], False)])
+def test_runs_below_the_median_of_their_peers_are_stopped(tmp_path, rewards, dominated):
+    sweep = create_sweep(tmp_path / "sweep")
+    config = {"technique": "T1486", "agent": "ppo", "hyperparameters": {}}
+    sweep.runs = {
+        "a": {"config": config, "rewards": [0.5, 0.5, 0.5]},
+        "b": {"config": config, "rewards": [0.0, 0.2]},
+        "c": {"config": dict(config, technique="T1003"), "rewards": [-5.0, -5.0]},
+        "run": {"config": config, "rewards": rewards}
+    }
+    assert sweep.is_dominated("run") is dominated
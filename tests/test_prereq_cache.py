@@ -0,0 +1,139 @@
+from src.CommandRunner import ExecutionResult
+from src.PrereqCache import PrereqCache
+import json
+import pytest
+import threading
+import time
+
+
+class InstallingRunner(object):
+
+    def __init__(self, installed=False):
+        # Checks succeed once the prerequisite was fetched
+        self.installed = installed
+        self.lock = threading.Lock()
+        self.commands = []
+
+    def run(self, command, executor, timeout=None, isolated=False):
+        with self.lock:
+            self.commands.append(command)
+            if command.startswith("fetch"):
+                time.sleep(0.01)
+                self.installed = True
+            return ExecutionResult(exit_code=0 if self.installed else 1)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def executor_for(recorded_events):
+    from src.Executor import Executor
+    from src.HostFacts import HostFacts
+
+    def create(runner, cache):
+        host_facts = HostFacts()
+        host_facts.facts.update(os="linux", executors={"sh": {"path": "/bin/sh", "version": ""}})
+        return Executor([], prereq_cache=cache, runner=runner, host_facts=host_facts)
+    return create
+
+
+dependencies = {"executor": "sh", "dependencies": [
+    {"description": "payload", "prereq_command": "test -f payload",
+     "get_prereq_command": "fetch payload"}]}
+
+
+def test_satisfied_prerequisites_expire_after_the_ttl(clock):
+    cache = PrereqCache(ttl=60, host_fingerprint="host")
+    cache.mark_satisfied("sh", "test -f payload")
+    clock[0] += 60
+    assert cache.is_satisfied("sh", "test -f payload")
+    clock[0] += 1
+    assert not cache.is_satisfied("sh", "test -f payload")
+
+
+def test_the_host_fingerprint_is_part_of_the_key():
+    cache = PrereqCache(host_fingerprint="host")
+    other = PrereqCache(host_fingerprint="other host")
+    assert cache.create_key("sh", "test -f payload") == \
+        PrereqCache(host_fingerprint="host").create_key("sh", "test -f payload")
+    assert cache.create_key("sh", "test -f payload") != \
+        other.create_key("sh", "test -f payload")
+    assert cache.create_key("sh", "test -f payload") != \
+        cache.create_key("bash", "test -f payload")
+
+
+def test_invalidate_forgets_one_or_all_prerequisites():
+    cache = PrereqCache(host_fingerprint="host")
+    cache.mark_satisfied("sh", "test -f payload")
+    cache.mark_satisfied("sh", "test -f other")
+    cache.mark_failed("sh", "test -f missing")
+    cache.invalidate("sh", "test -f payload")
+    assert not cache.is_satisfied("sh", "test -f payload")
+    assert cache.is_satisfied("sh", "test -f other")
+    assert cache.has_failed("sh", "test -f missing")
+    cache.invalidate()
+    assert not cache.is_satisfied("sh", "test -f other")
+    assert not cache.has_failed("sh", "test -f missing")
+
+
+def test_satisfied_prerequisites_survive_a_save_and_load(tmp_path, clock):
+    cache_file = str(tmp_path / "prereqs.json")
+    cache = PrereqCache(cache_file, ttl=60, host_fingerprint="host")
+    cache.mark_satisfied("sh", "test -f payload")
+    cache.mark_failed("sh", "test -f missing")
+    assert cache.save() == ("Saved prerequisite cache", False)
+    assert list(json.loads((tmp_path / "prereqs.json").read_text())) == [cache.create_key("sh", "test -f payload")]
+    loaded = PrereqCache(cache_file, ttl=60, host_fingerprint="host")
+    assert loaded.is_satisfied("sh", "test -f payload")
+    # Failures are only remembered for the current run
+    assert not loaded.has_failed("sh", "test -f missing")
+    assert not PrereqCache(cache_file, host_fingerprint="other host").is_satisfied(
+        "sh", "test -f payload")
+    clock[0] += 61
+    assert not PrereqCache(cache_file, ttl=60, host_fingerprint="host").is_satisfied(
+        "sh", "test -f payload")
+
+
+def test_saving_without_a_cache_file_is_not_an_error():
+    assert PrereqCache(host_fingerprint="host").save() == \
+        ("Prerequisite cache is not persisted", False)
+
+
+@pytest.mark.parametrize("installed, commands", [
+    (True, ["test -f payload"]),
+    (False, ["test -f payload", "fetch payload", "test -f payload"])
+])
+def test_prerequisites_are_only_fetched_if_the_check_fails(executor_for, installed, commands):
+    runner = InstallingRunner(installed)
+    executor = executor_for(runner, PrereqCache(host_fingerprint="host"))
+    assert executor.execute_dependencies(dependencies, {}) == (True, "")
+    assert runner.commands == commands
+
+
+def test_atomics_sharing_a_prerequisite_fetch_it_once(executor_for):
+    runner = InstallingRunner()
+    executor = executor_for(runner, PrereqCache(host_fingerprint="host"))
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        executor.execute_dependencies(dependencies, {}))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [(True, ""), (True, "")]
+    assert runner.commands == ["test -f payload", "fetch payload", "test -f payload"]
+
+
+def test_failed_prerequisites_are_not_checked_again(executor_for):
+    runner = InstallingRunner()
+    failing = {"executor": "sh", "dependencies": [
+        {"description": "payload", "prereq_command": "test -f payload"}]}
+    executor = executor_for(runner, PrereqCache(host_fingerprint="host"))
+    assert executor.execute_dependencies(failing, {}) == (False, "payload")
+    assert executor.execute_dependencies(failing, {}) == (False, "payload")
+    assert runner.commands == ["test -f payload", "test -f payload"]
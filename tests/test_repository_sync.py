@@ -0,0 +1,131 @@
+from src.RepositorySync import RepositorySync
+import email.message
+import io
+import os
+import pytest
+import shutil
+import zipfile
+
+
+files = {"T1001/T1001.yaml": b"attack_technique: T1001\n",
+         "T1002/T1002.yaml": b"attack_technique: T1002\n",
+         "T1002/src/payload.sh": b"echo payload\n"}
+
+
+def create_archive(filename, contents):
+    with zipfile.ZipFile(filename, "w") as archive:
+        archive.writestr("atomic-red-team-master/README.md", b"readme")
+        for name, content in contents.items():
+            archive.writestr("atomic-red-team-master/atomics/" + name, content)
+    return str(filename)
+
+
+def create_mirror(path, contents):
+    shutil.rmtree(str(path), ignore_errors=True)
+    for name, content in contents.items():
+        filename = os.path.join(str(path), "atomics", name)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, "wb") as f:
+            f.write(content)
+    os.makedirs(os.path.join(str(path), ".git"), exist_ok=True)
+    return str(path)
+
+
+def read_tree(path):
+    tree = {}
+    for root, _, names in os.walk(path):
+        for name in names:
+            filename = os.path.join(root, name)
+            with open(filename, "rb") as f:
+                tree[os.path.relpath(filename, path).replace(os.sep, "/")] = f.read()
+    return tree
+
+
+def changed_files():
+    changed = dict(files)
+    changed["T1001/T1001.yaml"] = b"attack_technique: T1001\natomic_tests: []\n"
+    del changed["T1002/src/payload.sh"]
+    return changed
+
+
+@pytest.mark.parametrize("create_source", [
+    lambda path, contents: create_archive(path / "atomics.zip", contents),
+    lambda path, contents: create_mirror(path / "mirror", contents)
+], ids=["zip", "mirror"])
+def test_sources_are_synced_incrementally(tmp_path, create_source):
+    target = str(tmp_path / "tests" / "official")
+    sync = RepositorySync(target)
+    message, is_error = sync.sync(create_source(tmp_path, files))
+    assert not is_error, message
+    assert read_tree(target) == files
+    unchanged = os.stat(os.path.join(target, "T1002", "T1002.yaml"))
+    message, is_error = sync.sync(create_source(tmp_path, changed_files()))
+    assert not is_error, message
+    assert sync.stats == {"written": 1, "unchanged": 1, "removed": 1}
+    assert read_tree(target) == changed_files()
+    # Unchanged files are hard linked, not written again
+    kept = os.stat(os.path.join(target, "T1002", "T1002.yaml"))
+    assert (kept.st_ino, kept.st_mtime_ns) == (unchanged.st_ino, unchanged.st_mtime_ns)
+    assert sorted(os.listdir(str(tmp_path / "tests"))) == ["official"]
+
+
+def test_members_escaping_the_target_are_rejected(tmp_path):
+    archive = create_archive(tmp_path / "atomics.zip", {"../escape.yaml": b""})
+    message, is_error = RepositorySync(str(tmp_path / "official")).sync(archive)
+    assert is_error and "Illegal path" in message
+    assert not os.path.exists(str(tmp_path / "escape.yaml"))
+
+
+class Response(io.BytesIO):
+
+    def __init__(self, content, etag):
+        super().__init__(content)
+        self.headers = email.message.Message()
+        self.headers["ETag"] = etag
+
+
+def test_unchanged_downloads_reuse_the_archive(tmp_path, monkeypatch):
+    from urllib.error import HTTPError
+    content = open(create_archive(tmp_path / "source.zip", files), "rb").read()
+    requests = []
+
+    def urlopen(request):
+        requests.append(request.get_header("If-none-match"))
+        if requests[-1] == '"v1"':
+            raise HTTPError(request.full_url, 304, "Not Modified", None, None)
+        return Response(content, '"v1"')
+
+    monkeypatch.setattr("urllib.request.urlopen", urlopen)
+    target = str(tmp_path / "official")
+    archive_file = str(tmp_path / ".atomics.zip")
+    sync = RepositorySync(target, archive_file=archive_file)
+    assert sync.sync("https://example.com/master.zip") == \
+        ("Synced atomic tests: 3 written, 0 unchanged, 0 removed", False)
+    assert sync.sync("https://example.com/master.zip") == ("Atomic tests are up to date", False)
+    assert requests == [None, '"v1"']
+    assert open(archive_file + ".etag").read() == '"v1"'
+    assert read_tree(target) == files
+
+
+@pytest.mark.parametrize("leftovers", [["old"], ["old", "sync"], ["target", "old", "sync"]])
+def test_interrupted_swaps_are_recovered(tmp_path, leftovers):
+    target = str(tmp_path / "official")
+    RepositorySync(target).sync(create_mirror(tmp_path / "mirror", files))
+    # Simulates a crash between or after the renames of a swap
+    if "old" in leftovers:
+        os.rename(target, target + ".old")
+    if "sync" in leftovers:
+        create_mirror(tmp_path / "partial", {"T1001/T1001.yaml": b"partial"})
+        os.rename(str(tmp_path / "partial" / "atomics"), target + ".sync")
+    if "target" in leftovers:
+        create_mirror(tmp_path / "new", changed_files())
+        os.rename(str(tmp_path / "new" / "atomics"), target)
+    sync = RepositorySync(target)
+    message, is_error = sync.sync(str(tmp_path / "missing.zip"))
+    assert is_error
+    expected = changed_files() if "target" in leftovers else files
+    assert read_tree(target) == expected
+    assert not os.path.exists(target + ".old")
+    assert not sync.sync(str(tmp_path / "mirror"))[1]
+    assert read_tree(target) == files
+    assert not os.path.exists(target + ".sync")
@@ -0,0 +1,73 @@
+from src.ResultStore import ResultStore
+import pytest
+import sqlite3
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultStore(str(tmp_path / "results.db"), batch_size=2)
+    yield store
+    store.close()
+
+
+def record(store, guid, technique, executed=True, success=True):
+    store.record({"technique": technique},
+                 {"guid": guid, "executed": executed, "success": success, "exit_code": 0})
+
+
+def test_coverage_is_maintained_by_triggers(store):
+    run = store.start_run("a", "plan")
+    record(store, "g1", "T1001", success=False)
+    record(store, "g2", "T1001")
+    record(store, "g3", "T1002", executed=False, success=False)
+    record(store, "g1", "T1001")
+    # Skips of resumed runs do not replace executed atomics
+    record(store, "g2", "T1001", executed=False, success=False)
+    store.finish_run()
+    assert store.get_technique_coverage(run) == {"T1001": (2, 2, 2), "T1002": (1, 0, 0)}
+    store.set_tactics({"T1001": ["execution"], "T1002": ["execution", "impact"],
+                       "T1003": ["impact"]})
+    assert store.get_tactic_coverage(run) == {"execution": (2, 1, 1), "impact": (2, 0, 0)}
+    assert store.get_uncovered_techniques(run) == ["T1002", "T1003"]
+
+
+def test_runs_are_compared_per_technique_and_atomic(store):
+    first = store.start_run("first")
+    for guid, technique, success in [("g1", "T1001", True), ("g2", "T1001", False),
+                                     ("g3", "T1002", True)]:
+        record(store, guid, technique, success=success)
+    store.finish_run()
+    second = store.start_run("second")
+    for guid, technique, success in [("g1", "T1001", False), ("g2", "T1001", True),
+                                     ("g4", "T1003", True)]:
+        record(store, guid, technique, success=success)
+    store.finish_run()
+    assert store.diff_atomics(first, second) == {
+        "regressed": [("T1001", "g1")], "fixed": [("T1001", "g2")],
+        "added": [("T1003", "g4")], "removed": [("T1002", "g3")]}
+    assert store.diff_techniques(first, second) == [
+        ("T1002", (1, 1, 1), None), ("T1003", None, (1, 1, 1))]
+    assert store.find_run("previous")["id"] == first
+    assert store.find_run("second")["succeeded"] == 2
+
+
+def test_resumed_runs_are_found_by_host_and_plan(store):
+    store.start_run("local", "plan", "host")
+    store.finish_run()
+    store.start_run("campaign", "other", "campaign@host:8700")
+    store.finish_run()
+    assert store.find_latest_run("host") == {"name": "local", "plan": "plan"}
+    assert store.find_latest_run("elsewhere") is None
+    assert store.find_run("latest")["plan"] == "other"
+    assert store.start_run("local", "plan", "host") == store.find_run("local")["id"]
+    with pytest.raises(ValueError):
+        store.find_run("unknown")
+
+
+def test_stores_of_other_versions_are_rejected(tmp_path):
+    filename = str(tmp_path / "results.db")
+    connection = sqlite3.connect(filename)
+    connection.execute("PRAGMA user_version=" + str(ResultStore.schema_version + 1))
+    connection.close()
+    with pytest.raises(ValueError):
+        ResultStore(filename)
@@ -0,0 +1,98 @@
+from src.RewardPipeline import RewardPipeline, DelayedExperience
+import os
+import pytest
+import threading
+
+
+specs_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          "atomic_envs")
+
+
+class ListeningEnvironment(object):
+
+    default_status = 2
+
+    def __init__(self):
+        self.listeners = []
+
+    def add_reward_listener(self, listener):
+        self.listeners.append(listener)
+
+    def credit(self, transition_id, status, reward):
+        for listener in self.listeners:
+            listener(transition_id, status, reward)
+
+
+def test_rewards_are_credited_in_priority_order():
+    pipeline = RewardPipeline(max_pending=2, max_checks=2, timeout=5.0)
+    credited = []
+    pipeline.submit(0, [(0, 1.0, lambda: False), (1, -1.0, lambda: True)], (2, -0.5),
+                    credit=lambda *credit: credited.append(credit))
+    pipeline.submit(1, [(0, 1.0, lambda: False)], (2, -0.5))
+    assert sorted(pipeline.drain(5.0)) == [(0, 1, -1.0), (1, 2, -0.5)]
+    assert credited == [(0, 1, -1.0)]
+    pipeline.close()
+
+
+def test_submit_blocks_while_max_pending_transitions_are_pending():
+    pipeline = RewardPipeline(max_pending=2, max_checks=2, timeout=5.0)
+    release = threading.Event()
+    for transition_id in range(2):
+        pipeline.submit(transition_id, [(0, 1.0, release.wait)], (2, -0.5))
+    third = threading.Thread(target=pipeline.submit,
+                             args=(2, [(0, 1.0, lambda: True)], (2, -0.5)))
+    third.start()
+    try:
+        third.join(0.2)
+        assert third.is_alive()
+        assert len(pipeline.pending) == 2
+    finally:
+        release.set()
+        third.join(5.0)
+    assert not third.is_alive()
+    assert sorted(pipeline.drain(5.0)) == [(0, 0, 1.0), (1, 0, 1.0), (2, 0, 1.0)]
+    pipeline.close()
+
+
+def test_delayed_episodes_end_with_the_first_met_condition():
+    environment = ListeningEnvironment()
+    delayed = DelayedExperience(environment)
+    for transition_id in range(4):
+        delayed.add(transition_id, transition_id, {"action": transition_id})
+    # Rewards arrive out of order, from other threads
+    credits = [(3, 2, -0.5), (1, 0, 1.0), (0, 2, -0.5), (2, 2, -0.5)]
+    threads = [threading.Timer(0.01 * index, environment.credit, credit)
+               for index, credit in enumerate(credits)]
+    for thread in threads:
+        thread.start()
+    episode = delayed.complete(timeout=5.0)
+    assert episode == {"states": [0, 1], "actions": [{"action": 0}, {"action": 1}],
+                       "terminal": [0, 1], "reward": [-0.5, 1.0]}
+    assert delayed.rewards == {}
+
+
+def test_delayed_episodes_without_met_condition_are_aborted():
+    environment = ListeningEnvironment()
+    delayed = DelayedExperience(environment)
+    for transition_id in range(3):
+        delayed.add(transition_id, transition_id, transition_id)
+    environment.credit(0, 2, -0.5)
+    environment.credit(1, 2, -0.5)
+    episode = delayed.complete(timeout=0.05)
+    assert episode["terminal"] == [0, 2]
+    assert episode["reward"] == [-0.5, -0.5]
+
+
+def test_completed_rewards_do_not_pile_up_while_executing():
+    pytest.importorskip("tensorforce")
+    from src.EnvironmentFactory import EnvironmentFactory
+    from src.SimulatedBackend import SimulatedBackend
+    pipeline = RewardPipeline(max_pending=4, timeout=5.0)
+    environment = EnvironmentFactory.create(specs_path, "T1486", runner=SimulatedBackend(0),
+                                            reward_pipeline=pipeline)
+    environment.reset()
+    for _ in range(200):
+        environment.execute({"file_end": 0, "wait_time": 0})
+    assert len(pipeline.completed) <= 4
+    pipeline.drain(5.0)
+    pipeline.close()
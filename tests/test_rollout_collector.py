@@ -0,0 +1,24 @@
+import pytest
+
+pytest.importorskip("tensorforce")
+
+from src.RolloutCollector import RolloutCollector
+
+
+def test_idle_waits_sleep_after_bounded_yields(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(RolloutCollector, "yields", 10)
+    monkeypatch.setattr("time.sleep", lambda seconds: sleeps.append(seconds))
+    calls = iter(range(100))
+    RolloutCollector.wait(lambda: next(calls) == 99, spins=5)
+    assert sleeps == [RolloutCollector.sleep] * (99 - 5 - 10 + 1)
+
+
+def test_checks_run_while_sleeping(monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+
+    def check():
+        raise RuntimeError("worker terminated")
+
+    with pytest.raises(RuntimeError):
+        RolloutCollector.wait(lambda: False, spins=0, check=check)
@@ -0,0 +1,56 @@
+from src.RunJournal import RunJournal
+import types
+
+
+def create_plan(guids):
+    return types.SimpleNamespace(entries=[{"guid": guid} for guid in guids])
+
+
+def record(journal, guid, executed=True):
+    result = {"guid": guid, "executed": executed, "success": executed, "exit_code": 0,
+              "duration": 0.1}
+    journal.record({"technique": "T1000"}, result)
+
+
+def run(filename, plan, guids, resumed=False):
+    journal = RunJournal(str(filename))
+    journal.start(plan, resumed=resumed)
+    for guid in guids:
+        record(journal, guid)
+    journal.close()
+
+
+def test_resume_replays_only_the_last_run(tmp_path):
+    filename = tmp_path / "journal"
+    run(filename, create_plan(["a", "b"]), ["a", "b"])
+    plan = create_plan(["c", "d"])
+    run(filename, plan, ["c"])
+    replayed = RunJournal.replay(str(filename))
+    assert replayed["plan"] == RunJournal.create_plan_digest(plan)
+    assert sorted(replayed["records"]) == ["c"]
+    run(filename, plan, ["d"], resumed=True)
+    assert sorted(RunJournal.replay(str(filename))["records"]) == ["c", "d"]
+
+
+def test_skips_do_not_replace_executed_records(tmp_path):
+    filename = tmp_path / "journal"
+    journal = RunJournal(str(filename))
+    journal.start(create_plan(["a"]))
+    record(journal, "a")
+    record(journal, "a", executed=False)
+    journal.close()
+    assert RunJournal.replay(str(filename))["records"]["a"]["x"] is True
+
+
+def test_partially_written_records_are_ignored(tmp_path):
+    filename = tmp_path / "journal"
+    run(filename, create_plan(["a", "b"]), ["a"])
+    with open(filename, "ab") as journal_file:
+        journal_file.write(b'{"g":"b","x":tr')
+    assert sorted(RunJournal.replay(str(filename))["records"]) == ["a"]
+    run(filename, create_plan(["a", "b"]), ["b"], resumed=True)
+    assert sorted(RunJournal.replay(str(filename))["records"]) == ["a", "b"]
+
+
+def test_missing_journals_replay_nothing(tmp_path):
+    assert RunJournal.replay(str(tmp_path / "missing")) == {"plan": None, "records": {}}
@@ -0,0 +1,57 @@
+from src.SelectionEngine import SelectionEngine
+import pytest
+
+
+def atomic(guid="a" * 8 + "-aaaa-aaaa-aaaa-" + "a" * 12, platform="linux", executor="sh"):
+    return {"auto_generated_guid": guid, "supported_platforms": [platform],
+            "executor": {"name": executor}}
+
+
+@pytest.mark.parametrize("token, rule", [
+    ("T1059.001", ("technique", "T1059.001")),
+    ("T1059.*", ("prefix", "T1059.")),
+    ("technique:T10*", ("prefix", "T10")),
+    ("platform:Windows", ("platform", "windows")),
+    ("tactic:Defense Evasion", ("tactic", "defense-evasion")),
+    ("0A1B2C3D-aaaa-bbbb-cccc-0123456789ab", ("guid", "0a1b2c3d-aaaa-bbbb-cccc-0123456789ab"))
+])
+def test_rules_are_parsed(token, rule):
+    assert SelectionEngine.parse_rule(token) == rule
+
+
+@pytest.mark.parametrize("token", ["color:red", "not a rule"])
+def test_invalid_rules_are_rejected(token):
+    with pytest.raises(ValueError):
+        SelectionEngine.parse_rule(token)
+
+
+def test_excludes_win_and_the_earliest_include_decides():
+    selection = SelectionEngine({"T1059.001": {"execution"}})
+    selection.add_all("include", "tactic:execution,T1059.*")
+    selection.add("exclude", "executor:powershell")
+    assert selection.evaluate("T1059.001", atomic()) == (True, "include tactic:execution")
+    assert selection.evaluate("T1059.004", atomic()) == (True, "include T1059.*")
+    assert selection.evaluate("T1059.001", atomic(executor="PowerShell")) == \
+        (False, "exclude executor:powershell")
+    assert selection.evaluate("T1003", atomic()) == (False, "not included by any rule")
+
+
+def test_techniques_are_only_dropped_by_technique_rules():
+    selection = SelectionEngine()
+    selection.add("include", "platform:windows")
+    selection.add("exclude", "T1003")
+    entry = {"guids": ["g"], "platforms": ["linux", "windows"], "executors": ["sh"]}
+    assert selection.could_select("T1001", entry)
+    assert not selection.could_select("T1001", dict(entry, platforms=["linux"]))
+    assert not selection.could_select("T1003", entry)
+
+
+def test_tactics_are_loaded_with_and_without_header(tmp_path):
+    with_header = tmp_path / "with_header.csv"
+    with_header.write_text("Technique,Tactic\nT1001,Command and Control\nT1001,Exfiltration\n")
+    without_header = tmp_path / "without_header.csv"
+    without_header.write_text("Defense Evasion;Execution,T1059\n")
+    assert SelectionEngine.load_tactics_from_csv(str(with_header)) == \
+        {"T1001": {"command-and-control", "exfiltration"}}
+    assert SelectionEngine.load_tactics_from_csv(str(without_header)) == \
+        {"T1059": {"defense-evasion", "execution"}}
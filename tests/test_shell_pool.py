@@ -0,0 +1,25 @@
+from src.ShellPool import ShellPool
+import os
+import pytest
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="requires sh")
+
+
+def test_commands_flooding_output_time_out():
+    pool = ShellPool(size=1, timeout=0.5, max_output_bytes=1 << 40, buffer_lines=10)
+    try:
+        result = pool.run("yes", "sh")
+        assert result.timed_out
+        assert result.duration < 5.0
+        assert pool.run("echo done", "sh").stdout == "done\n"
+    finally:
+        pool.close()
+
+
+def test_worker_state_is_isolated_between_commands():
+    pool = ShellPool(size=1, timeout=5.0)
+    try:
+        assert pool.run("cd /; FOO=bar; echo $FOO", "sh").stdout == "bar\n"
+        assert pool.run("echo \"$FOO\"; pwd", "sh").stdout == "\n" + os.getcwd() + "\n"
+    finally:
+        pool.close()
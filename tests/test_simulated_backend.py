@@ -0,0 +1,66 @@
+from src.SimulatedBackend import SimulatedBackend, RecordingBackend, ConditionModel
+import json
+import os
+import pytest
+
+
+specs_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          "atomic_envs")
+
+
+def pass_rate(backend, command, runs=2000):
+    passed = 0
+    for _ in range(runs):
+        backend.run(command, "bash")
+        passed += backend.passes("/specs/test_files_encrypt.py", command, 0)
+    return passed / runs
+
+
+def test_check_scripts_pass_depending_on_the_command():
+    backend = SimulatedBackend(0)
+    rates = {command: pass_rate(backend, command)
+             for command in ["encrypt_new_file enc", "encrypt_new_file gg"]}
+    model = ConditionModel()
+    for command, rate in rates.items():
+        assert rate == pytest.approx(model.probability("test_files_encrypt.py", command),
+                                     abs=0.05)
+    assert len(set(rates.values())) == 2
+
+
+def test_check_scripts_fail_after_failed_commands():
+    backend = SimulatedBackend(0, success_probability=0.0,
+                               condition_model=ConditionModel({"cmd": 1.0}))
+    assert pass_rate(backend, "cmd", runs=50) == 0.0
+
+
+def test_recorded_check_outcomes_are_replayed(tmp_path):
+    filename = str(tmp_path / "outcomes.jsonl")
+    inner = SimulatedBackend(0, condition_model=ConditionModel({"a": 1.0, "b": 0.0}))
+    recording = RecordingBackend(inner, filename)
+    for command in ["a", "b", "a"]:
+        recording.run(command, "sh")
+        recording.passes("/elsewhere/check.py", command, 5)
+    recording.close()
+    with open(filename) as outcomes_file:
+        records = [json.loads(line) for line in outcomes_file]
+    assert {"script": "check.py", "command": "b", "waited": 5, "passed": False} in records
+    outcomes = SimulatedBackend.load_outcomes(filename)
+    replaying = SimulatedBackend(1, outcomes, condition_model=ConditionModel({"a": 0.0}))
+    assert replaying.passes("/specs/check.py", "a", 0) is True
+    assert replaying.passes("/specs/check.py", "b", 0) is False
+
+
+def test_simulated_rewards_depend_on_the_action():
+    pytest.importorskip("tensorforce")
+    from src.EnvironmentFactory import EnvironmentFactory
+    environment = EnvironmentFactory.create(specs_path, "T1486",
+                                            runner=SimulatedBackend(0))
+    rewards = {}
+    for step in range(2000):
+        environment.reset()
+        action = step % 2
+        _, _, reward = environment.execute({"file_end": action, "wait_time": 0})
+        rewards.setdefault(action, []).append(reward)
+    environment.close()
+    means = [sum(values) / len(values) for values in rewards.values()]
+    assert abs(means[0] - means[1]) > 0.2
@@ -0,0 +1,47 @@
+import json
+import os
+import pytest
+import subprocess
+import sys
+
+
+repository_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules of the framework missing from some checkouts, entry points
+# importing them cannot be checked there
+known_missing_modules = ["src.Event", "src.Logger"]
+
+
+def import_in_fresh_interpreter(module, deferred_modules):
+    code = "\n".join([
+        "import json, sys",
+        "try:",
+        "    import " + module,
+        "except ModuleNotFoundError as e:",
+        "    print(json.dumps({'missing': e.name}))",
+        "    sys.exit(0)",
+        "print(json.dumps({'loaded': [name for name in " + repr(deferred_modules) +
+        " if name in sys.modules]}))"
+    ])
+    process = subprocess.run([sys.executable, "-c", code], cwd=repository_path,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             universal_newlines=True, timeout=60)
+    assert process.returncode == 0, process.stderr
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+@pytest.fixture
+def framework_benchmarks(recorded_events):
+    from benchmarks.FrameworkBenchmarks import FrameworkBenchmarks
+    return FrameworkBenchmarks
+
+
+@pytest.mark.parametrize("name", ["atomic_test", "atomic_environments"])
+def test_entry_points_defer_heavy_imports(framework_benchmarks, name):
+    module = framework_benchmarks.entry_points[name]
+    imported = import_in_fresh_interpreter(module, framework_benchmarks.deferred_modules)
+    if "missing" in imported:
+        if imported["missing"] not in known_missing_modules:
+            pytest.fail(module + " cannot be imported, " + imported["missing"] + " is missing")
+        pytest.skip(module + " needs " + imported["missing"] + ", which is not in this tree")
+    assert imported["loaded"] == []
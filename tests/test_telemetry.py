@@ -0,0 +1,61 @@
+from src.Telemetry import Telemetry, JsonlSink
+import threading
+import time
+
+
+class BlockingSink(object):
+
+    def __init__(self):
+        self.released = threading.Event()
+        self.batches = []
+
+    def write(self, events):
+        self.released.wait(5.0)
+        self.batches.append(events)
+
+    def close(self):
+        return
+
+
+def test_slow_sinks_do_not_stall_emitting_threads():
+    sink = BlockingSink()
+    telemetry = Telemetry([sink], batch_size=2, max_buffered=4)
+    start = time.monotonic()
+    for index in range(20):
+        with telemetry.context(guid=str(index)), telemetry.span("command"):
+            telemetry.count("atomic.executed")
+    assert time.monotonic() - start < 1.0
+    sink.released.set()
+    telemetry.close()
+    events = [event for batch in sink.batches for event in batch]
+    spans = [event for event in events if event["type"] == "span"]
+    dropped = [event["value"] for event in events if event["name"] == "telemetry.dropped"]
+    assert len(spans) + sum(dropped) == 20
+    assert sum(dropped) > 0
+    assert sum(event["value"] for event in events if event["name"] == "atomic.executed") == 20
+
+
+def test_events_are_flushed_in_the_background(tmp_path):
+    filename = str(tmp_path / "telemetry.jsonl")
+    telemetry = Telemetry([JsonlSink(filename)], flush_interval=0.05)
+    with telemetry.context(technique="T1001", guid="a"), telemetry.span("atomic"):
+        with telemetry.span("command"):
+            pass
+    deadline = time.monotonic() + 5.0
+    while time.monotonic() < deadline and not open(filename).read():
+        time.sleep(0.01)
+    assert open(filename).read().count("\n") == 2
+    telemetry.close()
+    summary = Telemetry.summarize(filename)
+    assert [atomic["guid"] for atomic in summary] == ["a"]
+    assert "command" in summary[0]
+
+
+def test_telemetry_without_sinks_is_disabled():
+    telemetry = Telemetry()
+    with telemetry.span("command") as span:
+        span.set(exit_code=0)
+    telemetry.count("atomic.executed")
+    assert telemetry.buffer == [] and telemetry.counters == {}
+    assert telemetry.flusher is None
+    telemetry.close()
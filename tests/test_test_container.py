@@ -0,0 +1,85 @@
+from src.TestContainer import TestContainer as Container
+import json
+import os
+import pytest
+
+
+def write_technique(path, technique_id, guids, name=None):
+    os.makedirs(path, exist_ok=True)
+    atomics = "".join(
+        "- name: atomic " + guid + "\n"
+        "  auto_generated_guid: " + guid + "\n"
+        "  supported_platforms: [linux]\n"
+        "  executor:\n"
+        "    name: sh\n"
+        "    command: echo " + guid + "\n" for guid in guids)
+    filename = os.path.join(path, (name or technique_id) + ".yaml")
+    with open(filename, "w") as f:
+        f.write("attack_technique: " + technique_id + "\natomic_tests:\n" + atomics)
+    return filename
+
+
+@pytest.fixture
+def tests_path(tmp_path):
+    write_technique(str(tmp_path / "official" / "T1001"), "T1001", ["a", "b"])
+    write_technique(str(tmp_path / "official" / "T1002"), "T1002", ["c"])
+    write_technique(str(tmp_path / "custom"), "T1001", ["d"])
+    return tmp_path
+
+
+def create_container(tests_path):
+    return Container(str(tests_path / "official"), str(tests_path / "custom"),
+                         str(tests_path / "excluded.csv"),
+                         index_file=str(tests_path / "index.json"))
+
+
+def guids(technique):
+    return [atomic["auto_generated_guid"] for atomic in technique["atomic_tests"]]
+
+
+def test_custom_atomics_are_merged_after_official_ones(tests_path):
+    container = create_container(tests_path)
+    assert container.get_technique_ids() == ["T1001", "T1002"]
+    assert guids(container.get_technique("T1001")) == ["a", "b", "d"]
+    assert container.get_technique("T9999") is None
+
+
+def test_unchanged_files_are_not_parsed_again(tests_path, monkeypatch):
+    create_container(tests_path)
+    monkeypatch.setattr(Container, "create_index_entry", staticmethod(
+        lambda filename: pytest.fail("parsed " + filename)))
+    container = create_container(tests_path)
+    assert sorted(container.technique_files) == ["T1001", "T1002"]
+
+
+def test_changed_and_removed_files_invalidate_the_index(tests_path):
+    container = create_container(tests_path)
+    assert guids(container.get_technique("T1001")) == ["a", "b", "d"]
+    filename = write_technique(str(tests_path / "official" / "T1002"), "T1002",
+                               ["c", "e"])
+    os.utime(filename, ns=(1, 1))
+    os.remove(str(tests_path / "custom" / "T1001.yaml"))
+    container.update_index()
+    assert guids(container.get_technique("T1001")) == ["a", "b"]
+    assert guids(container.get_technique("T1002")) == ["c", "e"]
+    with open(str(tests_path / "index.json")) as f:
+        assert len(json.load(f)["files"]) == 2
+
+
+def test_indexes_of_other_versions_are_rebuilt(tests_path):
+    with open(str(tests_path / "index.json"), "w") as f:
+        json.dump({"version": Container.index_version - 1, "files": {}}, f)
+    container = create_container(tests_path)
+    assert container.get_technique_ids() == ["T1001", "T1002"]
+
+
+def test_index_failures_are_returned_to_the_caller(tests_path):
+    assert create_container(tests_path).index_status == ("Saved test index", False)
+    assert create_container(tests_path).index_status == ("Test index is up to date", False)
+    container = Container(str(tests_path / "official"), str(tests_path / "custom"),
+                          str(tests_path / "excluded.csv"),
+                          index_file=str(tests_path / "missing" / "index.json"))
+    message, is_error = container.index_status
+    assert is_error
+    assert message.startswith("Saving the test index went wrong")
+    assert container.get_technique_ids() == ["T1001", "T1002"]
@@ -0,0 +1,86 @@
+import importlib.util
+import numpy as np
+import pytest
+
+if importlib.util.find_spec("tensorforce") is None:
+    pytest.skip("tensorforce is not installed", allow_module_level=True)
+
+from src.VectorizedEnvironment import VectorizedEnvironment
+from tensorforce.environments import Environment
+
+
+class CountdownEnvironment(Environment):
+
+    def __init__(self, length=3):
+        # Counts down from length, the reward is the action taken
+        super().__init__()
+        self.length = length
+        self.remaining = length
+
+    def states(self):
+        return dict(type="float", shape=(1,))
+
+    def actions(self):
+        return dict(type="int", num_values=3)
+
+    def reset(self):
+        self.remaining = self.length
+        return np.array([self.remaining], dtype=np.float32)
+
+    def execute(self, actions):
+        self.remaining -= 1
+        return np.array([self.remaining], dtype=np.float32), self.remaining == 0, float(actions)
+
+
+@pytest.fixture(params=["local", "multiprocessing"])
+def create_environment(request):
+    environments = []
+
+    def create(**kwargs):
+        environment = VectorizedEnvironment(CountdownEnvironment, 3, backend=request.param,
+                                            **kwargs)
+        environments.append(environment)
+        return environment
+    yield create
+    for environment in environments:
+        environment.close()
+
+
+def test_states_terminals_and_rewards_are_stacked(create_environment):
+    environment = create_environment(length=3)
+    assert environment.states() == dict(type="float", shape=(1,))
+    assert environment.actions() == dict(type="int", num_values=3)
+    assert environment.reset().tolist() == [[3.0], [3.0], [3.0]]
+    states, terminals, rewards = environment.execute(np.array([0, 1, 2]))
+    assert states.tolist() == [[2.0], [2.0], [2.0]]
+    assert terminals.tolist() == [0, 0, 0]
+    assert rewards.tolist() == [0.0, 1.0, 2.0]
+    assert rewards.dtype == np.float32
+
+
+@pytest.mark.parametrize("auto_reset, final_states", [(True, [3.0]), (False, [0.0])])
+def test_terminated_instances_are_reset_automatically(create_environment, auto_reset,
+                                                      final_states):
+    environment = create_environment(length=3, auto_reset=auto_reset)
+    environment.reset()
+    for _ in range(2):
+        environment.execute(np.zeros(3, dtype=np.int64))
+    states, terminals, _ = environment.execute(np.zeros(3, dtype=np.int64))
+    assert terminals.tolist() == [1, 1, 1]
+    assert states.tolist() == [final_states] * 3
+
+
+def test_episodes_exceeding_the_maximum_length_are_aborted(create_environment):
+    environment = create_environment(length=10, max_episode_timesteps=2)
+    environment.reset()
+    _, terminals, _ = environment.execute(np.zeros(3, dtype=np.int64))
+    assert terminals.tolist() == [0, 0, 0]
+    states, terminals, _ = environment.execute(np.zeros(3, dtype=np.int64))
+    assert terminals.tolist() == [2, 2, 2]
+    assert states.tolist() == [[10.0], [10.0], [10.0]]
+    assert environment.timesteps.tolist() == [0, 0, 0]
+
+
+def test_unknown_backends_are_rejected():
+    with pytest.raises(ValueError, match="Unknown backend"):
+        VectorizedEnvironment(CountdownEnvironment, 2, backend="threads")